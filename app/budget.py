@@ -0,0 +1,104 @@
+""" Adaptive time budget : instead of one fixed 'time' value, the solve is
+first sent with a short time budget, then sent again with a budget
+multiplied by factor after each timeout-style failure, until the cap
+
+The budget that has solved a grid is remembered by image digest (see
+cache.image_digest), so that solving again the same grid starts at once
+with this budget (easy grids : short budget, no server time reserved in
+vain ; hard grids : no timeouts replayed).
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import json
+import logging
+import threading
+
+Logger = logging.getLogger('kivy') # kivy Logger (without importing kivy)
+
+BUDGET_FILENAME = ".budget.json" # difficulty memory, into images folder
+TIME_START = 2 # seconds, first budget of an unknown grid
+TIME_FACTOR = 2 # budget multiplied after a timeout
+TIME_MAX = 60 # seconds, default cap
+MAX_ENTRIES = 1000 # grids remembered (oldest forgotten beyond)
+TIMEOUT_WORDS = ("timeout", "time out", "time limit")
+
+def is_timeout(error_txt):
+    """Returns True if error_txt (see response.classify) is a timeout-style
+    failure"""
+
+    text = (error_txt or "").lower()
+    return any(word in text for word in TIMEOUT_WORDS)
+
+def budgets(start=TIME_START, cap=TIME_MAX, factor=TIME_FACTOR):
+    """Returns the list of the successive budgets : start, start*factor...
+    until cap (included)"""
+
+    cap = max(1, int(cap))
+    budget = max(1, min(int(start), cap))
+    values = [budget]
+    while budget < cap :
+        budget = min(cap, max(budget + 1, int(round(budget * factor))))
+        values.append(budget)
+    return values
+
+class BudgetMemory(object):
+    """Budgets that have solved the grids, by image digest, saved as the
+    JSON file path (written at each change, loaded at first use)"""
+
+    def __init__(self, path, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._budgets = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._budgets is None :
+            try :
+                with open(self.path, 'rt') as f :
+                    self._budgets = dict(json.load(f))
+            except (OSError, ValueError, TypeError) :
+                self._budgets = dict()
+        return self._budgets
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        try :
+            with open(tmp_path, 'wt') as f :
+                json.dump(self._budgets, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except OSError as e :
+            Logger.warning("Budget : [save] : %s" % (e))
+
+    def get(self, digest, default=TIME_START):
+        with self._lock :
+            return self._load().get(digest, default)
+
+    def put(self, digest, budget):
+        with self._lock :
+            remembered = self._load()
+            remembered.pop(digest, None) # (most recent last)
+            remembered[digest] = budget
+            while len(remembered) > self.max_entries :
+                del remembered[next(iter(remembered))]
+            self._save()
+
+    def solve(self, digest, solve, start=TIME_START, cap=TIME_MAX,
+              factor=TIME_FACTOR):
+        """Calls solve(time) (returning (cr_ok, error_txt)) with the
+        successive budgets, from the one remembered for digest (else start),
+        while the failure is a timeout. Returns the last (cr_ok, error_txt).
+        """
+
+        for budget in budgets(self.get(digest, start), cap, factor) :
+            (cr_ok, error_txt) = solve(budget)
+            if cr_ok or not is_timeout(error_txt) :
+                break
+            Logger.info("Budget : [solve] : timeout with time %d" % (budget))
+        if cr_ok or is_timeout(error_txt) : # (cap reached : cap remembered)
+            self.put(digest, budget)
+        Logger.info("Budget : [solve] : time %d, cr_ok %s" % (budget, cr_ok))
+        return (cr_ok, error_txt)
@@ -15,7 +15,7 @@ package.domain = fr.inrae
 source.dir = .
 
 # (list) Source files to include (let empty to include all the files)
-source.include_exts = py,png,jpg,kv,atlas
+source.include_exts = py,png,jpg,kv,atlas,npz
 #source.include_exts = py,png,jpg,kv
 #modified
 
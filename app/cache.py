@@ -0,0 +1,111 @@
+""" Solution cache : solution image files indexed by grid image and parameters
+
+The key of a solution is made of the digest of the grid image bytes and of
+the keep, border, time values. Least recently used solutions are evicted
+once the cache size exceeds its maximum size.
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import hashlib
+import logging
+import shutil
+import threading
+
+Logger = logging.getLogger('kivy') # kivy Logger (without importing kivy)
+
+CACHE_DIRNAME = ".cache" # cache folder name, into images folder
+CACHE_MAX_BYTES = 50*1024*1024 # default cache maximal size (bytes)
+
+def image_digest(image):
+    """Returns the digest (hex) of image (file path or bytes)"""
+
+    h = hashlib.sha256()
+    if isinstance(image, (bytes, bytearray)) :
+        h.update(image)
+    else :
+        with open(image, 'rb') as f :
+            for block in iter(lambda: f.read(1024*1024), b'') :
+                h.update(block)
+    return h.hexdigest()
+
+def cache_key(digest, keep=None, border=None, time=None):
+    """Returns the cache key of a solve"""
+
+    return "{}_k{}_b{}_t{}".format(digest, keep, border, time)
+
+class SolutionCache(object):
+    """Solution files stored as <key><extension> into dirpath folder
+
+    The extension is the one of the solution file (.jpg for solution image,
+    .txt for solution digits).
+    File modification time is used as last use time (LRU eviction).
+    """
+
+    def __init__(self, dirpath, max_bytes=CACHE_MAX_BYTES):
+        self.dirpath = dirpath
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def path(self, key, extension=".jpg"):
+        return os.path.join(self.dirpath, key + extension)
+
+    def get(self, key, output):
+        """Copies the solution of key as output file, if into cache
+
+        Returns True if hit, False if miss.
+        """
+
+        path = self.path(key, os.path.splitext(output)[1])
+        try :
+            shutil.copyfile(path, output)
+            os.utime(path) # last use
+            hit = True
+        except OSError :
+            hit = False
+        with self._lock :
+            if hit :
+                self.hits += 1
+            else :
+                self.misses += 1
+            Logger.info("Cache : [get] : %s %s (hits %d, misses %d)" %
+                        ("HIT" if hit else "MISS", key, self.hits, self.misses))
+        return hit
+
+    def put(self, key, solution):
+        """Stores solution file as the solution of key"""
+
+        os.makedirs(self.dirpath, exist_ok=True)
+        path = self.path(key, os.path.splitext(solution)[1])
+        tmp_path = path + ".tmp"
+        shutil.copyfile(solution, tmp_path)
+        os.replace(tmp_path, path)
+        Logger.debug("Cache : [put] : %s" % (key))
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used solutions beyond max_bytes"""
+
+        with self._lock :
+            entries = list()
+            total = 0
+            for entry in os.scandir(self.dirpath) :
+                if not entry.name.endswith(".tmp") and entry.is_file() :
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            entries.sort()
+            for (mtime, size, path) in entries :
+                if total <= self.max_bytes :
+                    break
+                try :
+                    os.remove(path)
+                    total -= size
+                    Logger.debug("Cache : [evict] : %s removed" % (path))
+                except OSError :
+                    pass
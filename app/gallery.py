@@ -0,0 +1,290 @@
+""" Images gallery : the image files of the images folder, shown by pages of
+thumbnails (instead of a FileChooser listing the whole folder each time)
+
+    gallery = Gallery(dirpath, on_change)
+    gallery.open() # index loaded, folder scanned into background
+    items = gallery.page(n) # [(filepath, thumbpath or None), ...]
+    gallery.request(n) # thumbnails of page n made into background
+
+The file index (name : modification time, size, newest first) is saved as
+INDEX_FILENAME into the images folder, and updated incrementally : the
+folder is only scanned again when its modification time has changed (files
+added, removed or renamed). Opening the gallery again thus costs the same
+whatever the number of files, the scan and the thumbnails being made into
+a background thread.
+
+The thumbnails are JPEG files of THUMB_SIZE pixels max into the
+THUMBS_DIRNAME folder of the images folder, named from the image name,
+modification time and size (a modified image gets a new thumbnail, the
+unused ones being removed after a scan).
+
+on_change(what) is called (from the background thread) once the index
+(what "index") or the thumbnails of the requested page (what "thumbs") have
+changed.
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import json
+import hashlib
+import logging
+import threading
+
+Logger = logging.getLogger('kivy') # kivy Logger (without importing kivy)
+
+INDEX_FILENAME = ".gallery.json" # file index, into images folder
+THUMBS_DIRNAME = ".thumbs" # thumbnails folder, into images folder
+THUMB_SIZE = 160 # pixels, largest side of the thumbnails
+THUMB_QUALITY = 75
+PAGE_SIZE = 12 # thumbnails per page
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+def is_image(name):
+    return not name.startswith('.') and name.lower().endswith(EXTENSIONS)
+
+def thumb_name(name, mtime, size):
+    """Returns the thumbnail file name of image file name, of mtime and size
+    """
+
+    key = "{}:{}:{}".format(name, mtime, size).encode('utf-8')
+    return hashlib.sha1(key).hexdigest() + ".jpg"
+
+def make_thumb(filepath, thumbpath, size=THUMB_SIZE, quality=THUMB_QUALITY):
+    """Writes the thumbnail of image filepath as thumbpath"""
+
+    from PIL import Image, ImageOps
+    img = Image.open(filepath)
+    if img.format == 'JPEG' : # faster decoding, at reduced size
+        img.draft('RGB', (size, size))
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((size, size))
+    if img.mode != 'RGB' :
+        img = img.convert('RGB')
+    tmp_path = thumbpath + ".tmp"
+    img.save(tmp_path, format='JPEG', quality=quality)
+    os.replace(tmp_path, thumbpath)
+
+class FileIndex(object):
+    """Image files of dirpath folder (see module doc), saved as JSON file
+
+    Only modified by one thread. entries (replaced, never modified) can be
+    read from other threads.
+    """
+
+    def __init__(self, dirpath, filename=INDEX_FILENAME):
+        self.dirpath = dirpath
+        self.path = os.path.join(dirpath, filename)
+        self.dir_mtime = None # folder modification time at last scan
+        self.files = dict() # name : (mtime, size)
+        self.entries = tuple() # (name, mtime, size), newest first
+
+    def load(self):
+        try :
+            with open(self.path, 'rt') as f :
+                data = json.load(f)
+            self.dir_mtime = os.stat(self.path).st_mtime # (see save)
+            self.files = dict((name, tuple(value))
+                              for (name, value) in data["files"].items())
+        except (OSError, ValueError, TypeError, KeyError, AttributeError) :
+            (self.dir_mtime, self.files) = (None, dict())
+        self._sort()
+
+    def save(self):
+        """Saves the index into the folder, that modifies the folder : its
+        modification time after the save is kept as dir_mtime, and as the
+        modification time of the index file (read back by load ; setting it
+        does not modify the folder). If the folder has changed since the
+        scan, dir_mtime is unknown (0) : scanned again at next scan."""
+
+        tmp_path = self.path + ".tmp"
+        try :
+            unchanged = (os.stat(self.dirpath).st_mtime == self.dir_mtime)
+            with open(tmp_path, 'wt') as f :
+                json.dump({"files" : self.files}, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+            self.dir_mtime = os.stat(self.dirpath).st_mtime if unchanged else 0
+            os.utime(self.path, (self.dir_mtime, self.dir_mtime))
+        except OSError as e :
+            Logger.warning("Gallery : [save] : %s" % (e))
+
+    def _sort(self):
+        self.entries = tuple(sorted(((name,) + value for (name, value)
+                                     in self.files.items()),
+                                    key=lambda e: (e[1], e[0]), reverse=True))
+
+    def scan(self):
+        """Updates the index if the folder has changed since the last scan.
+        Returns True if the index has changed."""
+
+        try :
+            dir_mtime = os.stat(self.dirpath).st_mtime
+        except OSError :
+            return False
+        if dir_mtime == self.dir_mtime :
+            return False
+        files = dict()
+        for entry in os.scandir(self.dirpath) :
+            if is_image(entry.name) and entry.is_file() :
+                stat = entry.stat()
+                files[entry.name] = (stat.st_mtime, stat.st_size)
+        changed = (files != self.files)
+        (self.dir_mtime, self.files) = (dir_mtime, files)
+        if changed :
+            self._sort()
+        self.save()
+        return changed
+
+    def update(self, name):
+        """Updates the entry of file name (modified in place : not seen by
+        scan). Returns True if changed."""
+
+        try :
+            stat = os.stat(os.path.join(self.dirpath, name))
+            value = (stat.st_mtime, stat.st_size)
+        except OSError :
+            value = None
+        if value == self.files.get(name) :
+            return False
+        if value is None :
+            self.files.pop(name, None)
+        else :
+            self.files[name] = value
+        self._sort()
+        return True
+
+class Gallery(object):
+    """Pages of the image files of dirpath, with their thumbnails (see module
+    doc)"""
+
+    def __init__(self, dirpath, on_change=None, page_size=PAGE_SIZE,
+                 thumb_size=THUMB_SIZE):
+        self.dirpath = dirpath
+        self.on_change = on_change
+        self.page_size = page_size
+        self.thumb_size = thumb_size
+        self.thumbs_path = os.path.join(dirpath, THUMBS_DIRNAME)
+        self.index = FileIndex(dirpath)
+        self._loaded = False
+        self._scan = False # folder to be scanned
+        self._page = None # page whose thumbnails are to be made
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def open(self):
+        """Folder to be scanned (index loaded at first call), into
+        background"""
+
+        with self._condition :
+            self._scan = True
+            self._condition.notify()
+            if self._thread is None :
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def request(self, n):
+        """Thumbnails of page n to be made, into background (instead of the
+        ones of the page previously requested, if not yet made)"""
+
+        with self._condition :
+            self._page = n
+            self._condition.notify()
+
+    def count(self):
+        return len(self.index.entries)
+
+    def pages(self):
+        return max(1, -(-self.count() // self.page_size))
+
+    def _entries(self, n):
+        return self.index.entries[n*self.page_size:(n+1)*self.page_size]
+
+    def page(self, n):
+        """Returns the list of (filepath, thumbpath) of page n, thumbpath
+        being None if the thumbnail has not been made yet"""
+
+        items = list()
+        for (name, mtime, size) in self._entries(n) :
+            thumbpath = os.path.join(self.thumbs_path,
+                                     thumb_name(name, mtime, size))
+            if not os.path.exists(thumbpath) :
+                thumbpath = None
+            items.append((os.path.join(self.dirpath, name), thumbpath))
+        return items
+
+    def _changed(self, what):
+        if self.on_change is not None :
+            self.on_change(what)
+
+    def _make_thumbs(self, n):
+        """Makes the missing thumbnails of page n. Returns True if any"""
+
+        made = False
+        for (name, mtime, size) in self._entries(n) :
+            with self._condition :
+                if self._scan or self._page is not None : # (more urgent)
+                    break
+            if self.index.update(name) : # (modified in place)
+                self._changed("index")
+                if name not in self.index.files :
+                    continue
+                (mtime, size) = self.index.files[name]
+            thumbpath = os.path.join(self.thumbs_path,
+                                     thumb_name(name, mtime, size))
+            if os.path.exists(thumbpath) :
+                continue
+            try :
+                os.makedirs(self.thumbs_path, exist_ok=True)
+                make_thumb(os.path.join(self.dirpath, name), thumbpath,
+                           self.thumb_size)
+                made = True
+            except Exception as e : # (unreadable image...)
+                Logger.warning("Gallery : [thumb] : %s : %s" % (name, e))
+        return made
+
+    def _prune(self):
+        """Removes the thumbnails of the images no longer indexed"""
+
+        used = set(thumb_name(name, mtime, size)
+                   for (name, mtime, size) in self.index.entries)
+        try :
+            entries = list(os.scandir(self.thumbs_path))
+        except OSError :
+            return
+        for entry in entries :
+            if entry.name not in used :
+                try :
+                    os.remove(entry.path)
+                except OSError :
+                    pass
+
+    def _run(self):
+        while True :
+            with self._condition :
+                while not self._scan and self._page is None :
+                    self._condition.wait()
+                (scan, self._scan) = (self._scan, False)
+                if not scan :
+                    (n, self._page) = (self._page, None)
+            try :
+                if scan :
+                    if not self._loaded :
+                        try : # (before the scan : the folder is modified)
+                            os.makedirs(self.thumbs_path, exist_ok=True)
+                        except OSError :
+                            pass
+                        self.index.load()
+                        self._loaded = True
+                        self._changed("index")
+                    changed = self.index.scan()
+                    Logger.info("Gallery : [scan] : %d images, changed %s" %
+                                (self.count(), changed))
+                    if changed :
+                        self._changed("index")
+                        self._prune()
+                elif self._make_thumbs(n) :
+                    self._changed("thumbs")
+            except Exception as e :
+                Logger.warning("Gallery : [run] : %s" % (e))
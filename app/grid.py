@@ -0,0 +1,111 @@
+""" Grid detection : outer grid quadrilateral, rectified into a square
+
+OpenCV (and numpy) required, else no grid is ever found. They are imported
+at first use (see is_available), not at App start.
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+np = None # numpy and cv2 modules, once imported (see is_available)
+cv2 = None
+_available = None
+
+GRID_SIZE = 900 # side (pixels) of the rectified grid image
+GRID_MARGIN = 0.04 # margin around the rectified grid (ratio of its side)
+DETECTION_SIZE = 640 # maximal side of the image where the grid is searched
+MIN_AREA_RATIO = 0.10 # minimal grid area (ratio of the image area)
+
+def is_available():
+    """Returns True if grid detection available (numpy and OpenCV imported
+    at first call)"""
+
+    global np, cv2, _available
+    if _available is None :
+        try :
+            import numpy
+            import cv2 as opencv
+            (np, cv2) = (numpy, opencv)
+            _available = True
+        except ImportError : # grid detection unavailable
+            _available = False
+    return _available
+
+def order_corners(pts):
+    """Returns the 4 points pts as top-left, top-right, bottom-right,
+    bottom-left"""
+
+    pts = np.asarray(pts, dtype="float32").reshape(4, 2)
+    s = pts.sum(axis=1)
+    d = np.diff(pts, axis=1).ravel() # y - x
+    return np.array([pts[np.argmin(s)], pts[np.argmin(d)],
+                     pts[np.argmax(s)], pts[np.argmax(d)]], dtype="float32")
+
+def find_grid(gray):
+    """Returns the corners (see order_corners) of the outer grid
+    quadrilateral found into gray image (numpy 2D array), or None"""
+
+    if not is_available() :
+        return None
+
+    (h, w) = gray.shape[:2]
+    scale = min(1.0, DETECTION_SIZE / float(max(h, w)))
+    small = gray
+    if scale < 1.0 :
+        small = cv2.resize(gray, (int(w*scale), int(h*scale)),
+                           interpolation=cv2.INTER_AREA)
+
+    blurred = cv2.GaussianBlur(small, (7, 7), 3)
+    thresh = cv2.adaptiveThreshold(blurred, 255,
+                                   cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                   cv2.THRESH_BINARY_INV, 11, 2)
+    contours = cv2.findContours(thresh, cv2.RETR_EXTERNAL,
+                                cv2.CHAIN_APPROX_SIMPLE)[-2]
+    min_area = MIN_AREA_RATIO * small.shape[0] * small.shape[1]
+    for c in sorted(contours, key=cv2.contourArea, reverse=True) :
+        if cv2.contourArea(c) < min_area :
+            break
+        peri = cv2.arcLength(c, True)
+        approx = cv2.approxPolyDP(c, 0.02 * peri, True)
+        if len(approx) == 4 and cv2.isContourConvex(approx) :
+            return order_corners(approx / scale)
+    return None
+
+def corners_side(corners):
+    """Returns the longest side (pixels) of the corners quadrilateral"""
+
+    pts = order_corners(corners)
+    return float(max(np.linalg.norm(pts[i] - pts[(i+1) % 4])
+                     for i in range(4)))
+
+def rectified_size(corners, size=GRID_SIZE, margin=GRID_MARGIN):
+    """Returns the side of the rectified grid image : at most size, without
+    enlarging the grid"""
+
+    return int(min(size, corners_side(corners) / (1.0 - 2*margin)))
+
+def warp_grid(gray, corners, size=GRID_SIZE, margin=GRID_MARGIN):
+    """Returns the grid of corners rectified as a size x size image
+
+    The grid is surrounded by a margin (image around the grid, or white
+    outside the image), so that it can be detected again into the returned
+    image.
+    """
+
+    m = margin * size
+    dst = np.array([[m, m], [size-1-m, m], [size-1-m, size-1-m],
+                    [m, size-1-m]], dtype="float32")
+    matrix = cv2.getPerspectiveTransform(order_corners(corners), dst)
+    return cv2.warpPerspective(gray, matrix, (size, size),
+                               flags=cv2.INTER_LINEAR,
+                               borderMode=cv2.BORDER_CONSTANT,
+                               borderValue=255)
+
+def rectify(gray, size=GRID_SIZE):
+    """Returns the rectified grid of gray image, or None if no grid found"""
+
+    corners = find_grid(gray)
+    if corners is None :
+        return None
+    return warp_grid(gray, corners, rectified_size(corners, size))
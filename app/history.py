@@ -0,0 +1,282 @@
+""" Solve history : one row per solve (image digest, keep/border/time values,
+timings, outcome, grid and solution files) into the SQLite database
+HISTORY_FILENAME of the images folder
+
+    history = SolveHistory(path, max_bytes)
+    history.add(digest=..., keep=..., ..., input=..., output=...)
+    history.recent(20) # last solves, newest first (dict rows)
+    history.digest(filepath) # known digest of an unchanged grid file
+    history.post(history.add, digest=..., ...) # into background thread
+
+The GRD_* and SOL_* files (artifacts) written by the solves are recorded
+with their size : once their total exceeds max_bytes, the least recently
+used ones are removed from the images folder (their solve rows are kept,
+their input / output columns being set to NULL). Other files (default
+GRD.png, solution.jpg, files chosen by the user) are never removed.
+
+The digest of a grid file is remembered with its size and modification
+time, so that solving again the same unchanged file needs no hashing of
+its bytes (see cache.cache_key).
+
+Usable from command line (last solves of an images folder) :
+
+    python3 history.py ../img [-n 20]
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import time
+import sqlite3
+import logging
+import queue
+import threading
+
+Logger = logging.getLogger('kivy') # kivy Logger (without importing kivy)
+
+HISTORY_FILENAME = ".history.db" # solve history, into images folder
+HISTORY_MAX_BYTES = 200*1024*1024 # default artifacts quota (0 : no limit)
+ARTIFACT_PREFIXES = ("GRD_", "SOL_")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS solves (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    t REAL NOT NULL,
+    digest TEXT,
+    keep INTEGER, border INTEGER, time INTEGER,
+    mode TEXT, compact INTEGER, cached INTEGER, speculative INTEGER,
+    ms REAL, upload_ms REAL, server_ms REAL, download_ms REAL,
+    ok INTEGER, error TEXT,
+    input TEXT, output TEXT);
+CREATE INDEX IF NOT EXISTS solves_t ON solves (t);
+CREATE INDEX IF NOT EXISTS solves_digest ON solves (digest, keep, border);
+CREATE INDEX IF NOT EXISTS solves_input ON solves (input);
+CREATE INDEX IF NOT EXISTS solves_output ON solves (output);
+CREATE TABLE IF NOT EXISTS artifacts (
+    path TEXT PRIMARY KEY,
+    bytes INTEGER NOT NULL,
+    t REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS artifacts_t ON artifacts (t);
+CREATE TABLE IF NOT EXISTS digests (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    digest TEXT NOT NULL);
+"""
+
+SOLVE_COLUMNS = ("t", "digest", "keep", "border", "time", "mode", "compact",
+                 "cached", "speculative", "ms", "upload_ms", "server_ms",
+                 "download_ms", "ok", "error", "input", "output")
+
+def is_artifact(path):
+    """Returns True if path is a file written by a solve (to be counted into
+    the quota, and removable)"""
+
+    return bool(path) and os.path.basename(path).startswith(ARTIFACT_PREFIXES)
+
+class SolveHistory(object):
+    """Solve history database path (see module doc), thread safe (connection
+    opened at first use)"""
+
+    def __init__(self, path, max_bytes=HISTORY_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._connection = None
+        self._lock = threading.Lock()
+        self._posted = None # queue of the background thread (see post)
+
+    def _db(self):
+        if self._connection is None :
+            self._connection = sqlite3.connect(self.path,
+                                               check_same_thread=False)
+            self._connection.row_factory = sqlite3.Row
+            # journal file kept (truncated) : the images folder is not
+            # modified by each write (see gallery.py folder scan)
+            self._connection.execute("PRAGMA journal_mode=TRUNCATE")
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def close(self):
+        with self._lock :
+            if self._connection is not None :
+                self._connection.close()
+                self._connection = None
+
+    def post(self, function, *args, **kwargs):
+        """Calls function(*args, **kwargs) (add, add_artifact...) into the
+        background thread of the history, the posted calls being run one
+        after the other : the database writes and the files evictions are
+        kept out of the calling thread (App main thread)"""
+
+        with self._lock :
+            if self._posted is None :
+                self._posted = queue.Queue()
+                threading.Thread(target=self._run, daemon=True).start()
+        self._posted.put((function, args, kwargs))
+
+    def _run(self):
+        while True :
+            (function, args, kwargs) = self._posted.get()
+            try :
+                function(*args, **kwargs)
+            except Exception as e :
+                Logger.warning("History : [%s] : %s" % (function.__name__, e))
+
+    #--------------------------------------------------------------------------
+    # digests
+
+    def digest(self, filepath):
+        """Returns the digest remembered for filepath if the file has not
+        changed since (same size and modification time), else None"""
+
+        try :
+            stat = os.stat(filepath)
+        except OSError :
+            return None
+        with self._lock :
+            row = self._db().execute(
+                    "SELECT digest FROM digests WHERE path=? AND mtime=? "
+                    "AND size=?", (filepath, stat.st_mtime, stat.st_size)
+                    ).fetchone()
+        return row["digest"] if row is not None else None
+
+    def put_digest(self, filepath, digest):
+        try :
+            stat = os.stat(filepath)
+        except OSError :
+            return
+        with self._lock, self._db() as db :
+            db.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)",
+                       (filepath, stat.st_mtime, stat.st_size, digest))
+
+    #--------------------------------------------------------------------------
+    # solves and artifacts
+
+    def add(self, **fields):
+        """Records a solve (fields : see SOLVE_COLUMNS, t default now),
+        and its artifacts (input, output). Returns the solve id."""
+
+        fields.setdefault("t", time.time())
+        values = tuple(fields.get(column) for column in SOLVE_COLUMNS)
+        with self._lock :
+            with self._db() as db :
+                cursor = db.execute("INSERT INTO solves (%s) VALUES (%s)" %
+                                    (",".join(SOLVE_COLUMNS),
+                                     ",".join("?" * len(SOLVE_COLUMNS))),
+                                    values)
+                paths = (fields.get("input"), fields.get("output"))
+                for path in paths :
+                    self._add_artifact(db, path, fields["t"])
+            self._evict(paths)
+        return cursor.lastrowid
+
+    def add_artifact(self, path):
+        """Records path file written after its solve (see add)"""
+
+        with self._lock :
+            with self._db() as db :
+                self._add_artifact(db, path, time.time())
+            self._evict((path,))
+
+    def _add_artifact(self, db, path, t):
+        if not is_artifact(path) :
+            return
+        try :
+            size = os.path.getsize(path)
+        except OSError :
+            return
+        db.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?)",
+                   (path, size, t))
+
+    def total_bytes(self):
+        with self._lock :
+            row = self._db().execute(
+                        "SELECT COALESCE(SUM(bytes), 0) FROM artifacts"
+                        ).fetchone()
+        return row[0]
+
+    def _evict(self, kept=()):
+        """Removes the least recently used artifacts beyond max_bytes (except
+        the kept paths, those of the solve just recorded)"""
+
+        if self.max_bytes <= 0 :
+            return
+        db = self._db()
+        total = db.execute("SELECT COALESCE(SUM(bytes), 0) FROM artifacts"
+                           ).fetchone()[0]
+        if total <= self.max_bytes :
+            return
+        removed = list()
+        for row in db.execute("SELECT path, bytes FROM artifacts "
+                              "ORDER BY t").fetchall() :
+            if total <= self.max_bytes :
+                break
+            if row["path"] in kept :
+                continue
+            try :
+                os.remove(row["path"])
+            except FileNotFoundError :
+                pass
+            except OSError as e :
+                Logger.warning("History : [evict] : %s" % (e))
+                continue
+            removed.append((row["path"],))
+            total -= row["bytes"]
+        with db :
+            db.executemany("DELETE FROM artifacts WHERE path=?", removed)
+            db.executemany("DELETE FROM digests WHERE path=?", removed)
+            db.executemany("UPDATE solves SET input=NULL WHERE input=?",
+                           removed)
+            db.executemany("UPDATE solves SET output=NULL WHERE output=?",
+                           removed)
+        Logger.info("History : [evict] : %d files removed, %d kB kept" %
+                    (len(removed), total//1024))
+
+    #--------------------------------------------------------------------------
+    # queries
+
+    def count(self):
+        with self._lock :
+            return self._db().execute("SELECT COUNT(*) FROM solves"
+                                      ).fetchone()[0]
+
+    def recent(self, limit=20, offset=0):
+        """Returns the solves (dict rows) from the newest one"""
+
+        with self._lock :
+            rows = self._db().execute(
+                "SELECT * FROM solves ORDER BY t DESC LIMIT ? OFFSET ?",
+                (limit, offset)).fetchall()
+        return [dict(row) for row in rows]
+
+    def solves_of(self, digest):
+        """Returns the solves (dict rows) of the grid image digest, newest
+        first"""
+
+        with self._lock :
+            rows = self._db().execute(
+                "SELECT * FROM solves WHERE digest=? ORDER BY t DESC",
+                (digest,)).fetchall()
+        return [dict(row) for row in rows]
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Solve history")
+    parser.add_argument("imagepath", help="images folder")
+    parser.add_argument("-n", type=int, default=20, help="number of solves")
+    a = parser.parse_args()
+
+    history = SolveHistory(os.path.join(a.imagepath, HISTORY_FILENAME), 0)
+    print("%d solves, %d kB of GRD_/SOL_ files" % (history.count(),
+                                                  history.total_bytes()//1024))
+    for row in history.recent(a.n) :
+        print("%s  %-5s k%s b%s t%-3s %8.0f ms  %s  %s" % (
+              time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["t"])),
+              "OK" if row["ok"] else "ERROR", row["keep"], row["border"],
+              row["time"], row["ms"] or 0,
+              os.path.basename(row["output"] or "-"), row["error"] or ""))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+""" Live camera mode : the grid is searched into low resolution camera
+frames, and a solve is fired once a grid has been found into STABLE_FRAMES
+successive frames with (almost) the same content
+
+    detector = LiveDetector(on_stable)
+    detector.start()
+    detector.submit(gray) # for each sampled frame (numpy 2D array)
+    ...
+    detector.stop()
+
+The frames are processed into a background thread (grid detection, see
+grid.py, and difference hash). Only the latest submitted frame waits for
+processing : a frame still waiting when the next one is submitted is
+dropped (counted into stats).
+
+Once stable, on_stable() is called (from the background thread) and the
+detector is paused until resume() : one solve at a time. A new solve
+can only be fired after the scene has changed (see StabilityGate).
+
+OpenCV (and numpy) required (see is_available, to be called first).
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import time
+import threading
+import collections
+import logging
+
+import grid
+
+Logger = logging.getLogger('kivy') # kivy Logger (without importing kivy)
+
+LIVE_SIZE = 320 # pixels, largest side of the sampled frames
+LIVE_INTERVAL = 0.1 # seconds between two sampled frames
+STABLE_FRAMES = 5 # successive frames with a stable grid before solving
+HASH_SIZE = 8 # difference hash of HASH_SIZE*HASH_SIZE bits
+HASH_DISTANCE = 6 # maximal differing bits between two stable frames
+FPS_WINDOW = 2.0 # seconds, frames per second computed over this window
+
+def is_available():
+    return grid.is_available()
+
+def frame_gray(pixels, size):
+    """Returns the grayscale numpy image of RGBA pixels (bytes) of size
+    (width, height)"""
+
+    (np, cv2) = (grid.np, grid.cv2)
+    (w, h) = size
+    rgba = np.frombuffer(pixels, dtype=np.uint8).reshape(h, w, 4)
+    return cv2.cvtColor(rgba, cv2.COLOR_RGBA2GRAY)
+
+def dhash(gray, size=HASH_SIZE):
+    """Returns the difference hash (int of size*size bits) of gray image :
+    brightness increasing or not between horizontal neighbours of the image
+    reduced to (size+1) x size"""
+
+    (np, cv2) = (grid.np, grid.cv2)
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def hash_distance(h1, h2):
+    """Returns the number of bits differing between hashes h1 and h2"""
+
+    return bin(h1 ^ h2).count("1")
+
+class StabilityGate(object):
+    """Counts the successive frames where a grid is found and whose hash is
+    close to the previous frame one
+
+    update() returns True once count reaches frames. The gate is then
+    disarmed until a frame far from the fired one (or without grid) : the
+    same still scene does not fire twice.
+    """
+
+    def __init__(self, frames=STABLE_FRAMES, distance=HASH_DISTANCE):
+        self.frames = frames
+        self.distance = distance
+        self.count = 0
+        self._last = None
+        self._fired = None
+
+    def reset(self):
+        self.count = 0
+        self._last = None
+        self._fired = None
+
+    def update(self, found, frame_hash):
+        if not found :
+            (self.count, self._last, self._fired) = (0, None, None)
+            return False
+        if self._fired is not None :
+            if hash_distance(frame_hash, self._fired) <= self.distance :
+                return False # same scene as the one already fired
+            self._fired = None
+        if self._last is not None and \
+           hash_distance(frame_hash, self._last) <= self.distance :
+            self.count += 1
+        else :
+            self.count = 1
+        self._last = frame_hash
+        if self.count >= self.frames :
+            (self.count, self._fired) = (0, frame_hash)
+            return True
+        return False
+
+class LiveDetector(object):
+    """Frames processing thread (see module doc)"""
+
+    def __init__(self, on_stable, frames=STABLE_FRAMES,
+                 distance=HASH_DISTANCE):
+        self.on_stable = on_stable
+        self.gate = StabilityGate(frames, distance)
+        self.processed = 0
+        self.dropped = 0
+        self.found = False
+        self.paused = False
+        self._times = collections.deque() # processing end times (fps)
+        self._frame = None # latest frame waiting for processing
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        with self._condition :
+            if self._running :
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition :
+            self._running = False
+            self._frame = None
+            self._condition.notify()
+        Logger.info("Live : [stop] : %s" % (self.stats()))
+
+    def resume(self):
+        """Detection again after a solve (see on_stable)"""
+        with self._condition :
+            self.paused = False
+
+    def submit(self, gray):
+        """Frame (numpy 2D array) to be processed, replacing the one still
+        waiting (then dropped). Ignored while paused."""
+
+        with self._condition :
+            if self.paused or not self._running :
+                return
+            if self._frame is not None :
+                self.dropped += 1
+            self._frame = gray
+            self._condition.notify()
+
+    def process(self, gray):
+        """Returns True if gray frame makes the grid stable"""
+
+        corners = grid.find_grid(gray)
+        self.found = corners is not None
+        stable = self.gate.update(self.found, dhash(gray))
+        now = time.monotonic()
+        with self._condition :
+            self.processed += 1
+            self._times.append(now)
+            while self._times and now - self._times[0] > FPS_WINDOW :
+                self._times.popleft()
+        return stable
+
+    def stats(self):
+        with self._condition :
+            fps = 0.0
+            if len(self._times) > 1 :
+                fps = (len(self._times) - 1) / max(1e-6, (self._times[-1] -
+                                                          self._times[0]))
+            return {"fps" : round(fps, 1), "processed" : self.processed,
+                    "dropped" : self.dropped, "found" : self.found,
+                    "stable" : self.gate.count, "frames" : self.gate.frames}
+
+    def _run(self):
+        while True :
+            with self._condition :
+                while self._running and self._frame is None :
+                    self._condition.wait()
+                if not self._running :
+                    return
+                (gray, self._frame) = (self._frame, None)
+            try :
+                stable = self.process(gray)
+            except Exception as e :
+                Logger.warning("Live : [process] : %s" % (e))
+                continue
+            if stable :
+                with self._condition :
+                    self.paused = True
+                    self._frame = None
+                self.on_stable()
@@ -4,20 +4,28 @@ __author__    = "Nathalie Rousse"
 __copyright__ = "Copyright 2020, INRAE"
 __license__   = "MIT"
 
-MODE = "WS" # MODE values : "WS" (default), "LOCAL" (not delivered)
+MODE = "WS" # MODE values : "WS" (default), "LOCAL" (see visualsudoku folder)
 
 import time, os
+import threading
 from PIL import Image
 import kivy
 from kivy.logger import Logger
 from kivy.app import App
+from kivy.clock import Clock
+from kivy.graphics.texture import Texture
+from kivy.graphics import Color, Line, Rectangle, Fbo
+from kivy.core.text import Label as CoreLabel
 from kivy.config import Config
 from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.behaviors import ButtonBehavior
 from kivy.uix.screenmanager import Screen
 from kivy.uix.screenmanager import ScreenManager
 from kivy.uix.settings import SettingsWithTabbedPanel
 from kivy.properties import ObjectProperty
 from kivy.properties import NumericProperty
+from kivy.properties import StringProperty
+from kivy.properties import BooleanProperty
 from kivy.uix.popup import Popup
 from kivy.uix.label import Label
 from kivy.uix.button import Button
@@ -35,42 +43,302 @@ DEFAULT_PADDING = 2
 #------------------------------------------------------------------------------
 
 if MODE=="LOCAL":
-    from visualsudoku.toulbar2_visual_sudoku_puzzle import read_and_solve
+    def read_and_solve(args):
+        """LOCAL mode engine (numpy, OpenCV) imported at first solve, if not
+        yet by preload"""
+        from visualsudoku import toulbar2_visual_sudoku_puzzle as local
+        return local.read_and_solve(args)
 else : # MODE=="WS", default
     from ws import read_and_solve
+from ws import Cancel, SolveCancelled, URL_VSUDOKU
+from ws import sweep_and_solve, sweep_candidates
+from ws import SWEEP_CANDIDATES, SWEEP_CONCURRENCY, SWEEP_MAX_BYTES
+from cache import SolutionCache, CACHE_DIRNAME, image_digest, cache_key
+from preprocess import prepare_upload, prepare_image, encode_image
+from preprocess import UPLOAD_MAX_SIDE
+from grid import GRID_SIZE, GRID_MARGIN
+from solution import EMPTY
+from response import cr_solve, cr_solve_digits, is_a_file
+from budget import BudgetMemory, BUDGET_FILENAME
+from gallery import Gallery, PAGE_SIZE, THUMB_SIZE
+from preview import TextureCache, preview_key, load_preview, reduce_image
+from preview import PREVIEW_MAX_SIDE, TEXTURES_MAX_BYTES
+from history import SolveHistory, HISTORY_FILENAME, HISTORY_MAX_BYTES
+from budget import TIME_START, TIME_FACTOR, TIME_MAX
+import live
+import metrics
+
+class SolveTask(object):
+    """Solve (read_and_solve call) run into a background thread
+
+    The Kivy main thread is kept free (frames rendering) during upload, server
+    solving and download. on_progress(stage, fraction) and on_done(task) are
+    called back on the main thread (Clock.schedule_once).
+
+    The image to be solved is image (PIL image kept in memory) if given, else
+    inputfilepath file.
+
+    compact case : the response is the solution digits (responsefilepath
+    text file), and task.grid_image the image (PIL) where to draw them
+    (rectified grid if task.grid_found, else blank square).
+
+    After on_done : task.cancelled True if cancelled, task.exception not None
+    if read_and_solve failed, task.from_cache True if the solution comes from
+    the cache (then read_and_solve not called), task.response the
+    (cr_ok, error_txt) classification of the web service response (None if
+    not "WS" mode or from cache, see cr_solve).
+
+    time_value None : adaptive time budget ('adaptivetime' setting, see
+    budget.py), task.time_value being then the last budget sent.
+    """
 
-def cr_solve(outputfilepath) :
-    """Analyze the solution/response from read_and_solve
+    def __init__(self, inputfilepath, outputfilepath,
+                 keep_value, border_value, time_value,
+                 on_progress=None, on_done=None, cache=None, image=None,
+                 compact=False, history=None):
+        self.image = image
+        self.compact = compact
+        self.responsefilepath = outputfilepath
+        if compact :
+            self.responsefilepath = os.path.join(
+                                  os.path.dirname(outputfilepath), "solution.txt")
+        self.grid_image = None
+        self.grid_found = False
+        self.cache = cache
+        self.history = history
+        self.digest = None
+        self.cache_key = None
+        self.from_cache = False
+        self.inputfilepath = inputfilepath
+        self.outputfilepath = outputfilepath
+        self.keep_value = keep_value
+        self.border_value = border_value
+        self.time_value = time_value
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.cancel_flag = Cancel()
+        self.cancelled = False
+        self.exception = None
+        self.response = None
+        self.done = False
+        self.adopted = False # speculative task adopted (see speculate)
+        self.timings = dict() # upload, server, download ("WS" mode)
+        self.started = None
+        self.duration = None # seconds, from start to done
+        self._last_progress = (None, None)
+
+    def start(self):
+        self.started = time.perf_counter()
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+
+    def cancel(self):
+        self.cancel_flag.cancel()
+
+    def _progress(self, stage, fraction):
+        """Called from the background thread"""
+
+        (last_stage, last_fraction) = self._last_progress
+        if stage == last_stage and fraction is not None and \
+           last_fraction is not None and fraction - last_fraction < 0.05 :
+            return # limits the number of callbacks scheduled
+        self._last_progress = (stage, fraction)
+        if self.on_progress is not None :
+            Clock.schedule_once(lambda dt: self.on_progress(stage, fraction))
+
+    def _run(self):
+        try :
+            if self.image is not None :
+                source = self.image
+                digest = image_digest(self.image.tobytes())
+            else :
+                source = self.inputfilepath
+                digest = None
+                if self.history is not None : # (file already hashed)
+                    digest = self.history.digest(self.inputfilepath)
+                if digest is None :
+                    digest = image_digest(self.inputfilepath)
+                    if self.history is not None :
+                        self.history.put_digest(self.inputfilepath, digest)
+            self.digest = digest
+
+            if self.cache is not None :
+                self.cache_key = cache_key(digest,
+                                           self.keep_value, self.border_value,
+                                           self.time_value)
+                self.from_cache = self.cache.get(self.cache_key,
+                                                 self.responsefilepath)
+
+            if self.compact :
+                (self.grid_image, self.grid_found) = prepare_image(source,
+                                                 max_side=UPLOAD_MAX_SIDE,
+                                                 grayscale=False,
+                                                 grid_side=INI['grid_size'])
+                if not self.grid_found :
+                    self.grid_image = Image.new('L',
+                                  (INI['grid_size'], INI['grid_size']), 255)
+
+            if self.from_cache :
+                Logger.info("App : [SolveTask] : solution from cache")
+
+            elif MODE=="LOCAL" :
+                Logger.info("App : [SolveTask] : 'LOCAL' mode")
+                args = {"model" : INI['model'],
+                        "image" : source,
+                        "output" : self.responsefilepath,
+                        "debug" : INI['debug'],
+                        "keep" : self.keep_value,
+                        "border" : self.border_value,
+                        "time" : self.time_value}
+                self.cancel_flag.check()
+                with metrics.span("read_and_solve", mode=MODE) :
+                    read_and_solve(args)
+                self.cancel_flag.check()
 
-    In cr_ok case, outputfilepath should be an image file.
-    In some not cr_ok cases, outputfilepath may be a txt file containing some 
-    error information
-    """
+            else : # MODE=="WS", default
+                Logger.info("App : [SolveTask] : 'WS' mode")
+                image = source
+                filename = None
+                if SETTINGS["uploadsize"] > 0 :
+                    self._progress('preparing', None)
+                    grid_side = INI['grid_size'] if SETTINGS["gridcrop"]==1 \
+                                else 0
+                    with metrics.span("encode") :
+                        (image, extension) = prepare_upload(source,
+                                              max_side=SETTINGS["uploadsize"],
+                                              quality=INI['upload_quality'],
+                                              grid_side=grid_side)
+                    filename = "grid" + extension
+                    Logger.debug("App : [SolveTask] : %d bytes to upload" %
+                                 (len(image)))
+                    self.cancel_flag.check()
+                elif self.image is not None : # image sent as it is
+                    (image, extension) = encode_image(
+                                  self.image.convert('RGB'), 'JPEG', quality=95)
+                    filename = "grid" + extension
+                returned_type = 'stdout'
+                if self.compact :
+                    returned_type = INI['compact_returned_type']
+                if self.time_value is None : # adaptive time budget
+                    self.response = get_budget_memory().solve(digest,
+                               lambda time_value: self._read_and_solve(image,
+                                          filename, returned_type, time_value),
+                               start=INI['time_start'],
+                               cap=SETTINGS["timemax"],
+                               factor=INI['time_factor'])
+                else :
+                    self.response = self._read_and_solve(image, filename,
+                                              returned_type, self.time_value)
+            Logger.info("App : [SolveTask] : read_and_solve done")
+            if self.cache is not None and not self.from_cache :
+                self._cache_put()
+
+        except SolveCancelled :
+            Logger.info("App : [SolveTask] : read_and_solve cancelled")
+            self.cancelled = True
+        except Exception as e :
+            self.exception = e
+        Clock.schedule_once(self._done)
 
-    (cr_ok, error_txt) = (True, "") # default
-
-    if not is_a_file(outputfilepath):
-        Logger.debug("App : [cr_solve] : file %s not is_a_file" %
-                     (outputfilepath))
-        cr_ok = False
-
-    else : # outputfilepath file exists
-
-        try : # txt file ?
-            txt = ""
-            with open(outputfilepath, 'rt') as f :
-                lines = f.readlines()
-                for line in lines:
-                    txt += line
-            cr_ok = False # txt file (containing information about error)
-            Logger.debug("App : [cr_solve] : %s is txt file, containing : %s" %
-                         (outputfilepath, txt))
-        except : # not txt file
-            pass
+    def _cache_put(self):
+        """Puts the solution into the solution cache (file copy and eviction,
+        off the main thread), if it is a solution"""
 
-    if not cr_ok :
-        error_txt = "Solving FAILURE"
-    return (cr_ok, error_txt)
+        try :
+            if self.compact :
+                cr_ok = cr_solve_digits(self.responsefilepath, self.response)[0]
+            else :
+                cr_ok = cr_solve(self.responsefilepath, self.response)[0]
+            if cr_ok :
+                self.cache.put(self.cache_key, self.responsefilepath)
+        except Exception as e :
+            Logger.warning("App : [SolveTask] : cache put : %s" % (e))
+
+    def _read_and_solve(self, image, filename, returned_type, time_value):
+        """"WS" mode read_and_solve (or sweep_and_solve) call with
+        time_value, returns (cr_ok, error_txt)"""
+
+        self.time_value = time_value # (see solve_progress)
+        timings = self.timings
+        if SETTINGS["sweep"]==1 :
+            candidates = sweep_candidates(self.keep_value, self.border_value,
+                                          INI['sweep_candidates'])
+            with metrics.span("read_and_solve", mode=MODE, time=time_value,
+                              sweep=len(candidates)) as span :
+                (cr_ok, error_txt, candidate) = sweep_and_solve(
+                               image=image, filename=filename,
+                               output=self.responsefilepath,
+                               candidates=candidates,
+                               time=time_value,
+                               progress=self._progress,
+                               cancel=self.cancel_flag,
+                               returned_type=returned_type,
+                               url=SETTINGS["wsurl"], timings=timings,
+                               concurrency=INI['sweep_concurrency'],
+                               max_bytes=INI['sweep_max_bytes']*1024)
+                span.set(keep=candidate[0], border=candidate[1])
+            Logger.info("App : [SolveTask] : sweep : keep %s, border %s kept"
+                        % candidate)
+        else :
+            with metrics.span("read_and_solve", mode=MODE, time=time_value) :
+                (cr_ok, error_txt) = read_and_solve(image=image,
+                               filename=filename,
+                               output=self.responsefilepath,
+                               keep=self.keep_value,
+                               border=self.border_value,
+                               time=time_value,
+                               progress=self._progress,
+                               cancel=self.cancel_flag,
+                               returned_type=returned_type,
+                               url=SETTINGS["wsurl"], timings=timings)
+        if timings :
+            for stage in ('upload', 'server', 'download') :
+                metrics.record(stage, timings[stage],
+                               attempts=timings['attempts'])
+        return (cr_ok, error_txt)
+
+    def _done(self, dt):
+        self.duration = time.perf_counter() - self.started
+        self.done = True
+        if self.on_done is not None :
+            self.on_done(self)
+
+_solution_cache = None
+
+def get_solution_cache():
+    """Returns the solution cache of the images folder"""
+
+    global _solution_cache
+    dirpath = os.path.join(SETTINGS["imagepath"], CACHE_DIRNAME)
+    if _solution_cache is None or _solution_cache.dirpath != dirpath :
+        _solution_cache = SolutionCache(dirpath,
+                                  max_bytes=INI['cache_size_max']*1024*1024)
+    return _solution_cache
+
+_history = None
+
+def get_history():
+    """Returns the solve history of the images folder"""
+
+    global _history
+    path = os.path.join(SETTINGS["imagepath"], HISTORY_FILENAME)
+    if _history is None or _history.path != path :
+        if _history is not None :
+            _history.close()
+        _history = SolveHistory(path)
+    _history.max_bytes = SETTINGS["historymax"]*1024*1024
+    return _history
+
+_budget_memory = None
+
+def get_budget_memory():
+    """Returns the time budgets memory of the images folder"""
+
+    global _budget_memory
+    path = os.path.join(SETTINGS["imagepath"], BUDGET_FILENAME)
+    if _budget_memory is None or _budget_memory.path != path :
+        _budget_memory = BudgetMemory(path)
+    return _budget_memory
 
 #------------------------------------------------------------------------------
 # Folders
@@ -85,12 +353,17 @@ if kivy.platform == "android" :
 APP_PATH = os.path.dirname(os.path.abspath(__file__)) # for 'linux' case
 HOME_PATH = os.path.dirname(APP_PATH) # for 'linux' case
 
+_paths = dict() # get_config_file_path and get_img_path memo (startup)
+
 def get_config_file_path():
     """Returns .ini file path
 
     Supposing only one '.ini' file into expected folder
+    (folder listed once, as soon as the file exists)
     """
 
+    if _paths.get("config") :
+        return _paths["config"]
     if kivy.platform == "android" :
         config_path = app_storage_path()
     else : # 'linux' (...)
@@ -102,10 +375,13 @@ def get_config_file_path():
             if name.endswith('.ini') :
                 filepath = os.path.join(config_path, name)
                 if os.path.isfile(filepath) :
+                    _paths["config"] = filepath
                     return filepath
     return ""
 
 def get_img_path():
+    if "img" in _paths :
+        return _paths["img"]
     if kivy.platform == "android" :
         root_path = primary_external_storage_path()
         img_path = os.path.join(root_path, "VisualSudoku")
@@ -113,13 +389,31 @@ def get_img_path():
             os.mkdir(img_path)
     else : # 'linux' (...)
         img_path = os.path.join(HOME_PATH, "img")
+    _paths["img"] = img_path
     return img_path
 
-def is_a_file(filepath):
-    if os.path.exists(filepath):
-        if os.path.isfile(filepath):
-            return True
-    return False
+def preload(*args):
+    """Imports into background the modules deferred at App start (requests,
+    numpy and OpenCV, LOCAL mode engine and model), for the first solve or
+    live mode not to wait for them
+    """
+
+    def run():
+        start = time.perf_counter()
+        live.is_available()
+        try :
+            import requests
+        except ImportError : # (LOCAL mode)
+            pass
+        if MODE=="LOCAL" :
+            try :
+                from visualsudoku import classifier
+                import visualsudoku.toulbar2_visual_sudoku_puzzle
+                classifier.load_model(INI['model'])
+            except Exception as e : # (reported at solve)
+                Logger.warning("App : [preload] : LOCAL mode : %s" % (e))
+        Logger.info("App : [preload] : %.3f s" % (time.perf_counter() - start))
+    threading.Thread(target=run, daemon=True).start()
 
 def check_permissions(perms):
     for perm in perms:
@@ -130,6 +424,55 @@ def check_permissions(perms):
     Logger.info("App : [check_permissions] : ALL required permissions OK")
     return True
 
+#------------------------------------------------------------------------------
+# Images
+#------------------------------------------------------------------------------
+
+def texture_image(texture, method=Image.FLIP_TOP_BOTTOM):
+    """Returns PIL image (RGBA) of texture pixels, transposed by method
+
+    Texture pixels rows are bottom-up : method has to include the vertical
+    flip (Image.FLIP_TOP_BOTTOM, or Image.TRANSPOSE for flip + rotation).
+    """
+
+    image = Image.frombytes('RGBA', texture.size, texture.pixels)
+    return image.transpose(method)
+
+textures = TextureCache() # previews textures (see preview_texture)
+
+def preview_side():
+    """Returns the largest side of the previews : the window one (bounded by
+    INI['preview_max_side'])"""
+
+    from kivy.core.window import Window
+    return min(INI['preview_max_side'], max(Window.size))
+
+def preview_texture(filepath):
+    """Returns (texture, key) of filepath preview (see preview.py), texture
+    from the textures cache if there, else made and put into it (key : to
+    release it, see textures.release)"""
+
+    side = preview_side()
+    key = preview_key(filepath, side)
+    texture = textures.get(key)
+    if texture is None :
+        texture = image_texture(load_preview(filepath, side))
+        textures.put(key, texture, 4*texture.width*texture.height)
+        Logger.debug("App : [preview_texture] : %s %s (%d textures, %d kB)" %
+                     (os.path.basename(filepath), texture.size,
+                      len(textures), textures.nbytes//1024))
+    return (texture, key)
+
+def image_texture(image):
+    """Returns texture of PIL image"""
+
+    if image.mode != 'RGBA' :
+        image = image.convert('RGBA')
+    texture = Texture.create(size=image.size, colorfmt='rgba')
+    texture.blit_buffer(image.tobytes(), colorfmt='rgba', bufferfmt='ubyte')
+    texture.flip_vertical()
+    return texture
+
 #------------------------------------------------------------------------------
 # Config
 #------------------------------------------------------------------------------
@@ -138,7 +481,25 @@ INI = {
         'keep_default': 0,
         'border_default': 0,
         'time_default': 5,
-        'model':"visualsudoku/mixed_classifier.h5",
+        'model':"visualsudoku/mixed_classifier.npz",
+        'cache_size_max': 50, # solution cache maximal size (MB)
+        'upload_quality': 85, # quality of the image re-encoded for upload
+        'grid_size': GRID_SIZE, # side of the rectified grid image (gridcrop)
+        'compact_returned_type': 'stdout.txt', # or 'run.zip' (compact)
+        'speculate_delay': 0.5, # seconds after values change (speculative)
+        'live_size': live.LIVE_SIZE, # side of the live mode frames
+        'live_interval': live.LIVE_INTERVAL, # live mode sampling (seconds)
+        'live_frames': live.STABLE_FRAMES, # stable frames before solving
+        'time_start': TIME_START, # first budget (adaptivetime)
+        'time_factor': TIME_FACTOR, # budget escalation (adaptivetime)
+        'sweep_candidates': SWEEP_CANDIDATES, # (keep, border) of the sweep
+        'sweep_concurrency': SWEEP_CONCURRENCY, # sweep requests at once
+        'sweep_max_bytes': SWEEP_MAX_BYTES//1024, # sweep total upload (kB)
+        'gallery_page_size': PAGE_SIZE, # thumbnails per gallery page
+        'gallery_thumb_size': THUMB_SIZE, # side of the thumbnails (pixels)
+        'preview_max_side': PREVIEW_MAX_SIDE, # previews side (pixels)
+        'textures_max_size': TEXTURES_MAX_BYTES//(1024*1024), # previews (MB)
+        'preload_delay': 2, # seconds after start, deferred imports preloaded
         'debug' : 0
       }
 
@@ -164,7 +525,57 @@ json_data_app = \
       {"type": "bool",
        "title": "savinginputfile",
        "desc": "Saving captured partial grid file (from camera)",
-       "section": "app", "key": "savinginputfile"}
+       "section": "app", "key": "savinginputfile"},
+
+      {"type": "numeric",
+       "title": "uploadsize",
+       "desc": "Maximal size (pixels) of the grid image sent for solving (0 : image sent as it is)",
+       "section": "app", "key": "uploadsize"},
+
+      {"type": "bool",
+       "title": "gridcrop",
+       "desc": "Sending only the grid (detected into the image) for solving",
+       "section": "app", "key": "gridcrop"},
+
+      {"type": "bool",
+       "title": "compact",
+       "desc": "Receiving only the solution digits (drawn by the App) instead of the solution image",
+       "section": "app", "key": "compact"},
+
+      {"type": "string",
+       "title": "wsurl",
+       "desc": "Url of the vsudoku web service solving the grids",
+       "section": "app", "key": "wsurl"},
+
+      {"type": "bool",
+       "title": "speculative",
+       "desc": "Solving started as soon as the grid is shown, before Solve is pressed (the viewed images are sent to the web service)",
+       "section": "app", "key": "speculative"},
+
+      {"type": "bool",
+       "title": "sweep",
+       "desc": "Solving with several keep/border values at once, the first solution found being kept",
+       "section": "app", "key": "sweep"},
+
+      {"type": "bool",
+       "title": "adaptivetime",
+       "desc": "Solving with a short time first, then longer ones after timeouts (until timemax), instead of the time value",
+       "section": "app", "key": "adaptivetime"},
+
+      {"type": "numeric",
+       "title": "timemax",
+       "desc": "Maximal time (seconds) for solving sudoku (adaptivetime)",
+       "section": "app", "key": "timemax"},
+
+      {"type": "numeric",
+       "title": "historymax",
+       "desc": "Maximal size (MB) of the GRD_ and SOL_ files of the solves (the oldest ones removed beyond, 0 : no limit)",
+       "section": "app", "key": "historymax"},
+
+      {"type": "bool",
+       "title": "metrics",
+       "desc": "Recording the solve timings into metrics.jsonl file (next to the log file)",
+       "section": "app", "key": "metrics"}
 ]"""
 
 #------------------------------------------------------------------------------
@@ -250,20 +661,74 @@ class MainScreen(Screen):
 class SetScreen(Screen):
     pass
 
-class SelectImageFileScreen(Screen):
-    """Selection of the image file (existing on device) to be solved"""
+class GalleryItem(ButtonBehavior, BoxLayout):
+    """Thumbnail of an image file of the gallery"""
 
-    def select_file(self, *args):
+    filepath = StringProperty('')
+    thumb = StringProperty('') # thumbnail file path ('' : not yet made)
+    text = StringProperty('')
 
-        if len(self.ids.fc.selection) > 0 :
+class SelectImageFileScreen(Screen):
+    """Selection of the image file (existing on device) to be solved, among
+    the gallery pages (see gallery.py)"""
+
+    page = NumericProperty(0)
+    pages = NumericProperty(1)
+    page_text = StringProperty('')
+    gallery = None
+
+    def open_gallery(self, dirpath):
+        """Shows the current page of dirpath gallery at once (index known
+        so far), updated once the folder has been scanned"""
+
+        if self.gallery is None or self.gallery.dirpath != dirpath :
+            self.gallery = Gallery(dirpath, self.gallery_changed,
+                                   page_size=INI['gallery_page_size'],
+                                   thumb_size=INI['gallery_thumb_size'])
+            self.page = 0
+        self.gallery.open()
+        self.show_page(self.page)
+
+    def gallery_changed(self, what):
+        """(called from gallery thread)"""
+        Clock.schedule_once(lambda dt: self.show_page(self.page,
+                                                  request=(what=="index")))
+
+    def show_page(self, n, request=True):
+        """Shows page n, whose thumbnails are requested if request (made if
+        missing or image modified)"""
+
+        gallery = self.gallery
+        self.pages = gallery.pages()
+        self.page = max(0, min(n, self.pages - 1))
+        items = gallery.page(self.page)
+        self.page_text = "%d / %d  (%d images)" % (self.page + 1, self.pages,
+                                                   gallery.count())
+        layout = self.ids.gallery
+        while len(layout.children) < gallery.page_size :
+            item = GalleryItem()
+            item.bind(on_release=self.select_file)
+            layout.add_widget(item)
+        for (i, item) in enumerate(reversed(layout.children)) :
+            (filepath, thumbpath) = items[i] if i < len(items) else ("", None)
+            item.filepath = filepath
+            item.thumb = thumbpath or ""
+            item.text = os.path.basename(filepath)
+            item.disabled = not filepath
+            item.opacity = 1 if filepath else 0
+        if request :
+            gallery.request(self.page)
+
+    def select_file(self, item):
+
+        if item.filepath :
             sm = self.manager
             if SETTINGS["expert"] == 1 :
                 next_name = 'displayimagexp'
             else :
                 next_name = 'displayimage'
-            screen = sm.screens[sm.number[next_name]]
-            screen.ids.imagepath.text = self.ids.fc.selection[0]
-            screen.ids.imageView.reload()
+            screen = sm.screen(next_name)
+            screen.set_image(filepath=item.filepath)
             screen.angle = -90 if (kivy.platform=="android") else 0
             Logger.info("App : [select_file] : selected file : %s" %
                         (screen.ids.imagepath.text))
@@ -274,15 +739,53 @@ class SelectImageFileScreen(Screen):
 class DisplayImageScreen(Screen):
     """Display the chosen image file (existing or captured) to be solved
 
-    Button : solve
+    Buttons : solve, cancel (while solving)
     """
 
     angle = NumericProperty(0.0)
+    solving = BooleanProperty(False) # True while a solve is in progress
+    solve_status = StringProperty('Solve')
+    task = None # SolveTask in progress
+    image = None # image (PIL) kept in memory, solved instead of imagepath
+    speculation = None # speculative SolveTask (see speculate)
+    speculation_time = None # time_value of speculation (before adaptive)
+    preview = None # key of the shown preview into textures cache
+    _speculate_event = None
+
+    def set_image(self, filepath="", image=None):
+        """Image to be solved : image (PIL) if given, else filepath file
+
+        filepath is the image file (if any) in image case.
+        """
+
+        self.image = image
+        self.ids.imagepath.text = filepath
+        self.ids.imagetext.text = self.image_text(filepath)
+        view = self.ids.imageView
+        self.release_preview()
+        if image is not None : # (not kept into textures cache)
+            view.texture = image_texture(reduce_image(image, preview_side()))
+        elif os.path.isfile(filepath) :
+            (view.texture, self.preview) = preview_texture(filepath)
+        else :
+            view.texture = None
+        self.speculate()
+
+    def release_preview(self):
+        if self.preview is not None :
+            textures.release(self.preview)
+            self.preview = None
+
+    def on_leave(self, *args):
+        self.ids.imageView.texture = None
+        self.release_preview()
 
     def image_text(self, filepath):
         name = ""
         if os.path.isfile(filepath) :
             name = os.path.basename(filepath)
+        elif self.image is not None :
+            name = "(captured image, not saved)"
         text = "[i]"+ "Grid file: "+name +"[/i]"
         return text
 
@@ -303,75 +806,365 @@ class DisplayImageScreen(Screen):
         outputfilepath = os.path.join(dirname, out_name)
         return outputfilepath
 
+    def solve_values(self):
+        """Returns (keep_value, border_value, time_value) of the solve"""
+
+        if SETTINGS["expert"] == 1 :
+            Logger.info("App : [solve] : 'Expert' mode => menu values for keep border time")
+            keep_value = int(self.ids.keep.value)
+            border_value = int(self.ids.border.value)
+            time_value = int(self.ids.time.value)
+        else :
+            Logger.info("App : [solve] : NOT 'Expert' mode => default values for keep border time")
+            keep_value = INI['keep_default']
+            border_value = INI['border_default']
+            time_value = INI['time_default']
+
+        if SETTINGS["adaptivetime"] == 1 :
+            Logger.info("App : [solve] : 'adaptivetime' => time value from %d to %d" % (INI['time_start'], SETTINGS["timemax"]))
+            time_value = None
+
+        Logger.debug("App : [solve] : keep_value: %d, border_value: %d, time_value: %s" % (keep_value, border_value, time_value))
+        return (keep_value, border_value, time_value)
+
     def solve(self, inputfilepath):
+        """Launches the solve into background (see solve_done)
 
-        try:
-            sm = self.manager
+        The speculative solve (see speculate) is adopted if it has been
+        launched with the same values.
+        """
 
-            Logger.info("App : [solve] : SETTINGS : %s" % (SETTINGS))
+        if self.task is not None :
+            Logger.info("App : [solve] : a solve is already in progress")
+            return
 
-            if SETTINGS["expert"] == 1 :
-                Logger.info("App : [solve] : 'Expert' mode => menu values for keep border time")
-                keep_value = int(self.ids.keep.value)
-                border_value = int(self.ids.border.value)
-                time_value = int(self.ids.time.value)
-            else :
-                Logger.info("App : [solve] : NOT 'Expert' mode => default values for keep border time")
-                keep_value = INI['keep_default']
-                border_value = INI['border_default']
-                time_value = INI['time_default']
+        try:
+            Logger.info("App : [solve] : SETTINGS : %s" % (SETTINGS))
 
-            Logger.debug("App : [solve] : keep_value: %d, border_value: %d, time_value: %d" % (keep_value, border_value, time_value))
+            values = self.solve_values()
 
             Logger.info("App : [solve] : SETTINGS['savingoutputfile']= %d" %
                         (SETTINGS["savingoutputfile"]))
             if SETTINGS["savingoutputfile"]==1 :
-                outputfilepath = self.getname_outputfilepath(inputfilepath)
+                outputfilepath = self.getname_outputfilepath(
+                                                   inputfilepath or "GRD.jpg")
             else :
                 outputfilepath = self.getname_outputfilepath()
 
-            if MODE=="LOCAL" :
-                Logger.info("App : [solve] : 'LOCAL' mode")
-                args = {"model" : INI['model'],
-                        "image" : inputfilepath,
-                        "output" : outputfilepath,
-                        "debug" : INI['debug'],
-                        "keep" : keep_value, "border" : border_value,
-                        "time" : time_value}
-                read_and_solve(args)
+            speculation = self.speculation
+            self.speculation = None
+            if speculation is not None and \
+               speculation.inputfilepath == inputfilepath and \
+               (speculation.keep_value, speculation.border_value,
+                self.speculation_time) == values :
+                Logger.info("App : [solve] : speculative solve adopted")
+                self.task = speculation
+                self.task.adopted = True
+                self.task.outputfilepath = outputfilepath # (see solve_done)
+                self.task.on_progress = self.solve_progress
+                self.task.on_done = self.solve_done
+            else :
+                if speculation is not None :
+                    speculation.cancel()
+                self.task = self.new_task(inputfilepath, outputfilepath,
+                                          values)
+                self.task.start()
+                Logger.info("App : [solve] : calls read_and_solve (background)")
+            self.solving = True
+            self.solve_status = '... Solving in progress ...'
+            if self.task.done : # (speculative solve already done)
+                self.solve_done(self.task)
 
-            else : # MODE=="WS", default
-                Logger.info("App : [solve] : 'WS' mode")
-                read_and_solve(image=inputfilepath, output=outputfilepath,
-                               keep=keep_value, border=border_value,
-                               time=time_value)
-            Logger.info("App : [solve] : calls read_and_solve")
+        except Exception as e :
+            failed_msg(e)
 
-            Logger.info("App : [solve] : outputfilepath : %s" %
-                        (outputfilepath))
+    def new_task(self, inputfilepath, outputfilepath, values,
+                 speculative=False):
+        """Returns the SolveTask (not started) of the image"""
+
+        (keep_value, border_value, time_value) = values
+        task = SolveTask(inputfilepath, outputfilepath,
+                         keep_value, border_value, time_value,
+                         on_progress=None if speculative else self.solve_progress,
+                         on_done=None if speculative else self.solve_done,
+                         cache=get_solution_cache(),
+                         history=get_history(),
+                         image=self.image,
+                         compact=(MODE!="LOCAL" and
+                                  SETTINGS["compact"]==1))
+        return task
+
+    #--------------------------------------------------------------------------
+    # speculative solve
+
+    def speculate(self, *args):
+        """Launches the solve into background as soon as the image is shown
+        ('speculative' setting) : connection, preprocessing, upload and
+        server solving are done (or under way) when Solve is pressed
+
+        Its output is the default solution file (renamed at adoption, see
+        solve_done). Cancelled when the values change (see values_changed)
+        or the screen is left.
+        """
+
+        self.cancel_speculation()
+        if SETTINGS["speculative"] != 1 or self.task is not None :
+            return
+        inputfilepath = self.ids.imagepath.text
+        if self.image is None and not os.path.isfile(inputfilepath) :
+            return
+        try :
+            values = self.solve_values()
+            self.speculation = self.new_task(inputfilepath,
+                                             self.getname_outputfilepath(),
+                                             values, speculative=True)
+            self.speculation_time = values[2]
+            self.speculation.start()
+            Logger.info("App : [speculate] : speculative solve launched")
+        except Exception as e :
+            self.speculation = None
+            Logger.warning("App : [speculate] : %s" % (e))
+
+    def cancel_speculation(self, *args):
+        if self._speculate_event is not None :
+            self._speculate_event.cancel()
+            self._speculate_event = None
+        if self.speculation is not None :
+            Logger.info("App : [cancel_speculation] : speculative solve cancelled")
+            self.speculation.cancel()
+            self.speculation = None
+
+    def values_changed(self, *args):
+        """keep, border, time values changed : speculative solve launched
+        again (once the slider is released for INI['speculate_delay'])"""
+
+        if SETTINGS["speculative"] != 1 or self.manager is None or \
+           self.manager.current != self.name :
+            return
+        self.cancel_speculation()
+        self._speculate_event = Clock.schedule_once(self.speculate,
+                                                    INI['speculate_delay'])
+
+    def cancel_solve(self, *args):
+        if self.task is not None :
+            Logger.info("App : [cancel_solve] : cancelling solve")
+            self.solve_status = '... Cancelling ...'
+            self.task.cancel()
+
+    def solve_progress(self, stage, fraction):
+        """Shows the solve stage (uploading, solving, downloading)"""
+
+        task = self.task
+        if task is None or task.cancel_flag.is_cancelled() :
+            return
+        if stage == 'solving' :
+            text = '... Solving (time <= {}s) ...'.format(task.time_value)
+        elif fraction is not None :
+            text = '... {} {}% ...'.format(stage.capitalize(),
+                                           int(100*fraction))
+        else :
+            text = '... {} ...'.format(stage.capitalize())
+        self.solve_status = text
+
+    def solve_done(self, task):
+        """End of the solve (called on main thread)"""
+
+        self.task = None
+        self.solving = False
+        self.solve_status = 'Solve'
+
+        try:
+            sm = self.manager
+
+            if task.cancelled :
+                Logger.info("App : [solve_done] : solve cancelled")
+                return
+            if task.exception is not None :
+                self.record(task, False, str(task.exception))
+                raise task.exception
 
-            (cr_ok, error_txt) = cr_solve(outputfilepath)
+            outputfilepath = task.outputfilepath
+            Logger.info("App : [solve_done] : outputfilepath : %s" %
+                        (outputfilepath))
 
-            Logger.debug("App : [solve] : from cr_solve, cr_ok= %s, error_txt= %s " %
+            with metrics.span("cr_solve", compact=int(task.compact),
+                              cached=int(task.from_cache),
+                              speculative=int(bool(task.adopted))) :
+                if task.compact :
+                    (cr_ok, error_txt, givens, solution) = cr_solve_digits(
+                                                        task.responsefilepath,
+                                                        task.response)
+                else :
+                    (cr_ok, error_txt) = cr_solve(task.responsefilepath,
+                                                  task.response)
+
+            Logger.debug("App : [solve_done] : from cr_solve, cr_ok= %s, error_txt= %s " %
                         (cr_ok, error_txt))
             if cr_ok :
-                screen = sm.screens[sm.number['displaysolution']]
-                screen.ids.solutionpath.text = outputfilepath
-                screen.ids.imagepath.text = inputfilepath
+                if not task.compact and \
+                   task.responsefilepath != outputfilepath : # (adopted)
+                    os.replace(task.responsefilepath, outputfilepath)
+                self.record(task, cr_ok, error_txt, outputfilepath)
+                screen = sm.screen('displaysolution')
+                screen.ids.imagepath.text = task.inputfilepath or ""
+                if task.compact :
+                    saving = (SETTINGS["savingoutputfile"]==1)
+                    screen.show_digits(task.grid_image, task.grid_found,
+                                       givens, solution,
+                                       outputfilepath if saving else None)
+                else :
+                    screen.show_file(outputfilepath)
                 self.manager.current = 'displaysolution'
             else :
+                self.record(task, cr_ok, error_txt)
                 error_msg(text=error_txt)
                 self.manager.current = 'main'
 
         except Exception as e :
             failed_msg(e)
 
+    def record(self, task, cr_ok, error_txt, outputfilepath=None):
+        """Records the solve into the solve history (see history.py), into
+        its background thread"""
+
+        try :
+            ms = dict((stage, round(1000*task.timings[stage], 1))
+                      for stage in ('upload', 'server', 'download')
+                      if stage in task.timings)
+            history = task.history
+            history.post(history.add, digest=task.digest,
+                         keep=task.keep_value, border=task.border_value,
+                         time=task.time_value, mode=MODE,
+                         compact=int(task.compact),
+                         cached=int(task.from_cache),
+                         speculative=int(bool(task.adopted)),
+                         ms=round(1000*task.duration, 1),
+                         upload_ms=ms.get('upload'),
+                         server_ms=ms.get('server'),
+                         download_ms=ms.get('download'),
+                         ok=int(bool(cr_ok)), error=error_txt or None,
+                         input=task.inputfilepath or None,
+                         output=outputfilepath)
+        except Exception as e : # (solve not concerned)
+            Logger.warning("App : [record] : %s" % (e))
+
+    def on_pre_leave(self, *args):
+        self.cancel_solve()
+        self.cancel_speculation()
+
 class DisplayImageScreenXp(DisplayImageScreen):
     """Case Expert mode (+ parameters : keep, border...) """
     pass
 
 class DisplaySolutionScreen(Screen):
-    """Display the solution image file """
+    """Display the solution image file, or the solution digits drawn over the
+    grid image (compact case)"""
+
+    digits = None # (grid_found, givens, solution) in compact case
+    preview = None # key of the shown preview into textures cache
+
+    def show_file(self, outputfilepath):
+        """Shows the solution image file"""
+
+        self.digits = None
+        view = self.ids.solutionView
+        view.canvas.after.clear()
+        self.release_preview()
+        (view.texture, self.preview) = preview_texture(outputfilepath)
+        self.ids.solutionpath.text = outputfilepath
+
+    def show_digits(self, grid_image, grid_found, givens, solution,
+                    outputfilepath=None):
+        """Shows solution digits drawn over grid_image (PIL), and saves the
+        result as outputfilepath if given
+
+        grid_image is the rectified grid if grid_found (then givens not
+        drawn), else a blank square (then grid lines and givens drawn).
+        Givens unknown (None) : the printed cells of the grid image can not
+        be told apart, the digits are drawn over a blank square.
+        """
+
+        if grid_found and givens is None :
+            grid_image = Image.new('L', grid_image.size, 255)
+            grid_found = False
+        self.digits = (grid_found, givens, solution)
+        view = self.ids.solutionView
+        self.ids.solutionpath.text = ""
+        self.release_preview()
+        view.texture = image_texture(grid_image)
+        view.unbind(pos=self.draw_digits, size=self.draw_digits,
+                    norm_image_size=self.draw_digits)
+        view.bind(pos=self.draw_digits, size=self.draw_digits,
+                  norm_image_size=self.draw_digits)
+        self.draw_digits()
+        self.ids.solutiontext.text = self.solution_text("")
+        if outputfilepath is not None :
+            Clock.schedule_once(lambda dt: self.save_digits(outputfilepath))
+
+    def on_leave(self, *args):
+        self.digits = None
+        self.ids.solutionView.canvas.after.clear()
+        self.ids.solutionView.texture = None
+        self.release_preview()
+
+    def release_preview(self):
+        if self.preview is not None :
+            textures.release(self.preview)
+            self.preview = None
+
+    def draw_digits(self, *args):
+        view = self.ids.solutionView
+        view.canvas.after.clear()
+        if self.digits is None :
+            return
+        (grid_found, givens, solution) = self.digits
+
+        (w, h) = view.norm_image_size
+        margin = GRID_MARGIN * w
+        cell = (w - 2*margin) / 9.0
+        x0 = view.center_x - w/2.0 + margin # grid left
+        y1 = view.center_y + h/2.0 - margin # grid top
+        font_size = max(1, int(0.7*cell))
+
+        with view.canvas.after :
+            if not grid_found :
+                Color(0, 0, 0, 1)
+                for i in range(10) :
+                    width = 2 if i % 3 == 0 else 1
+                    Line(points=[x0, y1-i*cell, x0+9*cell, y1-i*cell],
+                         width=width)
+                    Line(points=[x0+i*cell, y1, x0+i*cell, y1-9*cell],
+                         width=width)
+            for (i, digit) in enumerate(solution) :
+                given = (givens is not None and givens[i] != EMPTY)
+                if given and grid_found :
+                    continue # already into grid image
+                if given :
+                    Color(0, 0, 0, 1)
+                else :
+                    Color(178/255.0, 34/255.0, 34/255.0, 1.0)
+                label = CoreLabel(text=digit, font_size=font_size, bold=True)
+                label.refresh()
+                texture = label.texture
+                (r, c) = divmod(i, 9)
+                cx = x0 + (c+0.5)*cell
+                cy = y1 - (r+0.5)*cell
+                Rectangle(texture=texture, size=texture.size,
+                          pos=(cx - texture.width/2.0,
+                               cy - texture.height/2.0))
+
+    def save_digits(self, outputfilepath):
+        """Saves the solution image (grid image + digits drawn)"""
+
+        try :
+            self.ids.solutionView.export_as_image().save(outputfilepath)
+            history = get_history()
+            history.post(history.add_artifact, outputfilepath)
+            self.ids.solutiontext.text = self.solution_text(outputfilepath)
+            Logger.info("App : [save_digits] : solution saved as file %s" %
+                        (outputfilepath))
+        except Exception as e :
+            failed_msg(e)
 
     def image_text(self, filepath):
         name = ""
@@ -390,15 +1183,120 @@ class DisplaySolutionScreen(Screen):
 class CaptureImageScreen(Screen):
     """Capture and save the image file to be solved
 
-    Buttons : play (camera on/off), capture
+    Buttons : play (camera on/off), capture, live (on/off)
+
+    Live mode : camera frames sampled at low resolution (INI['live_size'],
+    every INI['live_interval'] seconds), the image being captured and solved
+    once a grid has been found stable into INI['live_frames'] frames (see
+    live.py). One solve at a time : the detection is stopped while leaving
+    the screen (solve in progress into displayimage screen).
 
     Note : not finding a camera (for example because gstreamer not installed)
     will throw an exception during the kv language processing
     """
 
+    live = BooleanProperty(False) # live mode on/off
+    live_status = StringProperty('')
+    detector = None # LiveDetector while live mode on
+    _sampling = None # sampling Clock event
+    _live_start = 0.0 # (time to stable grid, see metrics)
+    _fbo = None # frames reduced by drawing the camera texture into it
+
     def is_android(self, *args):
         return (kivy.platform=="android")
 
+    def live_onoff(self, *args):
+        if not self.live and not live.is_available() :
+            error_msg(text="Live mode requires OpenCV (grid detection)")
+            return
+        self.live = not self.live
+        Logger.info("App : [live_onoff] : live : %s" % (self.live))
+        if self.live :
+            self.start_live()
+        else :
+            self.stop_live()
+
+    def start_live(self):
+        """Starts (or resumes) sampling and detection"""
+
+        if self.detector is None :
+            self.detector = live.LiveDetector(self.live_stable,
+                                              frames=INI['live_frames'])
+        self.detector.resume()
+        self.detector.start()
+        self._live_start = time.perf_counter()
+        if self._sampling is None :
+            self._sampling = Clock.schedule_interval(self.sample_frame,
+                                                     INI['live_interval'])
+
+    def stop_live(self, keep=False):
+        """Stops sampling and detection, the detector being kept if keep
+        (the grid already solved is not solved again at resume)"""
+
+        if self._sampling is not None :
+            self._sampling.cancel()
+            self._sampling = None
+        if self.detector is not None :
+            self.detector.stop()
+            if not keep :
+                self.detector = None
+        self.live_status = ''
+
+    def sample_frame(self, dt):
+        """Submits the camera frame, reduced, to the detector"""
+
+        camera = self.ids['camera']
+        texture = camera.texture
+        if not camera.play or texture is None or self.detector is None :
+            return
+        side = INI['live_size']
+        (w, h) = texture.size
+        size = (side, max(1, int(side * h / w))) if w >= h else \
+               (max(1, int(side * w / h)), side)
+        if self._fbo is None or tuple(self._fbo.size) != size :
+            self._fbo = Fbo(size=size)
+            with self._fbo :
+                self._frame_rect = Rectangle(size=size)
+        self._frame_rect.texture = texture
+        self._fbo.draw()
+        self.detector.submit(live.frame_gray(self._fbo.pixels, size))
+        stats = self.detector.stats()
+        self.live_status = "Live : {} fps, {} dropped, {}".format(
+                           stats["fps"], stats["dropped"],
+                           "grid {}/{}".format(stats["stable"], stats["frames"])
+                           if stats["found"] else "no grid")
+
+    def live_stable(self):
+        """Called from the detector thread"""
+        Clock.schedule_once(self.live_solve)
+
+    def live_solve(self, dt):
+        """Captures and solves the stable grid"""
+
+        if self._sampling is None or self.manager.current != self.name :
+            return
+        sm = self.manager
+        for name in ('displayimage', 'displayimagexp') :
+            if sm.has_screen(name) and sm.get_screen(name).task is not None :
+                Logger.info("App : [live_solve] : a solve is already in progress")
+                self.detector.resume()
+                return
+        stats = self.detector.stats()
+        Logger.info("App : [live_solve] : stable grid : %s" % (stats))
+        metrics.record("live", time.perf_counter() - self._live_start,
+                       fps=stats["fps"], processed=stats["processed"],
+                       dropped=stats["dropped"])
+        screen = self.capture()
+        if screen is not None :
+            screen.solve(screen.ids.imagepath.text)
+
+    def on_enter(self, *args):
+        if self.live :
+            self.start_live()
+
+    def on_leave(self, *args):
+        self.stop_live(keep=True)
+
     def camera_onoff(self, *args):
         sm = self.manager
         camera = self.ids['camera']
@@ -423,6 +1321,9 @@ class CaptureImageScreen(Screen):
         return inputfilepath
 
     def capture(self):
+        """Returns the screen of the captured image (None if failed)"""
+
+        capture_span = metrics.span("capture", android=int(self.is_android()))
         try:
             sm = self.manager
             camera = self.ids['camera']
@@ -431,19 +1332,24 @@ class CaptureImageScreen(Screen):
             else :
                 inputfilepath = self.getname_inputfilepath(default=True)
 
+            image = None
             if self.is_android() :
-                tmp_inputfilepath = os.path.join(SETTINGS["imagepath"],
-                                                 "GRD_tmp.png")
-                camera.texture.save(filename=tmp_inputfilepath)
-                # image from camera has been rotated for screen (see .kv)
-                image = Image.open(tmp_inputfilepath)
-                rotated_image = image.rotate(-90, expand=True)
-                rotated_image.save(inputfilepath)
+                # image kept in memory (file only if savinginputfile).
+                # image from camera has been rotated for screen (see .kv) :
+                # flip (texture rows bottom-up) + rotation -90 = TRANSPOSE
+                with metrics.span("rotation") :
+                    image = texture_image(camera.texture, Image.TRANSPOSE)
+                if SETTINGS["savinginputfile"]==1 :
+                    image.save(inputfilepath)
+                    Logger.info("App : [capture] Image captured, saved as file %s" %
+                                (inputfilepath))
+                else :
+                    inputfilepath = ""
+                    Logger.info("App : [capture] Image captured, kept in memory")
             else :
                 camera.export_to_png(inputfilepath)
-
-            Logger.info("App : [capture] Image captured, saved as file %s" %
-                        (inputfilepath))
+                Logger.info("App : [capture] Image captured, saved as file %s" %
+                            (inputfilepath))
 
             if SETTINGS["expert"] == 1 :
                 Logger.info("App : [capture] 'Expert' mode : display image XP")
@@ -451,22 +1357,54 @@ class CaptureImageScreen(Screen):
             else :
                 Logger.info("App : [capture] NOT 'Expert' mode : display image")
                 n = 'displayimage'
+            capture_span.end(saved=int(bool(inputfilepath)))
             sm.current = n
-            screen = sm.screens[sm.number[n]]
-            screen.ids.imagepath.text = inputfilepath
-            screen.ids.imageView.reload()
+            screen = sm.screen(n)
+            screen.set_image(filepath=inputfilepath, image=image)
             screen.angle = 0
+            return screen
 
         except Exception as e :
+            capture_span.end(error=type(e).__name__) # (if not yet ended)
             failed_msg(e)
 
 #------------------------------------------------------------------------------
 
 class VisualSudokuScreenManager(ScreenManager):
+    """Screens built at their first use (see add_builder), not at App start
+    (only the main screen)"""
 
     def __init__(self,**kwargs):
         super().__init__(**kwargs)
-        self.number = dict()
+        self.builders = dict() # screen name : function returning the screen
+        self.transition_span = metrics.NULL_SPAN
+
+    def add_builder(self, name, builder):
+        self.builders[name] = builder
+
+    def add_screen(self, screen):
+        self.add_widget(screen)
+        screen.bind(on_enter=self.end_transition)
+
+    def screen(self, name):
+        """Returns the screen name (built if not yet)"""
+        if not self.has_screen(name) and name in self.builders :
+            Logger.info("App : [screen] : building %s screen" % (name))
+            self.add_screen(self.builders.pop(name)())
+        return self.get_screen(name)
+
+    def on_current(self, instance, value):
+        """Screen transition timing : until on_enter (see end_transition)"""
+        self.screen(value) # (built before the transition)
+        if self.current_screen is not None and \
+           self.current_screen.name != value : # (not the first screen)
+            self.transition_span.end(interrupted=1)
+            self.transition_span = metrics.span("transition", screen=value)
+        super().on_current(instance, value)
+
+    def end_transition(self, *args):
+        self.transition_span.end()
+        self.transition_span = metrics.NULL_SPAN
 
 #------------------------------------------------------------------------------
 
@@ -485,7 +1423,17 @@ class VisualSudokuApp(App):
         return { 'expert': 0,
                  'imagepath': get_img_path(),
                  'savingoutputfile': 1,
-                 'savinginputfile': 0 }
+                 'savinginputfile': 0,
+                 'uploadsize': UPLOAD_MAX_SIDE,
+                 'gridcrop': 1,
+                 'compact': 0,
+                 'wsurl': URL_VSUDOKU,
+                 'speculative': 0, # (opt-in : uploads the viewed images)
+                 'sweep': 0,
+                 'adaptivetime': 0,
+                 'timemax': TIME_MAX,
+                 'historymax': HISTORY_MAX_BYTES//(1024*1024),
+                 'metrics': 0 }
 
     @classmethod
     def set_default_settings(cls, settings) :
@@ -503,6 +1451,16 @@ class VisualSudokuApp(App):
         settings['imagepath'] = config.get('app', 'imagepath')
         settings['savingoutputfile'] = config.getint('app', 'savingoutputfile')
         settings['savinginputfile'] = config.getint('app', 'savinginputfile')
+        settings['uploadsize'] = config.getint('app', 'uploadsize')
+        settings['gridcrop'] = config.getint('app', 'gridcrop')
+        settings['compact'] = config.getint('app', 'compact')
+        settings['wsurl'] = config.get('app', 'wsurl')
+        settings['speculative'] = config.getint('app', 'speculative')
+        settings['sweep'] = config.getint('app', 'sweep')
+        settings['adaptivetime'] = config.getint('app', 'adaptivetime')
+        settings['timemax'] = config.getint('app', 'timemax')
+        settings['historymax'] = config.getint('app', 'historymax')
+        settings['metrics'] = config.getint('app', 'metrics')
 
     def build_config(self, config): # before build()
         """ setting values into config
@@ -519,6 +1477,17 @@ class VisualSudokuApp(App):
         config.setdefaults('kivy', {'log_name': log_name, 'log_dir': log_dir,
                                     'log_maxfiles':20 })
 
+    def set_metrics(self):
+        """Metrics recording (see metrics.py) according to SETTINGS"""
+
+        try :
+            if SETTINGS["metrics"] == 1 :
+                metrics.enable(get_img_path())
+            else :
+                metrics.disable()
+        except OSError as e :
+            Logger.warning("App : [set_metrics] : %s" % (e))
+
     def build_settings(self, settings): # called by open_settings()
         """Build Settings screen (+ Kivy by default) """
 
@@ -531,6 +1500,7 @@ class VisualSudokuApp(App):
                                                      section, key, value)
         if section == 'app' :
             self.set_settings(SETTINGS, config)
+            self.set_metrics()
             Logger.info("App : [on_config_change] end : SETTINGS= %s" %
                         (SETTINGS))
 
@@ -624,8 +1594,8 @@ class VisualSudokuApp(App):
         elif button_id == 'b_FILE' : 
             self.manager.current = 'selectimagefile'
             sm = self.manager
-            screen = sm.screens[sm.number['selectimagefile']]
-            screen.ids.fc._update_files()
+            screen = sm.screen('selectimagefile')
+            screen.open_gallery(SETTINGS["imagepath"])
         elif button_id == 'b_CAMERA' :
             self.manager.current = 'captureimage'
         else : # b_home, default
@@ -690,7 +1660,9 @@ class VisualSudokuApp(App):
             text = "- keep : Percentage of the center of cell images to be kept\n"
             text += "- border : Enlarge the cell image region by some extra percentage\n"
             text += "- time : CPU time limit in seconds for solving sudoku\n"
+            text += "  (not used with 'adaptivetime' setting)\n"
             text += "- Note : try keep=40 and border=15 if the hand-digits cross cell boundaries\n"
+            text += "  (or 'sweep' setting : these values tried at the same time)\n"
             s = ScrollPopupMsg()
             s.build(title="Parameters", text=text, rgba_color=params_color)
             s.open()
@@ -713,6 +1685,89 @@ class VisualSudokuApp(App):
         Logger.debug("App : [callback] : My button <%s> state is <%s>" %
                      (instance, value))
 
+    #--------------------------------------------------------------------------
+    # screens (see VisualSudokuScreenManager.screen)
+    #--------------------------------------------------------------------------
+
+    def build_set_screen(self):
+        set_screen = SetScreen(name='set')
+        ids = set_screen.ids
+        s = self.create_settings()
+        ids.settings_content.add_widget(s)
+        ids.reset_settings_msg.bind(on_press=self.reset_settings_msg)
+        return set_screen
+
+    def build_captureimage_screen(self):
+        captureimage_screen = CaptureImageScreen(name='captureimage')
+        ids = captureimage_screen.ids
+        layout_menu_captureimage = BoxLayout(orientation='horizontal',
+                                             spacing=DEFAULT_SPACING,
+                                             padding=DEFAULT_PADDING,
+                                             size_hint=(1, 0.1))
+        self.classical_menu(layout=layout_menu_captureimage,
+                            b_home=True, b_quit=True,
+                            b_settings=True, b_file=True, b_camera=False)
+        ids.captureimage.add_widget(layout_menu_captureimage)
+        return captureimage_screen
+
+    def build_selectimagefile_screen(self):
+        selectimagefile_screen = SelectImageFileScreen(name='selectimagefile')
+        ids = selectimagefile_screen.ids
+        layout_menu_selectimagefile = BoxLayout(orientation='horizontal',
+                                                spacing=DEFAULT_SPACING,
+                                                padding=DEFAULT_PADDING,
+                                                size_hint=(1, 0.1))
+        self.classical_menu(layout=layout_menu_selectimagefile,
+                            b_home=True, b_quit=True,
+                            b_settings=True, b_file=False, b_camera=True)
+        ids.selectimagefile.add_widget(layout_menu_selectimagefile)
+        return selectimagefile_screen
+
+    def build_displayimage_screen(self):
+        displayimage_screen = DisplayImageScreen(name='displayimage')
+        ids = displayimage_screen.ids
+        layout_menu_displayimage = BoxLayout(orientation='horizontal',
+                                             spacing=DEFAULT_SPACING,
+                                             padding=DEFAULT_PADDING,
+                                             size_hint=(1, 0.1))
+        self.classical_menu(layout=layout_menu_displayimage,
+                            b_home=True, b_quit=True,
+                            b_settings=True, b_file=True, b_camera=True)
+        ids.displayimage.add_widget(layout_menu_displayimage)
+        return displayimage_screen
+
+    def build_displayimagexp_screen(self):
+        displayimagexp_screen = DisplayImageScreenXp(name='displayimagexp')
+        ids = displayimagexp_screen.ids
+        layout_parameters = BoxLayout(orientation='horizontal',
+                                      size_hint=(1, 0.3))
+        self.parameters_part(layout=layout_parameters, ids=ids)
+        for name in ('keep', 'border', 'time') :
+            ids[name].bind(value=displayimagexp_screen.values_changed)
+        ids.displayimage.add_widget(layout_parameters)
+        layout_menu_displayimagexp = BoxLayout(orientation='horizontal',
+                                               spacing=DEFAULT_SPACING,
+                                               padding=DEFAULT_PADDING,
+                                               size_hint=(1, 0.1))
+        self.classical_menu(layout=layout_menu_displayimagexp,
+                            b_home=True, b_quit=True,
+                            b_settings=True, b_file=True, b_camera=True)
+        ids.displayimage.add_widget(layout_menu_displayimagexp)
+        return displayimagexp_screen
+
+    def build_displaysolution_screen(self):
+        displaysolution_screen = DisplaySolutionScreen(name='displaysolution')
+        ids = displaysolution_screen.ids
+        layout_menu_displaysolution = BoxLayout(orientation='horizontal',
+                                                spacing=DEFAULT_SPACING,
+                                                padding=DEFAULT_PADDING,
+                                                size_hint=(1, 0.1))
+        self.classical_menu(layout=layout_menu_displaysolution,
+                            b_home=True, b_quit=True,
+                            b_settings=True, b_file=True, b_camera=True)
+        ids.displaysolution.add_widget(layout_menu_displaysolution)
+        return displaysolution_screen
+
     def build(self):
 
         try:
@@ -768,107 +1823,35 @@ class VisualSudokuApp(App):
                                 b_camera=True, t_camera=t_camera)
             ids.main.add_widget(layout_menu_main)
 
-            sm.add_widget(main_screen)
-
-            # set screen ------------------------------------------------------
+            sm.add_screen(main_screen)
 
             self.set_default_settings(SETTINGS)
             self.set_settings(SETTINGS, self.config)
+            self.set_metrics()
+            textures.max_bytes = INI['textures_max_size']*1024*1024
             Logger.info("App : [build] : SETTINGS= %s" % (SETTINGS))
 
-            set_screen = SetScreen(name='set')
-            ids = set_screen.ids
-            s = self.create_settings()
-            ids.settings_content.add_widget(s)
-            ids.reset_settings_msg.bind(on_press=self.reset_settings_msg)
-            sm.add_widget(set_screen)
-
-            # captureimage screen ---------------------------------------------
-
-            captureimage_screen = CaptureImageScreen(name='captureimage')
-            ids = captureimage_screen.ids
-            layout_menu_captureimage = BoxLayout(orientation='horizontal',
-                                                 spacing=DEFAULT_SPACING,
-                                                 padding=DEFAULT_PADDING,
-                                                 size_hint=(1, 0.1))
-            self.classical_menu(layout=layout_menu_captureimage,
-                                b_home=True, b_quit=True,
-                                b_settings=True, b_file=True, b_camera=False)
-            ids.captureimage.add_widget(layout_menu_captureimage)
-            sm.add_widget(captureimage_screen)
-
-            # selectimagefile screen ------------------------------------------
-
-            selectimagefile_screen = SelectImageFileScreen(
-                                                       name='selectimagefile')
-            ids = selectimagefile_screen.ids
-            ids.fc.bind(selection=selectimagefile_screen.select_file)
-            ids.fc.path = SETTINGS["imagepath"]
-            layout_menu_selectimagefile = BoxLayout(orientation='horizontal',
-                                                    spacing=DEFAULT_SPACING,
-                                                    padding=DEFAULT_PADDING,
-                                                    size_hint=(1, 0.1))
-            self.classical_menu(layout=layout_menu_selectimagefile,
-                                b_home=True, b_quit=True,
-                                b_settings=True, b_file=False, b_camera=True)
-            ids.selectimagefile.add_widget(layout_menu_selectimagefile)
-            sm.add_widget(selectimagefile_screen)
-
-            # displayimage screen ---------------------------------------------
-
-            displayimage_screen = DisplayImageScreen(name='displayimage')
-            ids = displayimage_screen.ids
-            layout_menu_displayimage = BoxLayout(orientation='horizontal',
-                                                 spacing=DEFAULT_SPACING,
-                                                 padding=DEFAULT_PADDING,
-                                                 size_hint=(1, 0.1))
-            self.classical_menu(layout=layout_menu_displayimage,
-                                b_home=True, b_quit=True,
-                                b_settings=True, b_file=True, b_camera=True)
-            ids.displayimage.add_widget(layout_menu_displayimage)
-            sm.add_widget(displayimage_screen)
-
-            # displayimagexp screen -------------------------------------------
-
-            displayimagexp_screen = DisplayImageScreenXp(name='displayimagexp')
-            ids = displayimagexp_screen.ids
-            layout_parameters = BoxLayout(orientation='horizontal',
-                                          size_hint=(1, 0.3))
-            self.parameters_part(layout=layout_parameters, ids=ids)
-            ids.displayimage.add_widget(layout_parameters)
-            layout_menu_displayimagexp = BoxLayout(orientation='horizontal',
-                                                   spacing=DEFAULT_SPACING,
-                                                   padding=DEFAULT_PADDING,
-                                                   size_hint=(1, 0.1))
-            self.classical_menu(layout=layout_menu_displayimagexp,
-                                b_home=True, b_quit=True,
-                                b_settings=True, b_file=True, b_camera=True)
-            ids.displayimage.add_widget(layout_menu_displayimagexp)
-            sm.add_widget(displayimagexp_screen)
-
-            # displaysolution screen ------------------------------------------
-
-            displaysolution_screen = DisplaySolutionScreen(
-                                                        name='displaysolution')
-            ids = displaysolution_screen.ids
-            layout_menu_displaysolution = BoxLayout(orientation='horizontal',
-                                                    spacing=DEFAULT_SPACING,
-                                                    padding=DEFAULT_PADDING,
-                                                    size_hint=(1, 0.1))
-            self.classical_menu(layout=layout_menu_displaysolution,
-                                b_home=True, b_quit=True,
-                                b_settings=True, b_file=True, b_camera=True)
-            ids.displaysolution.add_widget(layout_menu_displaysolution)
-            sm.add_widget(displaysolution_screen)
-
-            for n,screen in enumerate(sm.screens) :
-                sm.number[screen.name] = n
+            # other screens, built at their first use
+            for (name, builder) in (
+                            ('set', self.build_set_screen),
+                            ('captureimage', self.build_captureimage_screen),
+                            ('selectimagefile',
+                                          self.build_selectimagefile_screen),
+                            ('displayimage', self.build_displayimage_screen),
+                            ('displayimagexp',
+                                           self.build_displayimagexp_screen),
+                            ('displaysolution',
+                                         self.build_displaysolution_screen)) :
+                sm.add_builder(name, builder)
 
             return sm
 
         except Exception as e :
             failed_msg(e)
 
+    def on_start(self):
+        Clock.schedule_once(preload, INI['preload_delay'])
+
     def do_quit(self, *args):
         VisualSudokuApp.get_running_app().stop()
         os._exit(0)
@@ -0,0 +1,158 @@
+""" Solve flow metrics : timing spans written as JSON lines into a rolling file
+(METRICS_FILENAME, into the images folder next to the kivy log)
+
+    with span("cr_solve", compact=0) :
+        ...
+
+    s = span("transition", screen="displaysolution") # started
+    ...
+    s.end()
+
+Each line : {"t": end time (epoch), "span": name, "ms": duration, ...fields}
+("error" field : exception type if the with block raised).
+
+Disabled by default ('metrics' setting) : span() then returns the shared
+NULL_SPAN whose methods do nothing, record() returns at once.
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import json
+import time
+import threading
+from time import perf_counter
+
+METRICS_FILENAME = "metrics.jsonl"
+MAX_BYTES = 1024*1024 # rollover size of the metrics file
+BACKUP_COUNT = 3 # metrics.jsonl.1 ... metrics.jsonl.3 kept
+
+class _Writer(object):
+    """JSON lines appended to path, rolled over beyond max_bytes"""
+
+    def __init__(self, path, max_bytes=MAX_BYTES, backups=BACKUP_COUNT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        self._file = open(path, 'at')
+
+    def write(self, record):
+        line = json.dumps(record, separators=(',', ':')) + "\n"
+        with self._lock :
+            if self._file is None :
+                return
+            if self._file.tell() + len(line) > self.max_bytes :
+                self._rollover()
+            self._file.write(line)
+            self._file.flush()
+
+    def _rollover(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1) :
+            if os.path.exists("%s.%d" % (self.path, i)) :
+                os.replace("%s.%d" % (self.path, i),
+                           "%s.%d" % (self.path, i + 1))
+        if self.backups > 0 :
+            os.replace(self.path, self.path + ".1")
+        else :
+            os.remove(self.path)
+        self._file = open(self.path, 'at')
+
+    def close(self):
+        with self._lock :
+            if self._file is not None :
+                self._file.close()
+                self._file = None
+
+_writer = None
+
+def enable(dirpath, filename=METRICS_FILENAME, max_bytes=MAX_BYTES,
+           backups=BACKUP_COUNT):
+    """Starts recording into dirpath/filename"""
+
+    global _writer
+    path = os.path.join(dirpath, filename)
+    if _writer is not None and _writer.path == path :
+        return
+    disable()
+    _writer = _Writer(path, max_bytes, backups)
+
+def disable():
+    global _writer
+    writer = _writer
+    _writer = None
+    if writer is not None :
+        writer.close()
+
+def is_enabled():
+    return _writer is not None
+
+def record(name, duration, **fields):
+    """Records a duration (seconds) measured elsewhere"""
+
+    writer = _writer
+    if writer is None :
+        return
+    fields["t"] = round(time.time(), 3)
+    fields["span"] = name
+    fields["ms"] = round(1000 * duration, 2)
+    writer.write(fields)
+
+class Span(object):
+    """Timing started at creation, recorded by end() (once)"""
+
+    __slots__ = ("name", "fields", "start")
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.start = perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None :
+            self.fields["error"] = exc_type.__name__
+        self.end()
+        return False
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def end(self, **fields):
+        if self.start is None :
+            return
+        duration = perf_counter() - self.start
+        self.start = None
+        self.fields.update(fields)
+        record(self.name, duration, **self.fields)
+
+class _NullSpan(object):
+    """Span of disabled metrics"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, **fields):
+        pass
+
+    def end(self, **fields):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+def span(name, **fields):
+    """Returns a started Span (NULL_SPAN if metrics disabled)"""
+
+    if _writer is None :
+        return NULL_SPAN
+    return Span(name, fields)
@@ -0,0 +1,103 @@
+""" Preprocessing of the grid image before uploading it
+
+The image is reduced (maximal side), converted to grayscale, optionally
+cropped to the rectified grid, and re-encoded (JPEG or WEBP) in memory, so
+that much less bytes are sent over the network.
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import io
+import os
+from PIL import Image, ImageOps
+import grid
+
+UPLOAD_MAX_SIDE = 1280 # pixels
+UPLOAD_FORMAT = 'JPEG' # 'JPEG' or 'WEBP'
+UPLOAD_QUALITY = 85
+UPLOAD_GRAYSCALE = True
+
+EXTENSIONS = {'JPEG': '.jpg', 'WEBP': '.webp'}
+
+def open_image(image):
+    """Returns PIL image from image (file path, bytes or PIL image)"""
+
+    if isinstance(image, Image.Image) :
+        return image
+    if isinstance(image, (bytes, bytearray)) :
+        image = io.BytesIO(image)
+    return Image.open(image)
+
+def prepare_image(image, max_side=UPLOAD_MAX_SIDE, grayscale=UPLOAD_GRAYSCALE,
+                  grid_side=0):
+    """Returns (img, grid_found), img being the PIL image to be uploaded
+
+    image : file path, bytes or PIL image.
+    The image is reduced so that its largest side is at most max_side, and
+    converted to grayscale if grayscale.
+    If grid_side, the outer grid is searched into the image and img is only
+    the grid rectified as a grid_side square (see grid.py). If no grid
+    found, img is the whole image (grid_found False).
+    """
+
+    img = open_image(image)
+    if img.format == 'JPEG' : # faster decoding, at reduced size
+        img.draft('L' if grayscale else 'RGB', (max_side, max_side))
+    img = ImageOps.exif_transpose(img) # orientation, EXIF being not kept
+    if grayscale :
+        img = img.convert('L')
+    elif img.mode not in ('RGB', 'L') :
+        img = img.convert('RGB')
+    if max(img.size) > max_side :
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    grid_found = False
+    if grid_side and grid.is_available() :
+        np = grid.np
+        gray = np.asarray(img if img.mode == 'L' else img.convert('L'))
+        corners = grid.find_grid(gray)
+        if corners is not None :
+            channels = np.asarray(img)
+            size = grid.rectified_size(corners, grid_side)
+            img = Image.fromarray(grid.warp_grid(channels, corners, size))
+            grid_found = True
+    return (img, grid_found)
+
+def encode_image(img, fmt=UPLOAD_FORMAT, quality=UPLOAD_QUALITY):
+    """Returns (content, extension) of PIL img encoded as fmt"""
+
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, quality=quality)
+    return (buffer.getvalue(), EXTENSIONS[fmt])
+
+def prepare_upload(image, max_side=UPLOAD_MAX_SIDE, fmt=UPLOAD_FORMAT,
+                   quality=UPLOAD_QUALITY, grayscale=UPLOAD_GRAYSCALE,
+                   grid_side=0):
+    """Returns (content, extension) of the image to be uploaded
+
+    image : file path, bytes or PIL image.
+    See prepare_image for max_side, grayscale, grid_side, and encode_image
+    for fmt, quality.
+    The original file content is kept if it is not bigger (file path case)
+    and no grid has been found (a found grid is always sent as cropped, the
+    server then reading the same grid as the one shown to the user).
+    """
+
+    original = None
+    if isinstance(image, str) :
+        with open(image, 'rb') as f :
+            original = f.read()
+        (img, grid_found) = prepare_image(original, max_side, grayscale,
+                                          grid_side)
+    else :
+        (img, grid_found) = prepare_image(image, max_side, grayscale,
+                                          grid_side)
+    (content, extension) = encode_image(img, fmt, quality)
+
+    if (original is not None and not grid_found
+        and len(original) <= len(content)) :
+        content = original
+        extension = os.path.splitext(image)[1]
+    return (content, extension)
@@ -0,0 +1,99 @@
+""" Image previews : the image files are shown at (about) the screen size,
+not decoded and uploaded to the GPU at their full resolution
+
+    image = load_preview(filepath, max_side) # PIL image, max_side at most
+
+JPEG files are decoded directly at a reduced scale of the decoder (1/2,
+1/4 or 1/8 : the smallest level of this pyramid whose side is at least
+PYRAMID_SLACK * max_side, a level a bit smaller than max_side being kept as
+is), then reduced to max_side if larger. Other formats are decoded at full
+size then reduced.
+
+The previews (as textures) are kept into a TextureCache, bounded by the
+memory of their pixels, least recently used ones released first :
+
+    cache = TextureCache(max_bytes)
+    texture = cache.get(key) # None if not into cache
+    cache.put(key, texture, nbytes)
+    cache.release(key)
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import collections
+
+PREVIEW_MAX_SIDE = 2048 # pixels, largest side of the previews (default)
+PYRAMID_SLACK = 0.8 # JPEG decoding scale : side >= PYRAMID_SLACK*max_side
+TEXTURES_MAX_BYTES = 32*1024*1024 # default texture cache maximal size
+
+def preview_key(filepath, max_side):
+    """Returns the cache key of filepath preview (modified file : new key)"""
+
+    stat = os.stat(filepath)
+    return (filepath, stat.st_mtime, stat.st_size, max_side)
+
+def reduce_image(img, max_side):
+    """Returns img (PIL) reduced so that its largest side is at most
+    max_side (img itself if already small enough)"""
+
+    if max(img.size) <= max_side :
+        return img
+    from PIL import Image
+    img = img.copy()
+    img.thumbnail((max_side, max_side), Image.BILINEAR)
+    return img
+
+def load_preview(filepath, max_side=PREVIEW_MAX_SIDE):
+    """Returns the PIL image of filepath file, reduced so that its largest
+    side is at most max_side"""
+
+    from PIL import Image
+    img = Image.open(filepath)
+    (w, h) = img.size
+    scale = PYRAMID_SLACK * max_side / max(w, h)
+    if img.format == 'JPEG' and scale < 1 : # decoded at a reduced scale
+        img.draft(img.mode, (int(w * scale + 0.5), int(h * scale + 0.5)))
+    img.load()
+    return reduce_image(img, max_side)
+
+class TextureCache(object):
+    """Textures by key, least recently used ones released once the total of
+    their bytes exceeds max_bytes (main thread only, as the textures)"""
+
+    def __init__(self, max_bytes=TEXTURES_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._textures = collections.OrderedDict() # key : (texture, nbytes)
+
+    def __len__(self):
+        return len(self._textures)
+
+    def get(self, key):
+        value = self._textures.get(key)
+        if value is None :
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._textures.move_to_end(key)
+        return value[0]
+
+    def put(self, key, texture, nbytes):
+        self.release(key)
+        self._textures[key] = (texture, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes and len(self._textures) > 1 :
+            self.release(next(iter(self._textures)))
+
+    def release(self, key):
+        value = self._textures.pop(key, None)
+        if value is not None :
+            self.nbytes -= value[1]
+
+    def clear(self):
+        self._textures.clear()
+        self.nbytes = 0
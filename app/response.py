@@ -0,0 +1,165 @@
+""" Analysis of the response of read_and_solve : solution image, or text
+containing error information (cr_solve), or solution digits
+(cr_solve_digits)
+
+The web service response is classified in memory (see classify), from its
+HTTP status, Content-Type and first bytes (magic numbers), before anything
+is written. The error text is extracted from the response ("[ERROR]"
+lines) instead of a generic failure message.
+
+Without kivy, so that the solve path can also be run out of the App (see
+tools/bench_e2e.py).
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import logging
+
+from solution import read_solution
+
+Logger = logging.getLogger('kivy') # kivy Logger (without importing kivy)
+
+FAILURE = "Solving FAILURE"
+ERROR_TAG = "[ERROR]"
+SNIFF_SIZE = 16 # bytes enough to recognize the magic numbers
+MAX_ERROR_LENGTH = 200 # characters of error text kept
+
+MAGIC = ((b'\xff\xd8\xff', 'image/jpeg'),
+         (b'\x89PNG\r\n\x1a\n', 'image/png'),
+         (b'GIF87a', 'image/gif'),
+         (b'GIF89a', 'image/gif'),
+         (b'BM', 'image/bmp'),
+         (b'PK\x03\x04', 'application/zip'))
+
+def is_a_file(filepath):
+    if os.path.exists(filepath):
+        if os.path.isfile(filepath):
+            return True
+    return False
+
+def sniff(head):
+    """Returns the mime type of content from its first bytes head, None if
+    unknown"""
+
+    for (magic, mime_type) in MAGIC :
+        if head.startswith(magic) :
+            return mime_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP' :
+        return 'image/webp'
+    return None
+
+def decode_text(content):
+    """Returns content decoded as text, None if not text"""
+
+    try :
+        text = bytes(content).decode('utf-8')
+    except UnicodeDecodeError :
+        return None
+    if '\x00' in text :
+        return None
+    return text
+
+def error_text(text):
+    """Returns the error information of text : its "[ERROR]" lines (without
+    the tag), else its first line"""
+
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    errors = [line[len(ERROR_TAG):].strip(" :") for line in lines
+              if line.startswith(ERROR_TAG)]
+    detail = "; ".join(errors) if errors else (lines[0] if lines else "")
+    if len(detail) > MAX_ERROR_LENGTH :
+        detail = detail[:MAX_ERROR_LENGTH] + "..."
+    return detail
+
+def failure(detail=""):
+    return "{} : {}".format(FAILURE, detail) if detail else FAILURE
+
+def classify(status_code, content_type, content, returned_type='stdout'):
+    """Returns (cr_ok, error_txt) of a web service response
+
+    returned_type 'stdout' : cr_ok if content is an image. Else ('stdout.txt',
+    'run.zip') : cr_ok if content (text or zip) contains a solution.
+    """
+
+    content_type = (content_type or "").split(';')[0].strip().lower()
+    kind = sniff(bytes(content[:SNIFF_SIZE]))
+    text = None if kind is not None else decode_text(content)
+
+    if status_code != 200 :
+        detail = "server error (HTTP {})".format(status_code)
+        if text and error_text(text) :
+            detail += " " + error_text(text)
+        return (False, failure(detail))
+    if not content :
+        return (False, failure("empty response"))
+
+    if returned_type == 'stdout' :
+        if kind is not None and kind.startswith('image/') :
+            return (True, "")
+    elif kind == 'application/zip' or text is not None :
+        if read_solution(bytes(content))[1] is not None :
+            return (True, "")
+
+    if text is not None :
+        return (False, failure(error_text(text)))
+    if content_type.startswith('image/') :
+        return (False, failure("invalid image ({}, {} bytes)".format(
+                                                  content_type, len(content))))
+    return (False, failure("unexpected response ({}, {} bytes)".format(
+                             kind or content_type or "unknown", len(content))))
+
+def cr_solve(outputfilepath, response=None) :
+    """Analyze the solution/response from read_and_solve
+
+    Returns (cr_ok, error_txt). response : (cr_ok, error_txt) returned by
+    read_and_solve ("WS" mode, response classified in memory, see classify),
+    else None : outputfilepath file (solution image, or txt file containing
+    error information) is analyzed from its first bytes.
+    """
+
+    if response is not None :
+        (cr_ok, error_txt) = response
+        Logger.debug("App : [cr_solve] : response cr_ok %s %s" %
+                     (cr_ok, error_txt))
+        return (cr_ok, error_txt)
+
+    if not is_a_file(outputfilepath):
+        Logger.debug("App : [cr_solve] : file %s not is_a_file" %
+                     (outputfilepath))
+        return (False, FAILURE)
+
+    with open(outputfilepath, 'rb') as f :
+        head = f.read(SNIFF_SIZE)
+        kind = sniff(head)
+        if kind is not None and kind.startswith('image/') :
+            return (True, "")
+        text = decode_text(head + f.read())
+    Logger.debug("App : [cr_solve] : %s is not an image, containing : %s" %
+                 (outputfilepath, text))
+    return (False, failure(error_text(text) if text else ""))
+
+def cr_solve_digits(responsefilepath, response=None) :
+    """Analyze the compact response from read_and_solve (solution digits)
+
+    Returns (cr_ok, error_txt, givens, solution) (see solution.py).
+    response : see cr_solve.
+    """
+
+    if response is not None and not response[0] :
+        return (False, response[1], None, None)
+    (givens, solution) = (None, None)
+    text = None
+    if is_a_file(responsefilepath):
+        with open(responsefilepath, 'rb') as f :
+            content = f.read()
+        (givens, solution) = read_solution(content)
+        text = decode_text(content)
+    Logger.debug("App : [cr_solve_digits] : givens %s, solution %s" %
+                 (givens, solution))
+    if solution is None :
+        return (False, failure(error_text(text) if text else ""), givens,
+                solution)
+    return (True, "", givens, solution)
@@ -0,0 +1,127 @@
+""" Compact solution : recognized grid and solution digits, read from the text
+returned by the vsudoku web service (returned_type 'stdout.txt' or 'run.zip')
+
+A grid is a 81 characters string (rows one after the other), '0' for an empty
+cell.
+
+The grids are read from the text lines, whatever their layout : one line of
+81 cells, or 9 lines of 9 cells with or without separators ('|', '+', '-')
+where empty cells are written as '.', '_', '0', '*', '?' or ' ' (a ' ' empty
+cell being located thanks to the cells positions of a full row).
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import io
+import re
+import zipfile
+
+EMPTY = "0"
+
+_GRID_LINE = re.compile(r'^[\s|+\-:0-9._*?]+$') # no letter
+_CELL = re.compile(r'[0-9._*?]')
+_SEPARATOR_LINE = re.compile(r'^[\s|+\-=:]*$')
+
+def _cell(c):
+    return c if c in "123456789" else EMPTY
+
+def _full_row_positions(lines):
+    """Returns the cells positions into the first row of 9 cells, or None"""
+
+    for line in lines :
+        if _GRID_LINE.match(line) :
+            positions = [m.start() for m in _CELL.finditer(line)]
+            if len(positions) == 9 :
+                return positions
+    return None
+
+def _row(line, positions):
+    """Returns the 9 cells of line as a 9 characters string, or None"""
+
+    if not _GRID_LINE.match(line) :
+        return None
+    cells = _CELL.findall(line)
+    if len(cells) == 9 :
+        return "".join(_cell(c) for c in cells)
+    if positions is not None and 0 < len(cells) < 9 and \
+       len(line) > positions[-1] :
+        row = "".join(_cell(line[p]) for p in positions)
+        if len([c for c in row if c != EMPTY]) == len(cells) :
+            return row
+    return None
+
+def read_grids(text):
+    """Returns the list of grids found into text"""
+
+    lines = [line.rstrip() for line in text.splitlines()]
+    positions = _full_row_positions(lines)
+    grids = list()
+    rows = list()
+    for line in lines :
+        compact = re.sub(r'\s', '', line)
+        if len(compact) == 81 and all(_CELL.match(c) for c in compact) :
+            grids.append("".join(_cell(c) for c in compact))
+            rows = list()
+            continue
+        row = _row(line, positions)
+        if row is not None :
+            rows.append(row)
+            if len(rows) == 9 :
+                grids.append("".join(rows))
+                rows = list()
+        elif not _SEPARATOR_LINE.match(line) :
+            rows = list() # rows have to be consecutive
+    return grids
+
+def is_solution(grid, givens=None):
+    """Returns True if grid is a sudoku solution (of givens if given)"""
+
+    if len(grid) != 81 or EMPTY in grid :
+        return False
+    digits = set("123456789")
+    for i in range(9) :
+        row = grid[9*i:9*i+9]
+        col = grid[i::9]
+        (r, c) = (3*(i//3), 3*(i%3))
+        box = "".join(grid[9*(r+k)+c:9*(r+k)+c+3] for k in range(3))
+        if set(row) != digits or set(col) != digits or set(box) != digits :
+            return False
+    if givens is not None :
+        for (g, s) in zip(givens, grid) :
+            if g != EMPTY and g != s :
+                return False
+    return True
+
+def response_text(content):
+    """Returns the text of the response content (text, or zip whose text
+    files are concatenated)"""
+
+    if content[:2] == b'PK' :
+        texts = list()
+        with zipfile.ZipFile(io.BytesIO(content)) as z :
+            for name in z.namelist() :
+                try :
+                    texts.append(z.read(name).decode('utf-8'))
+                except UnicodeDecodeError : # not a text file
+                    pass
+        return "\n".join(texts)
+    return content.decode('utf-8', errors='replace')
+
+def read_solution(content):
+    """Returns (givens, solution) from response content (bytes)
+
+    givens is the recognized grid (first grid, even if already full, when
+    followed by other grids ; None if unknown : only one grid, solution),
+    solution the last grid that is a solution (None if no solution found).
+    """
+
+    grids = read_grids(response_text(content))
+    givens = None
+    if len(grids) > 1 or (grids and not is_solution(grids[0])) :
+        givens = grids[0]
+    for grid in reversed(grids) :
+        if is_solution(grid, givens) :
+            return (givens, grid)
+    return (givens, None)
@@ -0,0 +1,6 @@
+""" Visual sudoku local engine ("LOCAL" mode) : grid detection, cells
+extraction, digits classification and solving, on the device """
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
@@ -0,0 +1,157 @@
+""" Cells extraction : the 81 cells images of a rectified grid, and the digit
+image (if any) of each cell, as classifier input """
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import numpy as np
+import cv2
+
+DIGIT_SIZE = 28 # classifier input side (pixels)
+DIGIT_BOX = 20 # digit side into classifier input (MNIST like)
+MIN_FILL = 0.01 # minimal ratio of digit pixels into a not empty cell
+MIN_HEIGHT = 0.2 # minimal digit height (ratio of the cell height)
+
+def cell_region(shape, row, col, keep=0, border=0):
+    """Returns (y0, y1, x0, x1) region of cell (row, col) into grid of shape
+
+    border : enlarge the cell region by border percent (each side).
+    keep : keep only the keep percent center of the (enlarged) region
+    (0 : whole region).
+    """
+
+    (h, w) = shape[:2]
+    (ch, cw) = (h / 9.0, w / 9.0)
+    (y0, y1, x0, x1) = (row*ch, (row+1)*ch, col*cw, (col+1)*cw)
+    if border :
+        (dy, dx) = (ch*border/100.0, cw*border/100.0)
+        (y0, y1, x0, x1) = (y0-dy, y1+dy, x0-dx, x1+dx)
+    if keep :
+        (dy, dx) = ((y1-y0)*(100-keep)/200.0, (x1-x0)*(100-keep)/200.0)
+        (y0, y1, x0, x1) = (y0+dy, y1-dy, x0+dx, x1-dx)
+    return (max(0, int(round(y0))), min(h, int(round(y1))),
+            max(0, int(round(x0))), min(w, int(round(x1))))
+
+def binarize(grid):
+    """Returns the binary image (digits white on black) of grid (rectified
+    gray grid image), where the grid lines have been removed"""
+
+    cell = grid.shape[0] // 9
+    block = max(3, (cell // 3) | 1) # odd
+    thresh = cv2.adaptiveThreshold(grid, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                   cv2.THRESH_BINARY_INV, block, 10)
+    length = max(1, int(0.8*cell)) # lines longer than a digit
+    horizontal = cv2.morphologyEx(thresh, cv2.MORPH_OPEN,
+                     cv2.getStructuringElement(cv2.MORPH_RECT, (length, 1)))
+    vertical = cv2.morphologyEx(thresh, cv2.MORPH_OPEN,
+                     cv2.getStructuringElement(cv2.MORPH_RECT, (1, length)))
+    lines = cv2.dilate(cv2.bitwise_or(horizontal, vertical),
+                       np.ones((3, 3), dtype="uint8"))
+    return cv2.bitwise_and(thresh, cv2.bitwise_not(lines))
+
+def extract_digit(cell):
+    """Returns the digit image (DIGIT_SIZE square, float in [0,1], white
+    digit on black) of cell (binary image, see binarize), or None if empty
+    cell"""
+
+    (count, labels, stats, centroids) = cv2.connectedComponentsWithStats(
+                                                                   cell, 8)
+    if count < 2 :
+        return None
+    label = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    (x, y, w, h, area) = stats[label]
+    if area < MIN_FILL * cell.size or h < MIN_HEIGHT * cell.shape[0] :
+        return None
+
+    digit = np.where(labels[y:y+h, x:x+w] == label, 255, 0).astype("uint8")
+    return _normalize(digit)
+
+def _normalize(digit, result=None):
+    """Returns result (DIGIT_SIZE square) where digit (cropped component
+    image) has been resized into DIGIT_BOX and centered"""
+
+    (h, w) = digit.shape
+    scale = DIGIT_BOX / float(max(w, h))
+    (w, h) = (max(1, int(round(w*scale))), max(1, int(round(h*scale))))
+    digit = cv2.resize(digit, (w, h), interpolation=cv2.INTER_AREA)
+    if result is None :
+        result = np.zeros((DIGIT_SIZE, DIGIT_SIZE), dtype="float32")
+    (y, x) = ((DIGIT_SIZE-h)//2, (DIGIT_SIZE-w)//2)
+    result[y:y+h, x:x+w] = digit / 255.0
+    return result
+
+def cell_tensor(binary, keep=0, border=0):
+    """Returns (tensor, heights, widths) : the (81, h, w) tensor of the
+    cells images of binary (see binarize), rows one after the other, sliced
+    at once, and the real size of each cell region (arrays of 81 values)
+
+    Each cell region is the one of cell_region (see keep, border), at the
+    top left of its (h, w) image, the rest of which is black (h, w : largest
+    region size, regions being clipped at the grid sides).
+    """
+
+    shape = binary.shape[:2]
+    rows = np.array([cell_region(shape, r, 0, keep, border)[:2]
+                     for r in range(9)]) # (y0, y1) of the 9 cells rows
+    cols = np.array([cell_region(shape, 0, c, keep, border)[2:]
+                     for c in range(9)]) # (x0, x1) of the 9 cells columns
+    (hs, ws) = (rows[:, 1] - rows[:, 0], cols[:, 1] - cols[:, 0])
+    (h, w) = (max(1, int(hs.max())), max(1, int(ws.max())))
+    padded = np.pad(binary, ((0, 1), (0, 1)), mode="constant") # black
+    (dy, dx) = (np.arange(h)[None, :], np.arange(w)[None, :])
+    ys = np.where(dy < hs[:, None], rows[:, :1] + dy, shape[0]) # (9, h)
+    xs = np.where(dx < ws[:, None], cols[:, :1] + dx, shape[1]) # (9, w)
+    mosaic = padded[ys.ravel()][:, xs.ravel()] # (9*h, 9*w)
+    tensor = mosaic.reshape(9, h, 9, w).transpose(0, 2, 1, 3).reshape(81, h, w)
+    return (tensor, np.repeat(hs, 9), np.tile(ws, 9))
+
+def extract_digits(grid, keep=0, border=0):
+    """Returns (indices, digits) of grid (rectified gray grid image) :
+    indices of the not empty cells (0..80, rows one after the other) and
+    their digit images (float32 array (n, DIGIT_SIZE, DIGIT_SIZE), see
+    extract_digit), as classifier batch input
+
+    The cells with enough digit pixels are selected at once from the cells
+    tensor (see cell_tensor), then their connected components are labelled
+    at once, into a strip of their images separated by a black line. Same
+    result as extract_digit applied to each cell_region (thresholds from
+    the real size of each cell region).
+    """
+
+    (tensor, heights, widths) = cell_tensor(binarize(grid), keep, border)
+    (n, h, w) = tensor.shape
+    sizes = heights * widths
+    filled = np.count_nonzero(tensor.reshape(n, -1), axis=1)
+    candidates = np.flatnonzero((sizes > 0) & (filled >= MIN_FILL * sizes))
+    if not len(candidates) :
+        return (list(), np.zeros((0, DIGIT_SIZE, DIGIT_SIZE), dtype="float32"))
+
+    strip = np.zeros((len(candidates), h+1, w), dtype="uint8")
+    strip[:, :h] = tensor[candidates]
+    strip = strip.reshape(-1, w)
+    (count, labels, stats, centroids) = cv2.connectedComponentsWithStats(
+                                                                  strip, 8)
+    stats = stats[1:]
+    cell = stats[:, cv2.CC_STAT_TOP] // (h+1) # into candidates
+    # largest component of each cell (first label if same areas, as argmax)
+    order = np.lexsort((np.arange(len(stats)), -stats[:, cv2.CC_STAT_AREA],
+                        cell))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (cell[order][1:] != cell[order][:-1])
+    largest = np.full(len(candidates), -1)
+    largest[cell[order[first]]] = order[first]
+    selected = [k for k in range(len(candidates)) if largest[k] >= 0 and
+                stats[largest[k], cv2.CC_STAT_AREA] >=
+                    MIN_FILL * sizes[candidates[k]] and
+                stats[largest[k], cv2.CC_STAT_HEIGHT] >=
+                    MIN_HEIGHT * heights[candidates[k]]]
+    indices = [int(candidates[k]) for k in selected]
+
+    digits = np.zeros((len(indices), DIGIT_SIZE, DIGIT_SIZE), dtype="float32")
+    for (d, k) in enumerate(selected) :
+        (x, y, bw, bh, area) = stats[largest[k]]
+        digit = np.where(labels[y:y+bh, x:x+bw] == largest[k] + 1,
+                         255, 0).astype("uint8")
+        _normalize(digit, digits[d])
+    return (indices, digits)
@@ -0,0 +1,64 @@
+""" Digits classifier : model (.npz file, or Keras .h5 file) loaded once, and
+digits prediction """
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import numpy as np
+
+_models = dict() # loaded models, by file path
+
+def model_path(model):
+    """Returns model file path, model being absolute or relative to the
+    current folder or to the App folder"""
+
+    if os.path.isabs(model) or os.path.exists(model) :
+        return model
+    app_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(app_path, model)
+
+def load_model(model):
+    """Returns the model of model file (loaded at first call)
+
+    .npz model file (see npmodel.py) : NumPy only forward pass, else Keras
+    model file (.h5), that requires tensorflow.
+    """
+
+    path = model_path(model)
+    if path not in _models :
+        if path.endswith(".npz") :
+            from visualsudoku.npmodel import NumpyModel
+            _models[path] = NumpyModel(path)
+        else :
+            from tensorflow.keras.models import load_model as keras_load_model
+            _models[path] = keras_load_model(path)
+    return _models[path]
+
+def predict(model, digit):
+    """Returns (value, probabilities) of digit image (see cells.py)
+
+    value in 1..9 (class 0 ignored, cell being not empty)
+    """
+
+    probabilities = model.predict(digit.reshape(1, digit.shape[0],
+                                                digit.shape[1], 1),
+                                  verbose=0)[0]
+    value = int(np.argmax(probabilities[1:10])) + 1
+    return (value, probabilities)
+
+def predict_batch(model, digits):
+    """Returns (values, probabilities) of digits images (array (n, h, w),
+    see cells.extract_digits), classified by a single model call
+
+    values : list of n values in 1..9 (class 0 ignored, cells being not
+    empty), probabilities : array (n, classes).
+    """
+
+    if not len(digits) :
+        return (list(), np.zeros((0, 10), dtype="float32"))
+    probabilities = np.asarray(model.predict_on_batch(
+                                  digits.reshape(digits.shape + (1,))))
+    values = [int(v) + 1 for v in np.argmax(probabilities[:, 1:10], axis=1)]
+    return (values, probabilities)
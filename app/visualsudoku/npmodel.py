@@ -0,0 +1,144 @@
+""" Digits classifier forward pass with NumPy only (no Keras/TensorFlow)
+
+The model is a .npz file exported from the Keras .h5 model file by
+tools/export_model.py :
+
+  - "layers" : JSON list of the layers ({"class_name":..., "config":...}),
+  - "<i>_<j>" : weight j of layer i (Keras get_weights order).
+
+Supported layers (channels_last) : InputLayer, Conv2D, MaxPooling2D,
+AveragePooling2D, Flatten, Dense, Dropout, Activation, BatchNormalization.
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import json
+import numpy as np
+
+def _softmax(x):
+    e = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return e / np.sum(e, axis=-1, keepdims=True)
+
+ACTIVATIONS = {
+    "linear" : lambda x: x,
+    "relu" : lambda x: np.maximum(x, 0),
+    "sigmoid" : lambda x: 1.0 / (1.0 + np.exp(-x)),
+    "tanh" : np.tanh,
+    "softmax" : _softmax,
+}
+
+def _pair(value):
+    return tuple(value) if isinstance(value, (list, tuple)) else (value, value)
+
+def _same_padding(size, kernel, stride):
+    """Returns (before, after) padding of a 'same' Keras layer"""
+
+    out = -(-size // stride)
+    total = max((out - 1) * stride + kernel - size, 0)
+    return (total // 2, total - total // 2)
+
+def _pad(x, kernel, strides, padding, value=0):
+    if padding != "same" :
+        return x
+    pads = [_same_padding(x.shape[a], kernel[a-1], strides[a-1])
+            for a in (1, 2)]
+    return np.pad(x, ((0, 0), pads[0], pads[1], (0, 0)), mode="constant",
+                  constant_values=value)
+
+def _shifts(x, kernel, strides):
+    """Returns the list of the kh*kw (n, h, w, c) shifted x (row-major
+    kernel offsets), the output (h, w) being the 'valid' one"""
+
+    (h, w) = ((x.shape[1] - kernel[0]) // strides[0] + 1,
+              (x.shape[2] - kernel[1]) // strides[1] + 1)
+    return [x[:, i:i+(h-1)*strides[0]+1:strides[0],
+              j:j+(w-1)*strides[1]+1:strides[1]]
+            for i in range(kernel[0]) for j in range(kernel[1])]
+
+def conv2d(x, config, kernel, bias=None):
+    """Convolution as a single matrix product (im2col)"""
+
+    (kh, kw, c, f) = kernel.shape
+    strides = _pair(config.get("strides", 1))
+    x = _pad(x, (kh, kw), strides, config.get("padding", "valid"))
+    shifts = _shifts(x, (kh, kw), strides)
+    (n, h, w) = shifts[0].shape[:3]
+    columns = np.stack(shifts, axis=3).reshape(n*h*w, kh*kw*c)
+    y = (columns @ kernel.reshape(kh*kw*c, f)).reshape(n, h, w, f)
+    if bias is not None :
+        y += bias
+    return ACTIVATIONS[config.get("activation", "linear")](y)
+
+def pooling2d(x, config, reduce):
+    pool = _pair(config.get("pool_size", 2))
+    strides = _pair(config.get("strides") or pool)
+    padding = config.get("padding", "valid")
+    if padding == "same" and reduce is np.max :
+        x = _pad(x, pool, strides, padding, value=-np.inf)
+    elif padding == "same" :
+        raise ValueError("unsupported 'same' average pooling")
+    shifts = _shifts(x, pool, strides)
+    if reduce is np.max :
+        y = shifts[0].copy()
+        for shift in shifts[1:] :
+            np.maximum(y, shift, out=y)
+        return y
+    return sum(shifts) / float(len(shifts))
+
+def dense(x, config, kernel, bias=None):
+    y = x @ kernel
+    if bias is not None :
+        y += bias
+    return ACTIVATIONS[config.get("activation", "linear")](y)
+
+def batch_normalization(x, config, *weights):
+    weights = list(weights)
+    gamma = weights.pop(0) if config.get("scale", True) else 1.0
+    beta = weights.pop(0) if config.get("center", True) else 0.0
+    (mean, variance) = weights
+    epsilon = config.get("epsilon", 1e-3)
+    return (x - mean) / np.sqrt(variance + epsilon) * gamma + beta
+
+LAYERS = {
+    "InputLayer" : lambda x, config: x,
+    "Dropout" : lambda x, config: x,
+    "Flatten" : lambda x, config: x.reshape(x.shape[0], -1),
+    "Activation" : lambda x, config: ACTIVATIONS[config["activation"]](x),
+    "Conv2D" : conv2d,
+    "MaxPooling2D" : lambda x, config: pooling2d(x, config, np.max),
+    "AveragePooling2D" : lambda x, config: pooling2d(x, config, np.mean),
+    "Dense" : dense,
+    "BatchNormalization" : batch_normalization,
+}
+
+class NumpyModel(object):
+    """Model of a .npz file, with the Keras model predict methods"""
+
+    def __init__(self, path):
+        with np.load(path) as data :
+            layers = json.loads(str(data["layers"]))
+            self.layers = list()
+            for (i, layer) in enumerate(layers) :
+                class_name = layer["class_name"]
+                config = layer.get("config", dict())
+                if class_name not in LAYERS :
+                    raise ValueError("unsupported layer %s" % (class_name))
+                activation = config.get("activation", "linear")
+                if activation not in ACTIVATIONS :
+                    raise ValueError("unsupported activation %s" % (activation))
+                weights = list()
+                while "%d_%d" % (i, len(weights)) in data :
+                    weights.append(data["%d_%d" % (i, len(weights))]
+                                   .astype("float32"))
+                self.layers.append((LAYERS[class_name], config, weights))
+
+    def predict_on_batch(self, x):
+        x = np.asarray(x, dtype="float32")
+        for (function, config, weights) in self.layers :
+            x = function(x, config, *weights)
+        return x
+
+    def predict(self, x, verbose=0):
+        return self.predict_on_batch(x)
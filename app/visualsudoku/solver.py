@@ -0,0 +1,145 @@
+""" Sudoku solver : constraint propagation over candidates bitmasks, and
+search with time limit
+
+A grid is a list of 81 values (rows one after the other), 0 for an empty
+cell.
+
+The candidates of a cell are a bitmask (bit d set if value d possible).
+Propagation : a cell with a single candidate removes it from its peers
+(naked single), a value with a single possible cell into a row, column or
+box is assigned to it (hidden single). Search : branching on the cell with
+the fewest candidates (MRV), until 2 solutions found (to detect the grids
+with multiple solutions, that usually mean misrecognized digits).
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import time as timing
+
+SOLVED = "solved" # unique solution
+SOLVED_UNPROVEN = "solved, uniqueness not proven" # time limit after solution
+MULTIPLE = "multiple solutions"
+UNSOLVABLE = "unsolvable"
+TIMEOUT = "timeout"
+
+ALL = 0x3FE # candidates 1..9
+BIT = [1 << d for d in range(10)]
+VALUE = dict((1 << d, d) for d in range(1, 10)) # single candidate -> value
+COUNT = [bin(m).count("1") for m in range(1024)] # number of candidates
+
+UNITS = ([[9*r+c for c in range(9)] for r in range(9)] +
+         [[9*r+c for r in range(9)] for c in range(9)] +
+         [[9*(br+r)+bc+c for r in range(3) for c in range(3)]
+          for br in (0, 3, 6) for bc in (0, 3, 6)])
+CELL_UNITS = [[u for u in UNITS if i in u] for i in range(81)]
+PEERS = [sorted(set(j for u in CELL_UNITS[i] for j in u) - {i})
+         for i in range(81)]
+
+CHECK_PERIOD = 64 # search nodes between two time limit checks
+
+class _Timeout(Exception):
+    pass
+
+def _assign(cand, i, bit):
+    """Keeps only bit as candidate of cell i, returns False if contradiction"""
+
+    others = cand[i] & ~bit
+    while others :
+        b = others & -others
+        others ^= b
+        if cand[i] & b and not _eliminate(cand, i, b) :
+            return False
+    return True
+
+def _eliminate(cand, i, bit):
+    """Removes bit from candidates of cell i and propagates, returns False
+    if contradiction"""
+
+    if not cand[i] & bit :
+        return True
+    cand[i] &= ~bit
+    remaining = cand[i]
+    if not remaining :
+        return False
+    if COUNT[remaining] == 1 : # naked single
+        for p in PEERS[i] :
+            if cand[p] & remaining and not _eliminate(cand, p, remaining) :
+                return False
+    for unit in CELL_UNITS[i] : # hidden single
+        places = [j for j in unit if cand[j] & bit]
+        if not places :
+            return False
+        if len(places) == 1 and cand[places[0]] != bit :
+            if not _assign(cand, places[0], bit) :
+                return False
+    return True
+
+class _Search(object):
+
+    def __init__(self, deadline=None, limit=2):
+        self.deadline = deadline
+        self.limit = limit
+        self.solutions = list()
+        self.nodes = 0
+
+    def run(self, cand):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes % CHECK_PERIOD == 0 and \
+           timing.monotonic() > self.deadline :
+            raise _Timeout()
+
+        best = None
+        best_count = 10
+        for i in range(81) : # MRV : fewest candidates
+            n = COUNT[cand[i]]
+            if 1 < n < best_count :
+                (best, best_count) = (i, n)
+                if n == 2 :
+                    break
+        if best is None : # all cells assigned
+            self.solutions.append([VALUE[m] for m in cand])
+            return
+
+        candidates = cand[best]
+        while candidates and len(self.solutions) < self.limit :
+            b = candidates & -candidates
+            candidates ^= b
+            child = list(cand)
+            if _assign(child, best, b) :
+                self.run(child)
+
+def is_solved(status):
+    """Returns True if status comes with a solution to be shown"""
+
+    return status in (SOLVED, SOLVED_UNPROVEN)
+
+def solve(grid, time=None):
+    """Returns (status, solution) for grid
+
+    status : SOLVED or MULTIPLE (solution : list of 81 values, the first
+    solution found in MULTIPLE case), SOLVED_UNPROVEN (a solution found but
+    the time limit reached before a second one was searched for),
+    UNSOLVABLE or TIMEOUT (solution None).
+    time : time limit in seconds (None : no limit).
+    """
+
+    deadline = None if time is None else timing.monotonic() + time
+    cand = [ALL] * 81
+    for (i, v) in enumerate(grid) :
+        if v and not _assign(cand, i, BIT[v]) :
+            return (UNSOLVABLE, None)
+
+    search = _Search(deadline)
+    try :
+        search.run(cand)
+    except _Timeout :
+        if search.solutions :
+            return (SOLVED_UNPROVEN, search.solutions[0])
+        return (TIMEOUT, None)
+    if not search.solutions :
+        return (UNSOLVABLE, None)
+    if len(search.solutions) > 1 :
+        return (MULTIPLE, search.solutions[0])
+    return (SOLVED, search.solutions[0])
@@ -0,0 +1,145 @@
+""" Visual sudoku puzzle solving, on the device ("LOCAL" mode)
+
+read_and_solve(args) : grid detection, cells extraction (keep, border),
+digits classification (model) and solving (time limit). Like the vsudoku
+web service, the output file is the solution image, or a text file
+containing error information.
+
+Command line :
+
+    python3 toulbar2_visual_sudoku_puzzle.py -m model.npz -i image.jpg
+                                             -o solution.jpg [-k keep]
+                                             [-b border] [-t time]
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import sys
+import logging
+import numpy as np
+import cv2
+
+if __name__ == '__main__' : # command line
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+                                            os.path.abspath(__file__))))
+import grid
+from visualsudoku import cells, classifier, solver
+
+Logger = logging.getLogger('kivy') # kivy Logger (without importing kivy)
+
+WARPED_SIZE = 450 # side (pixels) of the rectified grid for cells extraction
+TIME_DEFAULT = 5 # seconds
+
+def read_image(image):
+    """Returns gray image (numpy) of image (file path, bytes or PIL image)"""
+
+    if isinstance(image, str) :
+        gray = cv2.imread(image, cv2.IMREAD_GRAYSCALE)
+    elif isinstance(image, (bytes, bytearray)) :
+        gray = cv2.imdecode(np.frombuffer(image, dtype="uint8"),
+                            cv2.IMREAD_GRAYSCALE)
+    else : # PIL image
+        gray = np.asarray(image.convert('L'))
+    if gray is None :
+        raise ValueError("unreadable image")
+    return gray
+
+def write_error(output, text):
+    with open(output, 'wt') as f :
+        f.write(text + "\n")
+
+def draw_solution(warped, givens, solution):
+    """Returns warped grid image (BGR) with solution digits (not givens)"""
+
+    image = cv2.cvtColor(warped, cv2.COLOR_GRAY2BGR)
+    (h, w) = warped.shape[:2]
+    (ch, cw) = (h / 9.0, w / 9.0)
+    scale = ch / 40.0
+    for i in range(81) :
+        if givens[i] == 0 :
+            (r, c) = divmod(i, 9)
+            text = str(solution[i])
+            ((tw, th), baseline) = cv2.getTextSize(text,
+                                        cv2.FONT_HERSHEY_SIMPLEX, scale, 2)
+            x = int(c*cw + (cw - tw) / 2.0)
+            y = int(r*ch + (ch + th) / 2.0)
+            cv2.putText(image, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX,
+                        scale, (34, 34, 178), 2)
+    return image
+
+def recognize(gray, model, keep=0, border=0):
+    """Returns (warped, givens) : rectified grid image and recognized grid
+    (list of 81 values, 0 for empty cell), or (None, None) if no grid"""
+
+    corners = grid.find_grid(gray)
+    if corners is None :
+        return (None, None)
+    warped = grid.warp_grid(gray, corners, WARPED_SIZE, margin=0)
+    (indices, digits) = cells.extract_digits(warped, keep, border)
+    (values, probabilities) = classifier.predict_batch(model, digits)
+    givens = [0] * 81
+    for (i, value) in zip(indices, values) :
+        givens[i] = value
+    return (warped, givens)
+
+def read_and_solve(args):
+    """Solves the image grid and writes the solution image as output file
+
+    args keys : "model", "image" (file path, bytes or PIL image), "output",
+    "debug", "keep", "border", "time" (time limit in seconds).
+    Returns (status, givens, solution) (see solver.py), status None if no
+    grid found.
+    """
+
+    output = args["output"]
+    debug = args.get("debug", 0)
+    keep = args.get("keep") or 0
+    border = args.get("border") or 0
+    time = args.get("time") or TIME_DEFAULT
+
+    gray = read_image(args["image"])
+    model = classifier.load_model(args["model"])
+    (warped, givens) = recognize(gray, model, keep, border)
+    if warped is None :
+        write_error(output, "[ERROR] Sudoku grid not found")
+        return (None, None, None)
+    if debug :
+        Logger.debug("LOCAL : [read_and_solve] : recognized grid : %s" %
+                     ("".join(str(v) for v in givens)))
+
+    (status, solution) = solver.solve(givens, time)
+    if not solver.is_solved(status) :
+        text = "[ERROR] Sudoku grid %s" % (status)
+        if status in (solver.UNSOLVABLE, solver.MULTIPLE) :
+            text += " (misrecognized digits ? try other keep, border values)"
+        write_error(output, text)
+        return (status, givens, None)
+    if status == solver.SOLVED_UNPROVEN :
+        Logger.warning("LOCAL : [read_and_solve] : time limit reached before "
+                       "the uniqueness of the solution was checked")
+    if debug :
+        Logger.debug("LOCAL : [read_and_solve] : solution : %s" %
+                     ("".join(str(v) for v in solution)))
+
+    cv2.imwrite(output, draw_solution(warped, givens, solution))
+    return (status, givens, solution)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Visual sudoku solving")
+    parser.add_argument("-m", "--model", required=True)
+    parser.add_argument("-i", "--image", required=True)
+    parser.add_argument("-o", "--output", default="solution.jpg")
+    parser.add_argument("-k", "--keep", type=int, default=0)
+    parser.add_argument("-b", "--border", type=int, default=0)
+    parser.add_argument("-t", "--time", type=int, default=TIME_DEFAULT)
+    parser.add_argument("-d", "--debug", type=int, default=0)
+    a = parser.parse_args()
+    (status, givens, solution) = read_and_solve(vars(a))
+    print("[INFO] status : %s" % (status))
+    for g in (givens, solution) :
+        if g is not None :
+            print("".join(str(v) for v in g))
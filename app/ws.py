@@ -1,39 +1,505 @@
-""" read_and_solve method calling ws request """
-  
+""" read_and_solve method calling ws request
+
+requests (and urllib3) are imported at first use (see get_session), not
+at App start.
+"""
+
 __author__    = "Nathalie Rousse"
 __copyright__ = "Copyright 2020, INRAE"
 __license__   = "MIT"
 
-import requests
+import os
+import random
+import socket
+import threading
+import logging
+from time import sleep, perf_counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from response import classify
+
+Logger = logging.getLogger('kivy') # kivy Logger (without importing kivy)
+
+URL_VSUDOKU = os.environ.get('VSUDOKU_URL',
+                             'http://147.100.179.250/api/tool/vsudoku')
+                             # (self-hosted : see tools/vsudoku_server.py)
+
+CHUNK_SIZE = 16384 # upload/download block size (bytes)
+
+TIME_DEFAULT = 5 # server time value when time not given (seconds)
+CONNECT_TIMEOUT = 5.0 # seconds
+READ_TIMEOUT_MARGIN = 30.0 # seconds added to time : recognition, transfers
+
+RETRIES = 3 # number of retries after a transient failure
+RETRY_STATUS = (429, 502, 503, 504) # 429 : server queue full
+BACKOFF_BASE = 0.5 # seconds
+BACKOFF_MAX = 8.0 # seconds
+
+SWEEP_CANDIDATES = ((40, 15), (20, 5)) # (keep, border) tried by the sweep
+SWEEP_CONCURRENCY = 3 # requests at once (<= pool_maxsize, see get_session)
+SWEEP_MAX_BYTES = 1024*1024 # total upload of a sweep
+
+#------------------------------------------------------------------------------
+# Cancel
+#------------------------------------------------------------------------------
+
+class SolveCancelled(Exception):
+    """read_and_solve call aborted by its Cancel"""
+    pass
+
+def _shutdown(conn):
+    """Shutdown the socket of conn (urllib3 connection), if connected"""
+    sock = getattr(conn, 'sock', None)
+    if sock is not None :
+        try :
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError :
+            pass
+
+class Cancel(object):
+    """Cancellation flag of a read_and_solve call
+
+    cancel() may be called from any thread. It shuts down the socket of the
+    in-flight request, so that a read_and_solve blocked while waiting for the
+    server answer returns at once (raising SolveCancelled).
+
+    A Cancel created with a parent is cancelled with it (see sweep_and_solve).
+    """
+
+    def __init__(self, parent=None):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._connections = list()
+        self._children = list()
+        if parent is not None :
+            parent.add_child(self)
+
+    def cancel(self):
+        self._event.set()
+        with self._lock :
+            connections = list(self._connections)
+            children = list(self._children)
+        for conn in connections :
+            _shutdown(conn)
+        for child in children :
+            child.cancel()
+
+    def add_child(self, child):
+        """child (Cancel) will be cancelled with self"""
+        with self._lock :
+            self._children.append(child)
+        if self.is_cancelled() :
+            child.cancel()
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self.is_cancelled() :
+            raise SolveCancelled()
+
+    def wait(self, delay):
+        """Sleeps delay seconds, raises SolveCancelled if cancelled meanwhile"""
+        if self._event.wait(delay) :
+            raise SolveCancelled()
+
+    def attach(self, conn):
+        """Record conn as a connection used by the request"""
+        with self._lock :
+            self._connections.append(conn)
+        if self.is_cancelled() :
+            _shutdown(conn)
+
+_local = threading.local() # Cancel of the read_and_solve call of the thread
+
+class _CancellablePoolMixin(object):
+    """Attaches the connections given by the pool to the current Cancel"""
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        cancel = getattr(_local, 'cancel', None)
+        if cancel is not None :
+            cancel.attach(conn)
+        return conn
+
+def cancellable_pool_classes():
+    """Returns the pool classes by scheme whose connections can be shutdown
+    by a Cancel"""
+
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+    return {'http': type('CancellableHTTPConnectionPool',
+                         (_CancellablePoolMixin, HTTPConnectionPool), {}),
+            'https': type('CancellableHTTPSConnectionPool',
+                          (_CancellablePoolMixin, HTTPSConnectionPool), {})}
+
+#------------------------------------------------------------------------------
+# Upload
+#------------------------------------------------------------------------------
+
+class _UploadBody(object):
+    """Request body read block by block while being sent
+
+    Reports upload progress and aborts the upload once cancelled.
+    sent : time (perf_counter) when the whole body has been sent, else None.
+    """
+
+    def __init__(self, body, progress=None, cancel=None):
+        self._body = body
+        self._pos = 0
+        self._progress = progress
+        self._cancel = cancel
+        self.sent = None
+
+    def __len__(self):
+        return len(self._body)
+
+    def read(self, size=-1):
+        if self._cancel is not None :
+            self._cancel.check()
+        if size is None or size < 0 :
+            size = len(self._body) - self._pos
+        block = self._body[self._pos:self._pos+size]
+        self._pos += len(block)
+        if not block and self.sent is None :
+            self.sent = perf_counter()
+        if self._progress is not None :
+            if block :
+                self._progress('uploading', self._pos / len(self._body))
+            else : # whole body sent, now waiting for the server answer
+                self._progress('solving', None)
+        return block
+
+#------------------------------------------------------------------------------
+# Session
+#------------------------------------------------------------------------------
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """Returns the module session (created at first call)
+
+    Pooled keep-alive connections : the solves after the first one reuse
+    the connection already opened to the server.
+    """
+
+    global _session
+    with _session_lock :
+        if _session is None :
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4,
+                                  max_retries=0) # see read_and_solve
+            adapter.poolmanager.pool_classes_by_scheme = \
+                                                  cancellable_pool_classes()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+def get_timeout(time=None):
+    """Returns (connect, read) timeouts (seconds) for a time value
+
+    The read timeout has to cover the server solving (time) plus the image
+    recognition and the transfers.
+    """
 
-def read_and_solve(image, output, keep=None, border=None, time=None) :
+    if time is None :
+        time = TIME_DEFAULT
+    return (CONNECT_TIMEOUT, float(time) + READ_TIMEOUT_MARGIN)
+
+def backoff_delay(attempt):
+    """Returns the delay before retry number attempt (0, 1...)
+
+    Exponential backoff with full jitter.
+    """
+
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+def _is_transient(e):
+    """Failures worth a retry : connection not established, or lost before
+    the whole answer (truncated body). A read timeout is not retried (server
+    busy solving)."""
+
+    import requests
+    if isinstance(e, requests.ConnectTimeout) :
+        return True
+    if isinstance(e, requests.ReadTimeout) :
+        return False
+    return isinstance(e, (requests.ConnectionError,
+                          requests.exceptions.ChunkedEncodingError))
+
+#------------------------------------------------------------------------------
+# Solve
+#------------------------------------------------------------------------------
+
+def _post(url, body, content_type, timeout, progress=None, cancel=None,
+          timings=None):
+    """One POST request, returns (status_code, content_type, content)"""
+
+    start = perf_counter()
+    upload_body = _UploadBody(body, progress, cancel)
+    r = get_session().post(url, data=upload_body,
+                           headers={'Content-Type': content_type},
+                           timeout=timeout, stream=True)
+    answered = perf_counter() # response headers received
+    try :
+        total = int(r.headers.get('Content-Length', 0))
+        content = bytearray()
+        for block in r.iter_content(CHUNK_SIZE) :
+            if cancel is not None :
+                cancel.check()
+            content.extend(block)
+            if progress is not None :
+                progress('downloading',
+                         (len(content) / total) if total else None)
+    finally :
+        r.close() # connection back to the pool (if content fully read)
+    if timings is not None :
+        sent = upload_body.sent or answered
+        timings['upload'] = sent - start
+        timings['server'] = answered - sent
+        timings['download'] = perf_counter() - answered
+    return (r.status_code, r.headers.get('Content-Type'), content)
+
+def _image_content(image, filename=None):
+    """Returns (content, filename) of image (file path, or content)"""
+
+    if isinstance(image, (bytes, bytearray)) :
+        return (bytes(image), filename or 'grid.jpg')
+    with open(image, 'rb') as f :
+        image_content = f.read()
+    return (image_content, filename or os.path.basename(image))
+
+def _form(image_content, filename, keep=None, border=None, time=None,
+          returned_type='stdout'):
+    """Returns (body, content_type) of the multipart form data request"""
+
+    from urllib3 import encode_multipart_formdata
+    fields = {'returned_type':returned_type}
+    if keep is not None :
+        fields['keep'] = str(keep)
+    if border is not None :
+        fields['border'] = str(border)
+    if time is not None :
+        fields['time'] = str(time)
+    fields['file'] = (filename, image_content)
+    return encode_multipart_formdata(fields)
+
+def _send(url, body, content_type, timeout, progress=None, cancel=None,
+          timings=None):
+    """POST request retried after transient failures, returns (status_code,
+    content_type, content, attempts)"""
+
+    import requests
+    _local.cancel = cancel
+    try :
+        attempt = 0
+        while True :
+            try :
+                (status_code, response_type, content) = _post(url, body,
+                                                      content_type, timeout,
+                                                      progress, cancel,
+                                                      timings)
+                if status_code not in RETRY_STATUS or attempt >= RETRIES :
+                    break
+                reason = "HTTP %d" % status_code
+            except requests.RequestException as e :
+                if cancel is not None :
+                    cancel.check() # SolveCancelled if error comes from cancel
+                if not _is_transient(e) or attempt >= RETRIES :
+                    raise
+                reason = type(e).__name__
+            delay = backoff_delay(attempt)
+            attempt += 1
+            Logger.info("WS : [read_and_solve] : %s, retry %d/%d in %.2fs" %
+                        (reason, attempt, RETRIES, delay))
+            if cancel is not None :
+                cancel.wait(delay)
+            else :
+                sleep(delay)
+    finally :
+        _local.cancel = None
+    return (status_code, response_type, content, attempt + 1)
+
+def _write(output, cr_ok, content):
+    """Writes content as output if cr_ok (atomic rename), else removes any
+    previous output"""
+
+    if cr_ok : # written as a whole
+        tmp_output = output + ".tmp"
+        with open(tmp_output, 'wb') as solution_file:
+            solution_file.write(content)
+        os.replace(tmp_output, output)
+    elif os.path.exists(output) : # no previous solution left
+        os.remove(output)
+
+def read_and_solve(image, output, keep=None, border=None, time=None,
+                   progress=None, cancel=None, filename=None,
+                   returned_type='stdout', url=None, timings=None) :
     """Sends POST request and return solution image file
 
+    image is the image file path, or the image file content (bytes) then
+    sent as filename file (default 'grid.jpg').
+
+    returned_type 'stdout' : output is the solution image file. With
+    'stdout.txt' or 'run.zip', output receives the text (or zip) containing
+    the recognized grid and its solution digits (see solution.py).
+
+    Returns (cr_ok, error_txt) : the response is classified in memory (see
+    response.classify) and output is written (atomic rename) only if cr_ok,
+    else removed.
+
+    Optional progress(stage, fraction) is called (from the calling thread)
+    with stage 'uploading', 'solving' (fraction None) or 'downloading'.
+    Optional cancel (Cancel) allows another thread to abort the request :
+    read_and_solve then raises SolveCancelled (output not written).
+
+    Transient failures (connection, RETRY_STATUS) are retried RETRIES times
+    with jittered exponential backoff. Timeouts : see get_timeout.
+
+    url : web service url (default URL_VSUDOKU).
+
+    Optional timings (dict) receives the durations (seconds) of the last
+    attempt : 'upload' (request sent), 'server' (until the response
+    headers), 'download' (response body), then 'write' (output file), and
+    the number of 'attempts'.
+
     Memo : some parameters of url_vsudoku request :
            - todownload="no"
            - returned_type ="stdout" or "stdout.txt" or "run.zip"
 
     """
 
-    url_vsudoku = 'http://147.100.179.250/api/tool/vsudoku'
+    (image_content, filename) = _image_content(image, filename)
+    (body, content_type) = _form(image_content, filename, keep, border, time,
+                                 returned_type)
+    (status_code, response_type, content, attempts) = _send(url or URL_VSUDOKU,
+                                      body, content_type, get_timeout(time),
+                                      progress, cancel, timings)
 
-    files = {'file': open(image, 'rb')}
+    start = perf_counter()
+    (cr_ok, error_txt) = classify(status_code, response_type, content,
+                                  returned_type)
+    if not cr_ok :
+        Logger.info("WS : [read_and_solve] : HTTP %d, %s" %
+                    (status_code, error_txt))
+    _write(output, cr_ok, content)
+    if timings is not None :
+        timings['write'] = perf_counter() - start
+        timings['attempts'] = attempts
+    return (cr_ok, error_txt)
 
-    data = {'returned_type':'stdout'}
-    if keep is not None :
-        data['keep'] = keep
-    if border is not None :
-        data['border'] = border
-    if time is not None :
-        data['time'] = time
+#------------------------------------------------------------------------------
+# Sweep
+#------------------------------------------------------------------------------
+
+def sweep_candidates(keep=None, border=None, others=SWEEP_CANDIDATES):
+    """Returns the (keep, border) candidates : (keep, border) first, then
+    others (without duplicates)"""
+
+    candidates = [(keep, border)]
+    for candidate in others :
+        if tuple(candidate) not in candidates :
+            candidates.append(tuple(candidate))
+    return candidates
 
-    r = requests.post(url_vsudoku, data=data, files=files)
-    
-    with open(output, 'wb') as solution_file:
-        solution_file.write(r.content)
+def sweep_and_solve(image, output, candidates, time=None, progress=None,
+                    cancel=None, filename=None, returned_type='stdout',
+                    url=None, timings=None, concurrency=SWEEP_CONCURRENCY,
+                    max_bytes=SWEEP_MAX_BYTES) :
+    """read_and_solve hedged over several (keep, border) candidates
+
+    The candidates requests are sent concurrently (at most concurrency at
+    once, over the pooled connections of the session). The first response
+    classified as valid (see response.classify) is written as output and
+    the other requests are cancelled (the waiting ones are not sent).
+
+    Total bandwidth : the candidates are sent in order while the total of
+    their request bodies is under max_bytes (the first one always sent).
+
+    Returns (cr_ok, error_txt, (keep, border)) : the first valid candidate,
+    else the response of the first answered candidate in order (an exception
+    is raised if none has been answered).
+
+    progress : reported by the first candidate (from a pool thread). cancel,
+    timings (those of the returned candidate, and the number of
+    'candidates' sent) : see read_and_solve.
+    """
+
+    (image_content, filename) = _image_content(image, filename)
+    timeout = get_timeout(time)
+    url = url or URL_VSUDOKU
+    requests_list = list()
+    total = 0
+    for (keep, border) in candidates :
+        (body, content_type) = _form(image_content, filename, keep, border,
+                                     time, returned_type)
+        if requests_list and total + len(body) > max_bytes :
+            Logger.info("WS : [sweep_and_solve] : %d bytes budget, %d/%d "
+                        "candidates sent" % (max_bytes, len(requests_list),
+                                             len(candidates)))
+            break
+        total += len(body)
+        requests_list.append(((keep, border), body, content_type,
+                              Cancel(cancel), dict()))
+
+    def solve_candidate(i):
+        (candidate, body, content_type, child, child_timings) = \
+                                                              requests_list[i]
+        (status_code, response_type, content, attempts) = _send(url, body,
+                                     content_type, timeout,
+                                     progress if i == 0 else None, child,
+                                     child_timings)
+        child_timings['attempts'] = attempts
+        (cr_ok, error_txt) = classify(status_code, response_type, content,
+                                      returned_type)
+        Logger.info("WS : [sweep_and_solve] : keep %s border %s : HTTP %d %s"
+                    % (candidate[0], candidate[1], status_code,
+                       "ok" if cr_ok else error_txt))
+        return (cr_ok, error_txt, content)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    futures = dict((executor.submit(solve_candidate, i), i)
+                   for i in range(len(requests_list)))
+    (winner, results, errors) = (None, dict(), dict())
+    try :
+        for future in as_completed(futures) :
+            i = futures[future]
+            try :
+                results[i] = future.result()
+            except Exception as e : # (SolveCancelled if cancelled)
+                errors[i] = e
+                continue
+            if results[i][0] :
+                winner = i
+                break
+    finally :
+        for (future, i) in futures.items() : # the other ones cancelled
+            if i != winner :
+                future.cancel()
+                requests_list[i][3].cancel()
+        executor.shutdown(wait=False)
+    if cancel is not None :
+        cancel.check()
+
+    if winner is None :
+        if not results :
+            raise errors[min(errors)]
+        winner = min(results)
+    (cr_ok, error_txt, content) = results[winner]
+    (candidate, child_timings) = (requests_list[winner][0],
+                                  requests_list[winner][4])
+    start = perf_counter()
+    _write(output, cr_ok, content)
+    if timings is not None :
+        timings.update(child_timings)
+        timings['write'] = perf_counter() - start
+        timings['candidates'] = len(requests_list)
+    return (cr_ok, error_txt, candidate)
 
 #memo
 #python3 toulbar2_visual_sudoku_puzzle.py -m digit_classifier.h5 -i sudoku_poster.jpg -o WSsolution_poster.jpg -k 70
 #echo "[INFO] toulbar2_visual_sudoku_puzzle.py running with options : -i $1 -o solution.jpg -k $2 -b $3 -t $4"
 #-i $1 -k $2 -b $3 -t $4
-
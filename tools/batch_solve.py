@@ -0,0 +1,343 @@
+""" Batch solving of grid images, without the App (no kivy import) : the
+images of a folder (walked recursively) or of a manifest file are solved by
+a bounded pool, one JSON line per image written as results
+
+Usage (from repository root) :
+
+    python3 tools/batch_solve.py input -o outdir [-w workers] [--local]
+                                 [-u url] [-k keep] [--border border]
+                                 [-t time] [--retry-failed]
+
+input : images folder (the GRD_* and SOL_* files written by the solves,
+and outdir if inside, being skipped), or manifest file (one image path per
+line, or one JSON object per line : {"image": path, "keep": k, "border": b,
+"time": t}, the values given overriding the command line ones ; relative
+paths are relative to the manifest folder).
+
+"WS" mode (default) : the solve path of the App (upload preprocessing, see
+'uploadsize' and 'gridcrop' settings, then ws.read_and_solve) into a pool
+of workers threads (-w, default WORKERS). --local : the LOCAL mode engine
+(app/visualsudoku, model -m) into a pool of workers processes (default :
+number of cores), the model being loaded once per process.
+
+Outputs into outdir : the solution images (SOL_<image relative path>.jpg)
+and results.jsonl, one line per image : image, mtime, size, digest, keep,
+border, time, mode, ok, error, output, ms, timings ("WS" mode : upload,
+server, download), t. The lines are appended as the solves end : an
+interrupted batch run again with the same outdir goes on where it stopped
+(images already in results.jsonl, unchanged since, being skipped ; the
+failed ones too, unless --retry-failed).
+
+Throughput (images per minute) reported during and at the end of the run.
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures import wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+HOME_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(HOME_PATH, "app")
+sys.path.insert(0, APP_PATH)
+
+from preprocess import UPLOAD_MAX_SIDE
+from history import ARTIFACT_PREFIXES
+
+RESULTS_FILENAME = "results.jsonl"
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+MODEL = os.path.join(APP_PATH, "visualsudoku", "mixed_classifier.npz")
+WORKERS = 4 # "WS" mode threads
+TIME_DEFAULT = 5 # seconds
+PENDING_FACTOR = 2 # jobs submitted ahead : PENDING_FACTOR * workers
+
+#------------------------------------------------------------------------------
+# Jobs
+#------------------------------------------------------------------------------
+
+def walk(dirpath, outdir=None):
+    """Yields the image files of dirpath (recursively, sorted), except the
+    ones of outdir and the files written by the solves (GRD_*, SOL_*)"""
+
+    outdir = os.path.abspath(outdir) if outdir else None
+    for (root, dirnames, filenames) in os.walk(dirpath) :
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.') and
+                             os.path.abspath(os.path.join(root, d)) != outdir)
+        for name in sorted(filenames) :
+            if not name.startswith('.') and \
+               not name.startswith(ARTIFACT_PREFIXES) and \
+               name.lower().endswith(EXTENSIONS) :
+                yield os.path.join(root, name)
+
+def read_manifest(path):
+    """Yields the (image path, values) of manifest file path, values being
+    the dict of the keep/border/time values given"""
+
+    dirpath = os.path.dirname(os.path.abspath(path))
+    with open(path, 'rt') as f :
+        for line in f :
+            line = line.strip()
+            if not line or line.startswith('#') :
+                continue
+            if line.startswith('{') :
+                entry = json.loads(line)
+                image = entry["image"]
+                values = dict((k, entry[k]) for k in ("keep", "border", "time")
+                              if entry.get(k) is not None)
+            else :
+                (image, values) = (line, dict())
+            yield (os.path.join(dirpath, image), values)
+
+def jobs(source, outdir=None):
+    """Yields the (image path, values) of source (folder, see walk, or
+    manifest)"""
+
+    if os.path.isdir(source) :
+        for path in walk(source, outdir) :
+            yield (path, dict())
+    else :
+        for job in read_manifest(source) :
+            yield job
+
+def output_name(path, root):
+    """Returns the solution file name of image path (relative to root)"""
+
+    relpath = os.path.relpath(path, root)
+    if relpath.startswith('..') :
+        relpath = os.path.basename(path)
+    return "SOL_" + relpath.replace(os.sep, "_") + ".jpg" # (a.jpg, a.png)
+
+def file_key(path):
+    """Returns (mtime, size) of file path (None if missing)"""
+
+    try :
+        stat = os.stat(path)
+    except OSError :
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+def read_results(path, retry_failed=False):
+    """Returns the dict image : (mtime, size) of the images already solved
+    (results file path), the failed ones excepted if retry_failed"""
+
+    done = dict()
+    try :
+        with open(path, 'rt') as f :
+            for line in f :
+                try :
+                    record = json.loads(line)
+                except ValueError : # (line cut by an interruption)
+                    continue
+                if record.get("ok") or not retry_failed :
+                    done[record["image"]] = (record["mtime"], record["size"])
+                else :
+                    done.pop(record["image"], None)
+    except OSError :
+        pass
+    return done
+
+#------------------------------------------------------------------------------
+# Solves (into workers)
+#------------------------------------------------------------------------------
+
+def solve_ws(path, output, keep, border, time_value, url, uploadsize,
+             gridcrop):
+    """"WS" mode solve of image path, returns (ok, error, timings)"""
+
+    import ws
+    from preprocess import prepare_upload
+    from grid import GRID_SIZE
+
+    timings = dict()
+    image = path
+    filename = None
+    if uploadsize > 0 :
+        t = time.perf_counter()
+        (image, extension) = prepare_upload(path, max_side=uploadsize,
+                                            grid_side=GRID_SIZE if gridcrop
+                                                      else 0)
+        filename = "grid" + extension
+        timings['encode'] = time.perf_counter() - t
+    (cr_ok, error_txt) = ws.read_and_solve(image=image, filename=filename,
+                                           output=output, keep=keep,
+                                           border=border, time=time_value,
+                                           url=url, timings=timings)
+    return (cr_ok, error_txt, timings)
+
+_model = None
+
+def init_local(model):
+    """Worker process initializer (LOCAL mode) : model loaded once"""
+
+    global _model
+    from visualsudoku import classifier
+    _model = model
+    classifier.load_model(model)
+
+def solve_local(path, output, keep, border, time_value):
+    """LOCAL mode solve of image path, returns (ok, error, timings)"""
+
+    from visualsudoku import solver
+    from visualsudoku.toulbar2_visual_sudoku_puzzle import read_and_solve
+
+    (status, givens, solution) = read_and_solve({"model" : _model,
+            "image" : path, "output" : output, "keep" : keep,
+            "border" : border, "time" : time_value})
+    if status == solver.SOLVED :
+        return (True, "", dict())
+    if solver.is_solved(status) : # (solution, but not proven unique)
+        return (True, "Sudoku grid %s" % (status), dict())
+    with open(output, 'rt') as f : # error text file (status None : no grid)
+        return (False, f.read().strip(), dict())
+
+def run_job(solve, path, output, values, *args):
+    """Solves image path (into a worker), returns its results record"""
+
+    from cache import image_digest
+
+    start = time.perf_counter()
+    record = {"image" : path}
+    record.update(values)
+    try :
+        record["digest"] = image_digest(path)
+        (cr_ok, error_txt, timings) = solve(path, output, values["keep"],
+                                            values["border"], values["time"],
+                                            *args)
+        record["ok"] = bool(cr_ok)
+        record["error"] = error_txt or None
+        record["timings"] = dict((k, round(1000 * v, 1))
+                                 for (k, v) in timings.items()
+                                 if isinstance(v, float))
+    except Exception as e :
+        (record["ok"], record["error"]) = (False, "%s: %s" %
+                                           (type(e).__name__, e))
+    if not record["ok"] and os.path.exists(output) : # (error text...)
+        os.remove(output)
+    record["output"] = output if record["ok"] else None
+    record["ms"] = round(1000 * (time.perf_counter() - start), 1)
+    return record
+
+#------------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch solving of grid images")
+    parser.add_argument("input", help="images folder or manifest file")
+    parser.add_argument("-o", "--outdir", required=True,
+                        help="solutions and results.jsonl folder")
+    parser.add_argument("-w", "--workers", type=int, default=None)
+    parser.add_argument("--local", action="store_true",
+                        help="LOCAL mode engine (processes)")
+    parser.add_argument("-m", "--model", default=MODEL, help="LOCAL mode")
+    parser.add_argument("-u", "--url", default=None, help="WS mode")
+    parser.add_argument("-k", "--keep", type=int, default=0)
+    parser.add_argument("--border", type=int, default=0)
+    parser.add_argument("-t", "--time", type=int, default=TIME_DEFAULT)
+    parser.add_argument("--uploadsize", type=int, default=UPLOAD_MAX_SIDE)
+    parser.add_argument("--gridcrop", type=int, default=1)
+    parser.add_argument("--retry-failed", action="store_true")
+    a = parser.parse_args()
+    if not os.path.exists(a.input) :
+        parser.error("%s not found" % (a.input))
+
+    os.makedirs(a.outdir, exist_ok=True)
+    results_path = os.path.join(a.outdir, RESULTS_FILENAME)
+    done = read_results(results_path, a.retry_failed)
+    root = a.input if os.path.isdir(a.input) else os.path.dirname(a.input)
+    defaults = {"keep" : a.keep, "border" : a.border, "time" : a.time}
+
+    if a.local :
+        try : # (error at once, not from each worker)
+            from visualsudoku import classifier
+            classifier.load_model(a.model) # (inherited by the forked workers)
+        except Exception as e :
+            print("[ERROR] model %s not loaded : %s: %s" % (a.model,
+                  type(e).__name__, e))
+            sys.exit(1)
+        (mode, solve) = ("LOCAL", solve_local)
+        args = ()
+        workers = a.workers or os.cpu_count() or 1
+        pool = ProcessPoolExecutor(max_workers=workers,
+                                   initializer=init_local,
+                                   initargs=(a.model,))
+    else :
+        import ws
+        (mode, solve) = ("WS", solve_ws)
+        args = (a.url or ws.URL_VSUDOKU, a.uploadsize, a.gridcrop)
+        workers = a.workers or WORKERS
+        pool = ThreadPoolExecutor(max_workers=workers)
+
+    (solved, failed, skipped) = (0, 0, 0)
+    pending = dict() # future : (mtime, size)
+    start = time.perf_counter()
+
+    def rate():
+        elapsed = time.perf_counter() - start
+        return 60.0 * (solved + failed) / elapsed if elapsed > 0 else 0.0
+
+    def report():
+        elapsed = time.perf_counter() - start
+        print("%d images solved, %d failed, %d skipped (already done) in %.1f"
+              " s : %.1f images/min (%s mode, %d workers)" % (solved, failed,
+              skipped, elapsed, rate(), mode, workers))
+        print("results : %s" % (results_path))
+
+    def write(results, future):
+        nonlocal solved, failed
+        (mtime, size) = pending.pop(future)
+        record = future.result()
+        record.update({"mtime" : mtime, "size" : size, "mode" : mode,
+                       "t" : round(time.time(), 3)})
+        results.write(json.dumps(record) + "\n")
+        results.flush()
+        if record["ok"] :
+            solved += 1
+        else :
+            failed += 1
+        print("[%s] %s (%.1f s) %s  - %.1f images/min" % ("OK" if record["ok"]
+              else "ERROR", os.path.relpath(record["image"], root),
+              record["ms"] / 1000.0, record["error"] or "", rate()))
+
+    try :
+        with open(results_path, 'at') as results :
+            for (path, values) in jobs(a.input, a.outdir) :
+                path = os.path.abspath(path)
+                key = file_key(path)
+                if key is not None and done.get(path) == tuple(key) :
+                    skipped += 1
+                    continue
+                while len(pending) >= PENDING_FACTOR * workers :
+                    for future in wait(pending,
+                                       return_when=FIRST_COMPLETED)[0] :
+                        write(results, future)
+                output = os.path.join(os.path.abspath(a.outdir),
+                                      output_name(path, root))
+                job_values = dict(defaults, **values)
+                future = pool.submit(run_job, solve, path, output,
+                                     job_values, *args)
+                pending[future] = key or (None, None)
+            while pending :
+                for future in wait(pending, return_when=FIRST_COMPLETED)[0] :
+                    write(results, future)
+    except KeyboardInterrupt :
+        print("[INFO] interrupted : run again to go on")
+        pool.shutdown(wait=False, cancel_futures=True)
+        report()
+        sys.exit(1)
+    except BrokenProcessPool : # (worker process crashed)
+        print("[ERROR] a worker process terminated abruptly : %d images not "
+              "solved (not recorded), run again to go on" % (len(pending)))
+        pool.shutdown(wait=False, cancel_futures=True)
+        report()
+        sys.exit(1)
+    pool.shutdown()
+    report()
+
+if __name__ == '__main__':
+    main()
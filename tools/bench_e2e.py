@@ -0,0 +1,196 @@
+""" End-to-end solve latency benchmark, per stage, over a corpus of grid
+images : the solve path of the App ("WS" mode) without its UI
+
+Usage (from repository root) :
+
+    python3 tools/bench_e2e.py [image ...] [-u url] [-n repeat]
+                               [-o results.json] [-b baseline.json]
+
+Default images : img/sudoku.jpg, img/sudoku.png. Default url : the App one
+(URL_VSUDOKU, see app/ws.py), or a local stand-in (tools/mock_ws.py,
+tools/vsudoku_server.py).
+
+Stages (seconds) : load (image file read and decoded), encode (upload
+preprocessing, see 'uploadsize' setting), upload, server (until the
+response headers), download, write (output file), cr_solve (response
+analysis), total (wall-clock time of the whole solve, including the
+retries and their backoff, while the other stages are those of the last
+attempt). Reported : p50, p95, p99, mean. With --sweep 1 (see
+'sweep' setting), the stages are those of the candidate kept.
+
+The results are written as JSON (-o). With a baseline (-b, a previous
+results file), the stages whose p50 or p95 exceeds the baseline one by
+more than the threshold ratio (and by more than MIN_DELTA) are flagged
+as regressions, and the exit code is 1.
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+HOME_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(HOME_PATH, "app"))
+
+import ws
+from preprocess import open_image, prepare_upload, UPLOAD_MAX_SIDE
+from grid import GRID_SIZE
+from response import cr_solve, cr_solve_digits
+
+IMAGES = [os.path.join(HOME_PATH, "img", "sudoku.jpg"),
+          os.path.join(HOME_PATH, "img", "sudoku.png")]
+STAGES = ("load", "encode", "upload", "server", "download", "write",
+          "cr_solve", "total")
+THRESHOLD = 0.2 # regression : more than 20% slower
+MIN_DELTA = 0.005 # seconds, regression if slower by more than that
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[int(round((len(values) - 1) * p / 100.0))]
+
+def summary(values):
+    if not values :
+        return None
+    return {"p50" : percentile(values, 50), "p95" : percentile(values, 95),
+            "p99" : percentile(values, 99),
+            "mean" : sum(values) / len(values), "count" : len(values)}
+
+def solve_once(path, output, a):
+    """Runs the solve path on image path, returns (timings, cr_ok)"""
+
+    timings = dict()
+    start = time.perf_counter()
+    t = start
+    with open(path, 'rb') as f :
+        open_image(f.read()).load()
+    timings['load'] = time.perf_counter() - t
+
+    image = path
+    filename = None
+    t = time.perf_counter()
+    if a.uploadsize > 0 :
+        (image, extension) = prepare_upload(path, max_side=a.uploadsize,
+                                   grid_side=GRID_SIZE if a.gridcrop else 0)
+        filename = "grid" + extension
+    timings['encode'] = time.perf_counter() - t
+
+    returned_type = 'stdout.txt' if a.compact else 'stdout'
+    if a.sweep :
+        response = ws.sweep_and_solve(image=image, filename=filename,
+                          output=output,
+                          candidates=ws.sweep_candidates(a.keep, a.border),
+                          time=a.time, returned_type=returned_type, url=a.url,
+                          timings=timings)[:2]
+    else :
+        response = ws.read_and_solve(image=image, filename=filename,
+                          output=output, keep=a.keep, border=a.border,
+                          time=a.time, returned_type=returned_type, url=a.url,
+                          timings=timings)
+
+    t = time.perf_counter()
+    if a.compact :
+        cr_ok = cr_solve_digits(output, response)[0]
+    else :
+        cr_ok = cr_solve(output, response)[0]
+    timings['cr_solve'] = time.perf_counter() - t
+    timings['total'] = time.perf_counter() - start # (retries, backoff)
+    return (timings, cr_ok)
+
+def compare(results, baseline, threshold):
+    """Returns the list of the regressions messages"""
+
+    regressions = list()
+    for stage in STAGES :
+        (new, old) = (results["stages"].get(stage),
+                      baseline.get("stages", dict()).get(stage))
+        if not new or not old :
+            continue
+        for p in ("p50", "p95") :
+            if new[p] > old[p] * (1 + threshold) and \
+               new[p] - old[p] > MIN_DELTA :
+                regressions.append("%s %s : %.1fms -> %.1fms (+%.0f%%)" %
+                        (stage, p, 1000 * old[p], 1000 * new[p],
+                         100 * (new[p] / old[p] - 1) if old[p] else 0))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end solve benchmark")
+    parser.add_argument("images", nargs="*", default=IMAGES)
+    parser.add_argument("-u", "--url", default=ws.URL_VSUDOKU)
+    parser.add_argument("-n", "--repeat", type=int, default=10)
+    parser.add_argument("-k", "--keep", type=int, default=None)
+    parser.add_argument("--border", type=int, default=None)
+    parser.add_argument("-t", "--time", type=int, default=None)
+    parser.add_argument("--uploadsize", type=int, default=UPLOAD_MAX_SIDE)
+    parser.add_argument("--gridcrop", type=int, default=1)
+    parser.add_argument("--compact", type=int, default=0)
+    parser.add_argument("--sweep", type=int, default=0,
+                        help="1 : keep/border candidates sent at once")
+    parser.add_argument("-o", "--output", default=None,
+                        help="results JSON file")
+    parser.add_argument("-b", "--baseline", default=None,
+                        help="baseline JSON file (previous results)")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    a = parser.parse_args()
+
+    values = dict((stage, list()) for stage in STAGES)
+    (failures, errors, attempts) = (0, 0, 0)
+    with tempfile.TemporaryDirectory() as dirpath :
+        output = os.path.join(dirpath,
+                              "solution.txt" if a.compact else "solution.jpg")
+        for r in range(a.repeat) :
+            for path in a.images :
+                try :
+                    (timings, cr_ok) = solve_once(path, output, a)
+                except Exception as e :
+                    errors += 1
+                    print("[ERROR] %s : %s" % (os.path.basename(path), e))
+                    continue
+                attempts += timings.get('attempts', 1)
+                failures += 0 if cr_ok else 1
+                for stage in STAGES :
+                    values[stage].append(timings.get(stage, 0.0))
+
+    results = {"config" : {"url" : a.url, "images" : [os.path.basename(p)
+                                                     for p in a.images],
+                           "repeat" : a.repeat, "keep" : a.keep,
+                           "border" : a.border, "time" : a.time,
+                           "uploadsize" : a.uploadsize,
+                           "gridcrop" : a.gridcrop, "compact" : a.compact,
+                           "sweep" : a.sweep},
+               "solves" : len(values["total"]), "errors" : errors,
+               "failures" : failures, "attempts" : attempts,
+               "stages" : dict((stage, summary(values[stage]))
+                               for stage in STAGES)}
+
+    print("%d solves (%d errors, %d cr_solve failures, %d attempts)" %
+          (results["solves"], errors, failures, attempts))
+    print("%-10s %10s %10s %10s %10s" % ("stage (ms)", "p50", "p95", "p99",
+                                         "mean"))
+    for stage in STAGES :
+        s = results["stages"][stage]
+        if s :
+            print("%-10s %10.1f %10.1f %10.1f %10.1f" % (stage,
+                      1000 * s["p50"], 1000 * s["p95"], 1000 * s["p99"],
+                      1000 * s["mean"]))
+    if a.output :
+        with open(a.output, 'wt') as f :
+            json.dump(results, f, indent=1)
+
+    if a.baseline :
+        with open(a.baseline, 'rt') as f :
+            regressions = compare(results, json.load(f), a.threshold)
+        for message in regressions :
+            print("[REGRESSION] %s" % (message))
+        if regressions :
+            sys.exit(1)
+        print("[INFO] no regression against %s" % (a.baseline))
+
+if __name__ == '__main__':
+    main()
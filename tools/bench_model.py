@@ -0,0 +1,87 @@
+""" Digits classifier engines comparison : Keras (.h5 model file) versus
+NumPy only forward pass (.npz model file, see tools/export_model.py)
+
+Usage (from repository root) :
+
+    python3 tools/bench_model.py model.h5 model.npz [-b batch] [-r repeat]
+
+Each engine is measured into its own process : import time, model loading
+time, RSS (maximal resident set size) and per batch prediction latency.
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import subprocess
+
+HOME_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(HOME_PATH, "app"))
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def measure(path, batch, repeat):
+    """Measures the engine of model file path (into current process)"""
+
+    result = {"rss_start" : rss_mb()}
+    t = time.perf_counter()
+    import numpy as np
+    if path.endswith(".npz") :
+        from visualsudoku import npmodel
+    else :
+        os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+        from tensorflow.keras import models
+    result["import"] = time.perf_counter() - t
+
+    from visualsudoku import classifier
+    t = time.perf_counter()
+    model = classifier.load_model(path)
+    result["load"] = time.perf_counter() - t
+
+    digits = np.random.RandomState(0).rand(batch, 28, 28).astype("float32")
+    classifier.predict_batch(model, digits) # warm up
+    t = time.perf_counter()
+    for r in range(repeat) :
+        classifier.predict_batch(model, digits)
+    result["batch"] = (time.perf_counter() - t) / repeat
+    result["rss"] = rss_mb()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Classifier benchmark")
+    parser.add_argument("models", nargs="+")
+    parser.add_argument("-b", "--batch", type=int, default=30)
+    parser.add_argument("-r", "--repeat", type=int, default=20)
+    parser.add_argument("--child", action="store_true",
+                        help=argparse.SUPPRESS)
+    a = parser.parse_args()
+
+    if a.child :
+        print(json.dumps(measure(os.path.abspath(a.models[0]), a.batch,
+                                 a.repeat)))
+        return
+
+    print("%-24s %10s %10s %10s %14s" % ("model", "import(s)", "load(s)",
+                                         "RSS(MB)", "batch %d (ms)" % a.batch))
+    for path in a.models :
+        output = subprocess.run([sys.executable, os.path.abspath(__file__),
+                                 path, "-b", str(a.batch), "-r", str(a.repeat),
+                                 "--child"], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True).stdout
+        try :
+            r = json.loads(output.strip().splitlines()[-1])
+        except (IndexError, ValueError) :
+            print("%-24s failed" % (os.path.basename(path)))
+            continue
+        print("%-24s %10.2f %10.2f %10.1f %14.2f" % (os.path.basename(path),
+                  r["import"], r["load"], r["rss"], 1000 * r["batch"]))
+
+if __name__ == '__main__':
+    main()
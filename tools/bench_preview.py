@@ -0,0 +1,110 @@
+""" Image screens benchmark : memory (RSS) and time per image while cycling
+through image files shown by the App screens (Linux)
+
+Usage (from repository root) :
+
+    python3 tools/bench_preview.py image_folder [-n count] [--app app_folder]
+
+The first count image files of image_folder (cycled if fewer) are shown
+alternately by the displayimage screen (set_image) and the displaysolution
+screen (show_file), a frame being drawn after each one. Reported : RSS at
+start, peak and end, time per image (p50, p95) including the screen
+transition frame.
+
+--app : App folder (for example an older version checked out elsewhere).
+The Camera widget is replaced by an image (headless runs with
+SDL_VIDEODRIVER=offscreen).
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import sys
+import time
+import argparse
+
+HOME_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(HOME_PATH, "app")
+EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+def rss():
+    """Returns the resident memory of the process (bytes)"""
+    with open("/proc/self/statm") as f :
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def main():
+    parser = argparse.ArgumentParser(description="Image screens benchmark")
+    parser.add_argument("folder", help="image files folder")
+    parser.add_argument("-n", "--count", type=int, default=100)
+    parser.add_argument("--app", default=APP_PATH, help="App folder")
+    a = parser.parse_args()
+
+    paths = sorted(os.path.join(os.path.abspath(a.folder), name)
+                   for name in os.listdir(a.folder)
+                   if name.lower().endswith(EXTENSIONS))
+    if not paths :
+        parser.error("no image file into %s" % (a.folder))
+    paths = [paths[i % len(paths)] for i in range(a.count)]
+
+    os.environ.setdefault("KIVY_NO_ARGS", "1")
+    os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+    app_path = os.path.abspath(a.app)
+    os.chdir(app_path)
+    sys.path.insert(0, app_path)
+    from kivy.factory import Factory
+    from kivy.uix.image import Image
+    from kivy.properties import BooleanProperty, ListProperty
+    class NoCamera(Image):
+        play = BooleanProperty(False)
+        resolution = ListProperty([-1, -1])
+    Factory.unregister('Camera')
+    Factory.register('Camera', cls=NoCamera)
+    from kivy.lang import Builder
+    from kivy.base import EventLoop
+    from kivy.core.window import Window
+    import main as vsapp
+    Builder.load_file('visualsudoku.kv')
+
+    app = vsapp.VisualSudokuApp()
+    app.load_config()
+    sm = app.build()
+    Window.add_widget(sm)
+    vsapp.SETTINGS["speculative"] = 0
+    if hasattr(sm, "screen") :
+        screen = sm.screen
+    else : # (App without lazy screens)
+        screen = lambda name: sm.screens[sm.number[name]]
+    for i in range(5) :
+        EventLoop.idle()
+
+    start = rss()
+    peak = start
+    durations = list()
+    for (i, path) in enumerate(paths) :
+        name = ('displayimage', 'displaysolution')[i % 2]
+        t = time.perf_counter()
+        sm.current = name
+        if name == 'displayimage' :
+            screen(name).set_image(filepath=path)
+        else :
+            screen(name).show_file(path)
+        EventLoop.idle()
+        durations.append(time.perf_counter() - t)
+        for j in range(3) :
+            EventLoop.idle()
+            peak = max(peak, rss())
+    durations.sort()
+    end = rss()
+
+    print("%s (%d images)" % (app_path, len(paths)))
+    print("RSS (MB)  start %d  peak %d (+%d)  end %d" % (start >> 20,
+                                   peak >> 20, (peak - start) >> 20, end >> 20))
+    print("per image (ms)  p50 %.1f  p95 %.1f" % (
+                               1000 * durations[len(durations) // 2],
+                               1000 * durations[int(0.95 * len(durations))]))
+    app.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+""" Per grid recognition latency of the LOCAL mode engine : cells extraction
+and digits classification, cell by cell (before) versus batched (after)
+
+Usage (from repository root) :
+
+    python3 tools/bench_recognition.py [image ...] [-m model] [-r repeat]
+
+Default image : img/sudoku.jpg. The classification is measured only if the
+model can be loaded (model file available), otherwise the number of model
+calls is reported.
+
+The batched extraction is checked against the cell by cell one (same
+indices and digit images) over keep and border values (CHECK_KEEP,
+CHECK_BORDER) : exit code 1 if different.
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+HOME_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(HOME_PATH, "app"))
+
+import grid
+from visualsudoku import cells, classifier
+from visualsudoku import toulbar2_visual_sudoku_puzzle as local
+
+MODEL = os.path.join("visualsudoku", "mixed_classifier.npz")
+CHECK_KEEP = (0, 40, 55, 70, 85, 100) # keep values of the check
+CHECK_BORDER = (0, 3, 7, 15, 30) # border values of the check
+
+def extract_cell_by_cell(warped, keep=0, border=0):
+    """Cells extraction as done before batching : (indices, digits)"""
+
+    binary = cells.binarize(warped)
+    (indices, digits) = (list(), list())
+    for row in range(9) :
+        for col in range(9) :
+            (y0, y1, x0, x1) = cells.cell_region(warped.shape, row, col,
+                                                 keep, border)
+            digit = cells.extract_digit(binary[y0:y1, x0:x1])
+            if digit is not None :
+                indices.append(9*row+col)
+                digits.append(digit)
+    return (indices, np.array(digits, dtype="float32").reshape(
+                                      -1, cells.DIGIT_SIZE, cells.DIGIT_SIZE))
+
+def recognize_cell_by_cell(warped, model, keep=0, border=0):
+    """Cells extraction and classification as done before batching"""
+
+    (indices, digits) = extract_cell_by_cell(warped, keep, border)
+    givens = [0] * 81
+    if model is not None :
+        for (i, digit) in zip(indices, digits) :
+            (givens[i], p) = classifier.predict(model, digit)
+    return (givens, len(indices))
+
+def check(warped):
+    """Returns the (keep, border) values (see CHECK_KEEP, CHECK_BORDER)
+    for which batched and cell by cell extractions differ (indices or
+    digit images)"""
+
+    different = list()
+    for keep in CHECK_KEEP :
+        for border in CHECK_BORDER :
+            (indices, digits) = extract_cell_by_cell(warped, keep, border)
+            (indices_b, digits_b) = cells.extract_digits(warped, keep, border)
+            if indices != indices_b or not np.array_equal(digits, digits_b) :
+                different.append((keep, border))
+    return different
+
+def recognize_batched(warped, model, keep=0, border=0):
+    (indices, digits) = cells.extract_digits(warped, keep, border)
+    givens = [0] * 81
+    if model is not None :
+        (values, probabilities) = classifier.predict_batch(model, digits)
+        for (i, value) in zip(indices, values) :
+            givens[i] = value
+    return (givens, 1 if len(indices) else 0)
+
+def measure(function, warped, model, repeat):
+    t = time.perf_counter()
+    for r in range(repeat) :
+        (givens, calls) = function(warped, model)
+    return ((time.perf_counter() - t) / repeat, givens, calls)
+
+def main():
+    parser = argparse.ArgumentParser(description="Recognition benchmark")
+    parser.add_argument("images", nargs="*",
+                        default=[os.path.join(HOME_PATH, "img", "sudoku.jpg")])
+    parser.add_argument("-m", "--model", default=MODEL)
+    parser.add_argument("-r", "--repeat", type=int, default=50)
+    a = parser.parse_args()
+
+    try :
+        model = classifier.load_model(a.model)
+    except Exception as e :
+        print("[INFO] model not loaded (%s) : extraction only" % (e))
+        model = None
+
+    print("%-20s %14s %14s %14s" % ("image", "before (ms)", "after (ms)",
+                                    "model calls"))
+    failed = False
+    for path in a.images :
+        gray = local.read_image(path)
+        corners = grid.find_grid(gray)
+        if corners is None :
+            print("%-20s grid not found" % (os.path.basename(path)))
+            continue
+        warped = grid.warp_grid(gray, corners, local.WARPED_SIZE, margin=0)
+        recognize_batched(warped, model) # warm up
+        (before, givens_before, calls_before) = measure(
+                               recognize_cell_by_cell, warped, model, a.repeat)
+        (after, givens_after, calls_after) = measure(
+                               recognize_batched, warped, model, a.repeat)
+        print("%-20s %14.2f %14.2f %8d -> %d" % (os.path.basename(path),
+                  1000 * before, 1000 * after, calls_before, calls_after))
+        if givens_before != givens_after :
+            print("[WARNING] different recognized grids")
+        different = check(warped)
+        if different :
+            failed = True
+            print("[ERROR] batched extraction different for (keep, border) "
+                  "%s" % (different))
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+""" Sudoku solver throughput (puzzles/second) over a corpus of hard puzzles
+
+Usage (from repository root) :
+
+    python3 tools/bench_solver.py [corpus_file] [-r repeat]
+
+corpus_file : one puzzle per line (81 characters, '0' or '.' for an empty
+cell, other lines ignored). Default : some well known hard puzzles (see
+HARD_PUZZLES).
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import sys
+import time
+import argparse
+
+HOME_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(HOME_PATH, "app"))
+
+from visualsudoku import solver
+
+HARD_PUZZLES = [
+ # Arto Inkala (2012)
+ "8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..",
+ # Easter Monster
+ "1.......2.9.4...5...6...7...5.9.3.......7.......85..4.7.....6...3...9.8...2.....1",
+ # AI Escargot
+ "1....7.9..3..2...8..96..5....53..9...1..8...26....4...3......1..4......7..7...3..",
+ # top95 (first ones)
+ "4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......",
+ "52...6.........7.13...........4..8..6......5...........418.........3..2...87.....",
+ "6.....8.3.4.7.................5.4.7.3..2.....1.6.......2.....5.....8.6......1....",
+ "48.3............71.2.......7.5....6....2..8.............1.76...3.....4......5....",
+]
+
+def read_corpus(path):
+    puzzles = list()
+    with open(path, 'rt') as f :
+        for line in f :
+            line = line.strip()
+            if len(line) == 81 and all(c in "0123456789." for c in line) :
+                puzzles.append(line)
+    return puzzles
+
+def grid(puzzle):
+    return [0 if c in "0." else int(c) for c in puzzle]
+
+def main():
+    parser = argparse.ArgumentParser(description="Sudoku solver benchmark")
+    parser.add_argument("corpus", nargs="?", default=None)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    a = parser.parse_args()
+    puzzles = read_corpus(a.corpus) if a.corpus else HARD_PUZZLES
+
+    statuses = dict()
+    slowest = 0.0
+    t0 = time.perf_counter()
+    for r in range(a.repeat) :
+        for puzzle in puzzles :
+            t = time.perf_counter()
+            (status, solution) = solver.solve(grid(puzzle))
+            slowest = max(slowest, time.perf_counter() - t)
+            if r == 0 :
+                statuses[status] = statuses.get(status, 0) + 1
+    elapsed = time.perf_counter() - t0
+    n = a.repeat * len(puzzles)
+    print("%d puzzles x %d : %.3fs, %.1f puzzles/s (mean %.2fms, max %.2fms)"
+          % (len(puzzles), a.repeat, elapsed, n / elapsed,
+             1000 * elapsed / n, 1000 * slowest))
+    print("status : %s" % (statuses))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+""" App cold start benchmark : time to first frame (Linux)
+
+Usage (from repository root) :
+
+    python3 tools/bench_startup.py [-n repeat] [--app app_folder] [--nocamera]
+
+The App (app/main.py, or the one of app_folder, for example an older
+version checked out elsewhere) is run n times, each into a new process,
+until its first frame is displayed (Window on_flip), then stopped.
+Reported (seconds, median and max over the runs) : import (main module),
+build (until on_start), first_frame (from the process launch).
+
+--nocamera : the Camera widget is replaced by an image (machines without
+camera, or headless runs with SDL_VIDEODRIVER=offscreen).
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+HOME_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(HOME_PATH, "app")
+STAGES = ("import", "build", "first_frame")
+
+def child(app_path, launched, nocamera):
+    """Runs the App until its first frame, prints the timings as JSON"""
+
+    os.environ.setdefault("KIVY_NO_ARGS", "1")
+    os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+    os.chdir(app_path)
+    sys.path.insert(0, app_path)
+    if nocamera :
+        from kivy.factory import Factory
+        from kivy.uix.image import Image
+        from kivy.properties import BooleanProperty, ListProperty
+        class NoCamera(Image):
+            play = BooleanProperty(False)
+            resolution = ListProperty([-1, -1])
+        Factory.unregister('Camera')
+        Factory.register('Camera', cls=NoCamera)
+
+    t = time.time()
+    import main
+    timings = {"import" : time.time() - t}
+    from kivy.core.window import Window
+
+    app = main.VisualSudokuApp()
+    def on_start(*args):
+        timings["build"] = time.time() - t - timings["import"]
+    def on_flip(*args):
+        Window.unbind(on_flip=on_flip)
+        timings["first_frame"] = time.time() - launched
+        print(json.dumps(timings))
+        sys.stdout.flush()
+        app.stop()
+    app.bind(on_start=on_start)
+    Window.bind(on_flip=on_flip)
+    app.run()
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+def main():
+    parser = argparse.ArgumentParser(description="App cold start benchmark")
+    parser.add_argument("-n", "--repeat", type=int, default=5)
+    parser.add_argument("--app", default=APP_PATH, help="App folder")
+    parser.add_argument("--nocamera", action="store_true")
+    parser.add_argument("--child", type=float, default=None,
+                        help=argparse.SUPPRESS) # launch time
+    a = parser.parse_args()
+
+    if a.child is not None :
+        return child(os.path.abspath(a.app), a.child, a.nocamera)
+
+    values = dict((stage, list()) for stage in STAGES)
+    for r in range(a.repeat) :
+        cmd = [sys.executable, os.path.abspath(__file__), "--app",
+               os.path.abspath(a.app), "--child", "%.6f" % time.time()]
+        if a.nocamera :
+            cmd.append("--nocamera")
+        out = subprocess.run(cmd, stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL, check=True,
+                             universal_newlines=True).stdout
+        timings = json.loads(out.strip().splitlines()[-1])
+        for stage in STAGES :
+            values[stage].append(timings[stage])
+
+    print("%s (%d runs)" % (a.app, a.repeat))
+    print("%-12s %10s %10s" % ("stage (ms)", "median", "max"))
+    for stage in STAGES :
+        print("%-12s %10.1f %10.1f" % (stage, 1000 * median(values[stage]),
+                                       1000 * max(values[stage])))
+
+if __name__ == '__main__':
+    main()
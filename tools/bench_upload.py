@@ -0,0 +1,86 @@
+""" Upload preprocessing report : bytes and upload latency saved
+
+Measures prepare_upload (app/preprocess.py) on grid images : uploaded size,
+encoding time, and estimated upload time for some uplink rates.
+
+Usage (from repository root) :
+
+    python3 tools/bench_upload.py [image ...]
+
+Default images : img/sudoku.jpg, plus a 4000x3000 version of it (as
+captured by a 12 MP phone camera).
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import io
+import os
+import sys
+import time
+
+HOME_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(HOME_PATH, "app"))
+
+from PIL import Image
+from preprocess import prepare_upload
+
+UPLINKS = {'3G 1 Mbit/s': 1e6, '4G 5 Mbit/s': 5e6} # bits per second
+
+CONFIGS = [ # (max_side, fmt, quality)
+            (1600, 'JPEG', 85),
+            (1280, 'JPEG', 85),
+            (1024, 'JPEG', 75),
+            (1280, 'WEBP', 80),
+            (800, 'WEBP', 70),
+          ]
+
+REPEAT = 5
+
+def phone_photo(path, size=(4000, 3000)):
+    """Returns a phone camera like (large, high quality JPEG) version of
+    path image"""
+
+    buffer = io.BytesIO()
+    Image.open(path).convert('RGB').resize(size, Image.BICUBIC).save(
+                                             buffer, format='JPEG', quality=95)
+    return buffer.getvalue()
+
+def report(name, content):
+    print("\n%s : %d bytes" % (name, len(content)))
+    print("%-18s %9s %7s %9s" % ("config", "bytes", "saved", "encode"), end="")
+    for uplink in UPLINKS :
+        print(" %16s" % (uplink), end="")
+    print()
+    for (max_side, fmt, quality) in CONFIGS :
+        t = time.perf_counter()
+        for i in range(REPEAT) :
+            (upload, extension) = prepare_upload(content, max_side=max_side,
+                                                 fmt=fmt, quality=quality)
+        encode = (time.perf_counter() - t) / REPEAT
+        saved = 1.0 - len(upload) / len(content)
+        print("%-18s %9d %6.1f%% %7.1fms" % ("%s %d q%d" % (fmt, max_side,
+              quality), len(upload), 100*saved, 1000*encode), end="")
+        for rate in UPLINKS.values() :
+            before = 8 * len(content) / rate
+            after = encode + 8 * len(upload) / rate
+            print(" %6.0fms (%+5.0f)" % (1000*after, 1000*(after-before)),
+                  end="")
+        print()
+
+def main(paths):
+    if paths :
+        for path in paths :
+            with open(path, 'rb') as f :
+                report(path, f.read())
+    else :
+        path = os.path.join(HOME_PATH, "img", "sudoku.jpg")
+        with open(path, 'rb') as f :
+            report("img/sudoku.jpg", f.read())
+        report("img/sudoku.jpg as 4000x3000 phone photo", phone_photo(path))
+    print("\nUpload columns : encode + upload time (difference with the "
+          "original upload time)")
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
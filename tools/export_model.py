@@ -0,0 +1,69 @@
+""" Exports the Keras .h5 digits classifier as a .npz file, for the NumPy
+only forward pass of the LOCAL mode engine (app/visualsudoku/npmodel.py)
+
+Usage (from repository root, where tensorflow is installed) :
+
+    python3 tools/export_model.py model.h5 [model.npz]
+
+Default output : the .h5 file path with the .npz extension.
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+HOME_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(HOME_PATH, "app"))
+
+from visualsudoku.npmodel import LAYERS
+
+CONFIG_KEYS = ("activation", "padding", "strides", "pool_size", "data_format",
+               "epsilon", "center", "scale") # used by the forward pass
+
+def export_model(h5_path, npz_path):
+    from tensorflow.keras.models import load_model
+
+    model = load_model(h5_path, compile=False)
+    layers = list()
+    arrays = dict()
+    for (i, layer) in enumerate(model.layers) :
+        class_name = layer.__class__.__name__
+        if class_name not in LAYERS :
+            raise ValueError("unsupported layer %s" % (class_name))
+        config = layer.get_config()
+        if config.get("data_format", "channels_last") != "channels_last" :
+            raise ValueError("unsupported data_format %s" %
+                             (config["data_format"]))
+        layers.append({"class_name" : class_name,
+                       "config" : dict((k, config[k]) for k in CONFIG_KEYS
+                                       if k in config)})
+        for (j, weight) in enumerate(layer.get_weights()) :
+            arrays["%d_%d" % (i, j)] = weight.astype("float32")
+    np.savez_compressed(npz_path, layers=json.dumps(layers), **arrays)
+    return model
+
+def main():
+    parser = argparse.ArgumentParser(description="Keras model export")
+    parser.add_argument("h5")
+    parser.add_argument("npz", nargs="?", default=None)
+    a = parser.parse_args()
+    npz_path = a.npz or os.path.splitext(a.h5)[0] + ".npz"
+
+    model = export_model(a.h5, npz_path)
+    print("[INFO] %s (%d bytes) -> %s (%d bytes)" % (a.h5,
+              os.path.getsize(a.h5), npz_path, os.path.getsize(npz_path)))
+
+    from visualsudoku.npmodel import NumpyModel
+    x = np.random.RandomState(0).rand(81, *model.input_shape[1:])
+    difference = np.abs(model.predict(x.astype("float32"), verbose=0) -
+                        NumpyModel(npz_path).predict_on_batch(x)).max()
+    print("[INFO] maximal difference with Keras prediction : %g" % (difference))
+
+if __name__ == '__main__':
+    main()
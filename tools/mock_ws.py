@@ -0,0 +1,251 @@
+""" Local stand-in for the vsudoku web service (same url contract, see
+app/ws.py), answering canned responses with latency and fault injection,
+to test and measure the App client under slow and flaky networks
+
+Usage (from repository root) :
+
+    python3 tools/mock_ws.py [-p port] [--latency s] [--jitter s]
+                             [--bandwidth kB/s] [--error-rate r]
+                             [--text-rate r] [--truncate-rate r] [--seed n]
+                             [--difficulty s]
+
+App side : 'wsurl' setting (or VSUDOKU_URL environment variable) as
+http://localhost:<port>/api/tool/vsudoku
+
+Responses (POST /api/tool/vsudoku, form fields as the real service) :
+
+  - solved (default) : the solution image file (--solution, returned_type
+    'stdout'), or the recognized grid and solution digits ('stdout.txt',
+    'run.zip'),
+  - --text-rate : error text file, as the real service when the grid is not
+    found or not solved (App side : see cr_solve),
+  - --error-rate : HTTP 5xx (ERROR_STATUS),
+  - --truncate-rate : body cut at half of its Content-Length, connection
+    closed,
+  - --difficulty : server time (seconds) needed to solve the grid : with a
+    lower 'time' field, error text TIMEOUT_TEXT after 'time' seconds (else
+    solved after difficulty seconds), see 'adaptivetime' setting.
+
+Every response waits latency (+ uniform jitter) seconds. --bandwidth caps
+both the request body reading and the response writing (per connection).
+The random choices are reproducible (--seed).
+
+GET /stats : JSON counters of the responses.
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import io
+import json
+import time
+import random
+import socket
+import zipfile
+import argparse
+import threading
+import collections
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from vsudoku_server import PATH, parse_form, grid_text, int_field
+
+HOME_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PORT = 8090
+SOLUTION = os.path.join(HOME_PATH, "img", "sudoku.jpg") # canned image
+GIVENS = ("090200084500900300870000020010007008705000102"
+          "400100090050000036002004009140006070")
+SOLUTION_DIGITS = ("693271584521948367874563921219437658735689142"
+                   "486125793957812436362754819148396275")
+ERROR_TEXT = "[ERROR] Sudoku grid not found\n"
+TIMEOUT_TEXT = "[ERROR] Sudoku grid timeout\n"
+TIME_DEFAULT = 5 # seconds, 'time' field default value
+ERROR_STATUS = (500, 502, 503, 504)
+BLOCK_SIZE = 4096 # bytes, throttled transfers granularity
+
+class Faults(object):
+    """Faults configuration and reproducible random choices"""
+
+    def __init__(self, latency=0.0, jitter=0.0, bandwidth=0.0, error_rate=0.0,
+                 text_rate=0.0, truncate_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth * 1024 # bytes/s (0 : no cap)
+        self.error_rate = error_rate
+        self.text_rate = text_rate
+        self.truncate_rate = truncate_rate
+        self.counters = collections.Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Returns (outcome, delay, status) of a request, outcome being
+        'error' (HTTP status), 'text', 'truncated' or 'solved'"""
+
+        with self._lock :
+            r = self._random.random()
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            outcome = 'solved'
+            for (name, rate) in (('error', self.error_rate),
+                                 ('text', self.text_rate),
+                                 ('truncated', self.truncate_rate)) :
+                if r < rate :
+                    outcome = name
+                    break
+                r -= rate
+            self.counters[outcome] += 1
+            status = self._random.choice(ERROR_STATUS)
+        return (outcome, delay, status)
+
+def canned_content(returned_type, solution_image):
+    """Returns (content, content_type) of a solved grid"""
+
+    if returned_type == 'stdout' :
+        return (solution_image, 'image/jpeg')
+    text = grid_text("solved", GIVENS, SOLUTION_DIGITS)
+    if returned_type == 'run.zip' :
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as z :
+            z.writestr("stdout.txt", text)
+        return (buffer.getvalue(), 'application/zip')
+    return (text.encode('utf-8'), 'text/plain')
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True # no delayed ACK wait of the body
+
+    def log_message(self, format, *args):
+        if self.server.verbose :
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def read_body(self, length):
+        rate = self.server.faults.bandwidth
+        if not rate :
+            return self.rfile.read(length)
+        body = bytearray()
+        while len(body) < length :
+            t = time.monotonic()
+            block = self.rfile.read(min(BLOCK_SIZE, length - len(body)))
+            if not block :
+                break
+            body.extend(block)
+            time.sleep(max(0.0, len(block) / rate - (time.monotonic() - t)))
+        return bytes(body)
+
+    def write_body(self, content):
+        rate = self.server.faults.bandwidth
+        if not rate :
+            self.wfile.write(content)
+            return
+        for i in range(0, len(content), BLOCK_SIZE) :
+            t = time.monotonic()
+            block = content[i:i+BLOCK_SIZE]
+            self.wfile.write(block)
+            self.wfile.flush()
+            time.sleep(max(0.0, len(block) / rate - (time.monotonic() - t)))
+
+    def reply(self, code, content, content_type='text/plain', length=None):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length',
+                         str(len(content) if length is None else length))
+        self.end_headers()
+        self.write_body(content)
+
+    def do_GET(self):
+        if self.path.split('?')[0] == "/stats" :
+            self.reply(200, json.dumps(self.server.faults.counters,
+                                       indent=1).encode('utf-8'),
+                       'application/json')
+        else :
+            self.reply(404, b"[ERROR] not found\n")
+
+    def do_POST(self):
+        if self.path.split('?')[0] != PATH :
+            return self.reply(404, b"[ERROR] not found\n")
+        body = self.read_body(int(self.headers.get('Content-Length', 0)))
+        try :
+            fields = parse_form(self.headers.get('Content-Type', ''), body)
+            if 'file' not in fields :
+                raise KeyError('file')
+            returned_type = fields.get('returned_type',
+                                       (None, b'stdout'))[1].decode('ascii')
+            time_value = int_field(fields, 'time') or TIME_DEFAULT
+        except (KeyError, ValueError, UnicodeDecodeError) as e :
+            return self.reply(400, ("[ERROR] bad request (%s)\n" %
+                                    (e)).encode('utf-8'))
+
+        faults = self.server.faults
+        (outcome, delay, status) = faults.draw()
+        time.sleep(delay)
+        difficulty = self.server.difficulty
+        if difficulty :
+            time.sleep(min(time_value, difficulty))
+            if time_value < difficulty :
+                return self.reply(200, TIMEOUT_TEXT.encode('utf-8'))
+        if outcome == 'error' :
+            return self.reply(status, b"[ERROR] server error\n")
+        if outcome == 'text' :
+            return self.reply(200, ERROR_TEXT.encode('utf-8'))
+        (content, content_type) = canned_content(returned_type,
+                                                 self.server.solution_image)
+        if outcome == 'truncated' :
+            self.close_connection = True
+            self.reply(200, content[:len(content)//2], content_type,
+                       length=len(content))
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        self.reply(200, content, content_type)
+
+def make_server(port=PORT, faults=None, solution=SOLUTION, verbose=False,
+                difficulty=0.0):
+    """Returns the mock server (serve_forever() to be called)"""
+
+    server = ThreadingHTTPServer(("", port), Handler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    server.difficulty = difficulty
+    server.faults = faults or Faults()
+    with open(solution, 'rb') as f :
+        server.solution_image = f.read()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="vsudoku web service mock")
+    parser.add_argument("-p", "--port", type=int, default=PORT)
+    parser.add_argument("--solution", default=SOLUTION,
+                        help="solution image file returned")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="response delay (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="random delay added to latency (seconds)")
+    parser.add_argument("--bandwidth", type=float, default=0.0,
+                        help="transfer cap (kB/s, 0 : no cap)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="ratio of HTTP 5xx responses")
+    parser.add_argument("--text-rate", type=float, default=0.0,
+                        help="ratio of error text file responses")
+    parser.add_argument("--truncate-rate", type=float, default=0.0,
+                        help="ratio of truncated responses")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--difficulty", type=float, default=0.0,
+                        help="server time needed to solve (seconds, 0 : none)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    a = parser.parse_args()
+
+    faults = Faults(a.latency, a.jitter, a.bandwidth, a.error_rate,
+                    a.text_rate, a.truncate_rate, a.seed)
+    server = make_server(a.port, faults, a.solution, a.verbose, a.difficulty)
+    print("[INFO] http://localhost:%d%s" % (a.port, PATH))
+    try :
+        server.serve_forever()
+    except KeyboardInterrupt :
+        pass
+    finally :
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,353 @@
+""" Self-hostable vsudoku web service : same endpoint and form fields as the
+remote service called by the App (see app/ws.py), the grids being solved by
+the LOCAL mode engine (app/visualsudoku) into a pool of worker processes
+where the model is loaded once
+
+Usage (from repository root) :
+
+    python3 tools/vsudoku_server.py [-p port] [-w workers] [-q queue]
+                                    [-m model] [-t max_time]
+
+POST /api/tool/vsudoku : multipart form fields 'file' (grid image), 'keep',
+'border', 'time', 'returned_type' ('stdout' : solution image, or error text
+file ; 'stdout.txt' : recognized grid and solution digits ; 'run.zip' :
+stdout.txt into a zip file).
+
+The 'time' field (solve time limit, seconds) is capped to max_time, so that
+a request can not hold a worker longer ; a 'time', 'keep' or 'border' value
+that is not a number (or negative) is rejected (HTTP 400).
+
+At most workers solves run at once, and queue more are waiting for a
+worker : beyond, the request is rejected at once (HTTP 429, Retry-After).
+
+GET /metrics : JSON queue depth, counters and latencies (p50, p95, p99 of
+the last LATENCY_WINDOW requests : total, waiting into the queue, solving).
+
+App side : 'wsurl' setting (or VSUDOKU_URL environment variable) as
+http://<host>:<port>/api/tool/vsudoku
+"""
+
+__author__    = "Nathalie Rousse"
+__copyright__ = "Copyright 2020, INRAE"
+__license__   = "MIT"
+
+import os
+import io
+import sys
+import json
+import time
+import zipfile
+import argparse
+import tempfile
+import threading
+import collections
+import email.parser
+import email.policy
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+HOME_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(HOME_PATH, "app"))
+
+PATH = "/api/tool/vsudoku"
+MODEL = os.path.join("visualsudoku", "mixed_classifier.npz")
+PORT = 8080
+QUEUE_SIZE = 16 # waiting requests (beyond the running ones)
+RETRY_AFTER = 1 # seconds, HTTP 429 Retry-After value
+LATENCY_WINDOW = 1000 # requests kept for latencies percentiles
+MAX_CONTENT_LENGTH = 20*1024*1024 # bytes
+MAX_TIME = 60 # seconds, cap of the 'time' field (as the App adaptive time)
+
+#------------------------------------------------------------------------------
+# Worker process
+#------------------------------------------------------------------------------
+
+_model = None
+
+def init_worker(model):
+    """Worker process initializer : model and engine loaded once"""
+
+    global _model
+    from visualsudoku import classifier
+    _model = model
+    classifier.load_model(model)
+
+def grid_text(status, givens, solution, error=""):
+    """Returns the 'stdout.txt' text (see app/solution.py)"""
+
+    from visualsudoku import solver
+
+    lines = list()
+    if givens is not None :
+        lines.append("[INFO] recognized grid :")
+        lines.append("".join(str(v) for v in givens))
+    if solution is not None :
+        if status != solver.SOLVED :
+            lines.append("[WARNING] Sudoku grid %s" % (status))
+        lines.append("[INFO] solution :")
+        lines.append("".join(str(v) for v in solution))
+    else :
+        lines.append(error.strip() or "[ERROR] Sudoku grid %s" % (status))
+    return "\n".join(lines) + "\n"
+
+def solve_job(image, keep, border, time_value, returned_type):
+    """Solves image (bytes), returns (content, content_type, solve_start,
+    solve_end) (solve times : time.time())"""
+
+    from visualsudoku import solver
+    from visualsudoku.toulbar2_visual_sudoku_puzzle import read_and_solve
+
+    start = time.time()
+    with tempfile.TemporaryDirectory() as dirpath :
+        output = os.path.join(dirpath, "solution.jpg")
+        try :
+            (status, givens, solution) = read_and_solve({"model" : _model,
+                    "image" : image, "output" : output, "keep" : keep,
+                    "border" : border, "time" : time_value})
+            with open(output, 'rb') as f :
+                content = f.read()
+        except ValueError as e : # unreadable image
+            (status, givens, solution) = (None, None, None)
+            content = ("[ERROR] %s\n" % (e)).encode('utf-8')
+    solved = solver.is_solved(status)
+
+    if returned_type == 'stdout' :
+        content_type = 'image/jpeg' if solved else 'text/plain'
+    else :
+        text = grid_text(status, givens, solution,
+                         "" if solved else content.decode('utf-8', 'replace'))
+        content = text.encode('utf-8')
+        content_type = 'text/plain'
+        if returned_type == 'run.zip' :
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as z :
+                z.writestr("stdout.txt", text)
+            (content, content_type) = (buffer.getvalue(), 'application/zip')
+    return (content, content_type, start, time.time())
+
+#------------------------------------------------------------------------------
+# Queue and metrics
+#------------------------------------------------------------------------------
+
+def percentiles(values):
+    if not values :
+        return {"p50" : None, "p95" : None, "p99" : None}
+    values = sorted(values)
+    last = len(values) - 1
+    return dict(("p%d" % p, round(values[int(round(last * p / 100.0))], 4))
+                for p in (50, 95, 99))
+
+class JobQueue(object):
+    """Bounded admission of the solve requests (workers running, queue_size
+    waiting), and metrics"""
+
+    def __init__(self, workers, queue_size):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.in_flight = 0
+        self.counters = collections.Counter()
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Returns True if the request is admitted, False if queue full"""
+
+        with self._lock :
+            self.counters["requests"] += 1
+            if self.in_flight >= self.workers + self.queue_size :
+                self.counters["rejected"] += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, ok, received=None, solve_start=None, solve_end=None):
+        with self._lock :
+            self.in_flight -= 1
+            self.counters["completed" if ok else "failed"] += 1
+            if ok :
+                self.latencies.append((time.time() - received,
+                                       solve_start - received,
+                                       solve_end - solve_start))
+
+    def metrics(self):
+        with self._lock :
+            (total, wait, solve) = (list(zip(*self.latencies)) or
+                                    (list(), list(), list()))
+            return {"workers" : self.workers,
+                    "queue_size" : self.queue_size,
+                    "in_flight" : self.in_flight,
+                    "queue_depth" : max(0, self.in_flight - self.workers),
+                    "requests" : self.counters["requests"],
+                    "completed" : self.counters["completed"],
+                    "rejected" : self.counters["rejected"],
+                    "failed" : self.counters["failed"],
+                    "uptime" : round(time.time() - self.started, 1),
+                    "latency" : percentiles(total),
+                    "queue_wait" : percentiles(wait),
+                    "solve" : percentiles(solve)}
+
+#------------------------------------------------------------------------------
+# HTTP
+#------------------------------------------------------------------------------
+
+def parse_form(content_type, body):
+    """Returns the dict name:(filename, value bytes) of the multipart form
+    data body"""
+
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                    b"Content-Type: " + content_type.encode('latin-1') +
+                    b"\r\n\r\n" + body)
+    fields = dict()
+    if message.is_multipart() :
+        for part in message.iter_parts() :
+            name = part.get_param('name', header='content-disposition')
+            if name :
+                fields[name] = (part.get_filename(),
+                                part.get_payload(decode=True) or b'')
+    return fields
+
+def int_field(fields, name):
+    if name not in fields :
+        return None
+    value = int(fields[name][1].decode('ascii').strip() or 0)
+    if value < 0 :
+        raise ValueError("negative %s" % (name))
+    return value
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive (see app/ws.py session)
+    disable_nagle_algorithm = True # no delayed ACK wait of the body
+
+    def log_message(self, format, *args):
+        if self.server.verbose :
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def reply(self, code, content, content_type='text/plain', headers=None):
+        if isinstance(content, str) :
+            content = content.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        for (k, v) in (headers or dict()).items() :
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        if self.path.split('?')[0] == "/metrics" :
+            self.reply(200, json.dumps(self.server.queue.metrics(), indent=1),
+                       'application/json')
+        else :
+            self.reply(404, "[ERROR] not found\n")
+
+    def do_POST(self):
+        received = time.time()
+        if self.path.split('?')[0] != PATH :
+            return self.reply(404, "[ERROR] not found\n")
+        length = self.headers.get('Content-Length')
+        if length is None :
+            return self.reply(411, "[ERROR] Content-Length required\n")
+        try :
+            length = int(length)
+            if length < 0 :
+                raise ValueError(length)
+        except ValueError :
+            self.close_connection = True
+            return self.reply(400, "[ERROR] invalid Content-Length\n")
+        if length > MAX_CONTENT_LENGTH :
+            self.close_connection = True
+            return self.reply(413, "[ERROR] request too large\n")
+        body = self.rfile.read(length)
+
+        try :
+            fields = parse_form(self.headers.get('Content-Type', ''), body)
+            image = fields['file'][1]
+            (keep, border, time_value) = (int_field(fields, 'keep'),
+                                          int_field(fields, 'border'),
+                                          int_field(fields, 'time'))
+            returned_type = fields.get('returned_type',
+                                       (None, b'stdout'))[1].decode('ascii')
+            if time_value is not None :
+                time_value = min(time_value, self.server.max_time)
+        except (KeyError, ValueError, UnicodeDecodeError) as e :
+            return self.reply(400, "[ERROR] bad request (%s)\n" % (e))
+
+        queue = self.server.queue
+        if not queue.acquire() :
+            return self.reply(429, "[ERROR] server busy\n",
+                              headers={'Retry-After' : str(RETRY_AFTER)})
+        try :
+            (content, content_type, solve_start, solve_end) = \
+                self.server.pool.submit(solve_job, image, keep, border,
+                                        time_value, returned_type).result()
+        except Exception as e :
+            queue.release(False)
+            return self.reply(500, "[ERROR] %s\n" % (e))
+        queue.release(True, received, solve_start, solve_end)
+        self.reply(200, content, content_type)
+
+def make_server(port=PORT, workers=None, queue_size=QUEUE_SIZE, model=MODEL,
+                verbose=False, max_time=MAX_TIME):
+    """Returns the server (serve_forever() to be called), with its pool of
+    workers processes started
+
+    The model is loaded first (error raised if missing or bad), and each
+    worker has loaded it once the server is returned (error raised if a
+    worker failed).
+    """
+
+    from visualsudoku import classifier
+    classifier.load_model(model) # (inherited by the forked workers)
+
+    workers = workers or os.cpu_count() or 1
+    server = ThreadingHTTPServer(("", port), Handler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    server.max_time = max_time
+    server.queue = JobQueue(workers, queue_size)
+    server.pool = ProcessPoolExecutor(max_workers=workers,
+                                      initializer=init_worker,
+                                      initargs=(model,))
+    try :
+        warm_up = [server.pool.submit(time.sleep, 0.1) # (one per worker)
+                   for i in range(workers)]
+        for future in warm_up :
+            future.result() # BrokenProcessPool if an initializer failed
+    except Exception :
+        server.server_close()
+        server.pool.shutdown(cancel_futures=True)
+        raise
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="vsudoku web service")
+    parser.add_argument("-p", "--port", type=int, default=PORT)
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="worker processes (default : number of cores)")
+    parser.add_argument("-q", "--queue", type=int, default=QUEUE_SIZE,
+                        help="waiting requests beyond the running ones")
+    parser.add_argument("-m", "--model", default=MODEL)
+    parser.add_argument("-t", "--max-time", type=int, default=MAX_TIME,
+                        help="cap of the 'time' field (seconds)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    a = parser.parse_args()
+
+    try :
+        server = make_server(a.port, a.workers, a.queue, a.model, a.verbose,
+                             a.max_time)
+    except Exception as e :
+        print("[ERROR] server not started : %s: %s" % (type(e).__name__, e))
+        sys.exit(1)
+    print("[INFO] http://localhost:%d%s (%d workers, queue %d)" % (a.port,
+              PATH, server.queue.workers, server.queue.queue_size))
+    try :
+        server.serve_forever()
+    except KeyboardInterrupt :
+        pass
+    finally :
+        server.server_close()
+        server.pool.shutdown(cancel_futures=True)
+
+if __name__ == '__main__':
+    main()